@@ -64,7 +64,7 @@ import os
 
 from polar2grid.avhrr import readers
 from polar2grid.core import containers, roles
-from polar2grid.core.frontend_utils import ProductDict, GeoPairDict
+from polar2grid.core.frontend_utils import ProductDict, GeoPairDict, DAY_FRACTION_STRIDE
 
 LOG = logging.getLogger(__name__)
 
@@ -97,8 +97,9 @@ class Frontend(roles.FrontendRole):
     """
     FILE_EXTENSIONS = [".l1b"]
 
-    def __init__(self, day_fraction=0.10, sza_threshold=100, **kwargs):
+    def __init__(self, day_fraction=0.10, sza_threshold=100, geo_workers=1, **kwargs):
         super(Frontend, self).__init__(**kwargs)
+        self.geo_workers = geo_workers
         LOG.debug("Day fraction set to %f", day_fraction)
         self.day_fraction = day_fraction
         LOG.debug("SZA threshold set to %f", sza_threshold)
@@ -121,7 +122,7 @@ class Frontend(roles.FrontendRole):
         This method should not be called by the user.
         """
         for file_type, file_type_info in readers.FILE_TYPES.items():
-            self.file_readers[file_type] = readers.AVHRRMultiFileReader(file_type_info)
+            self.file_readers[file_type] = readers.AVHRRMultiFileReader(file_type_info, geo_workers=self.geo_workers)
 
         # Don't modify the passed list (we use in place operations)
         file_paths_left = []
@@ -252,7 +253,9 @@ class Frontend(roles.FrontendRole):
 
         return swath_definition
 
-    def create_raw_swath_object(self, product_name, swath_definition):
+    def _get_raw_product_source(self, product_name):
+        """Get the file type and file key for a raw product and check that its binary file can be written.
+        """
         product_def = PRODUCTS[product_name]
         try:
             file_type = product_def.get_file_type(self.available_file_types)
@@ -260,10 +263,8 @@ class Frontend(roles.FrontendRole):
         except RuntimeError:
             LOG.error("Could not create product '%s' because some data files are missing" % (product_name,))
             raise RuntimeError("Could not create product '%s' because some data files are missing" % (product_name,))
-        file_reader = self.file_readers[file_type]
         LOG.debug("Using file type '%s' and getting file key '%s' for product '%s'", file_type, file_key, product_name)
 
-        LOG.debug("Writing product '%s' data to binary file", product_name)
         filename = product_name + ".dat"
         if os.path.isfile(filename):
             if not self.overwrite_existing:
@@ -271,17 +272,54 @@ class Frontend(roles.FrontendRole):
                 raise RuntimeError("Binary file already exists: %s" % (filename,))
             else:
                 LOG.warning("Binary file already exists, will overwrite: %s", filename)
+        return file_type, file_key, filename
+
+    def create_raw_swath_object(self, product_name, swath_definition):
+        file_type, file_key, filename = self._get_raw_product_source(product_name)
+        file_reader = self.file_readers[file_type]
 
+        LOG.debug("Writing product '%s' data to binary file", product_name)
         try:
             data_type = file_reader.get_data_type(file_key)
-            fill_value = file_reader.get_fill_value(file_key)
             shape = file_reader.write_var_to_flat_binary(file_key, filename, dtype=data_type)
-            rows_per_scan = GEO_PAIRS[product_def.get_geo_pair_name(self.available_file_types)].rows_per_scan
         except (OSError, ValueError):
             LOG.error("Could not extract data from file")
             LOG.debug("Extraction exception: ", exc_info=True)
             raise
+        return self._raw_swath_product(product_name, swath_definition, file_reader, file_key, filename, shape)
 
+    def create_raw_swath_objects(self, product_names, swath_definitions):
+        """Create multiple raw products at once so each file is read once for all of them.
+
+        :param swath_definitions: swath definition for each product in `product_names`
+        :returns: dictionary of product name -> swath product
+        """
+        sources = [self._get_raw_product_source(product_name) for product_name in product_names]
+        swath_products = {}
+        for file_type in set(source[0] for source in sources):
+            file_reader = self.file_readers[file_type]
+            type_idxs = [idx for idx, source in enumerate(sources) if source[0] == file_type]
+            file_keys = [sources[idx][1] for idx in type_idxs]
+            filenames = [sources[idx][2] for idx in type_idxs]
+            LOG.debug("Writing products %r data to binary files", [product_names[idx] for idx in type_idxs])
+            try:
+                data_types = [file_reader.get_data_type(file_key) for file_key in file_keys]
+                shapes = file_reader.write_vars_to_flat_binary(file_keys, filenames, data_types)
+            except (OSError, ValueError):
+                LOG.error("Could not extract data from file")
+                LOG.debug("Extraction exception: ", exc_info=True)
+                raise
+
+            for idx, shape in zip(type_idxs, shapes):
+                swath_products[product_names[idx]] = self._raw_swath_product(
+                    product_names[idx], swath_definitions[idx], file_reader, sources[idx][1], sources[idx][2], shape)
+        return swath_products
+
+    def _raw_swath_product(self, product_name, swath_definition, file_reader, file_key, filename, shape):
+        product_def = PRODUCTS[product_name]
+        data_type = file_reader.get_data_type(file_key)
+        fill_value = file_reader.get_fill_value(file_key)
+        rows_per_scan = GEO_PAIRS[product_def.get_geo_pair_name(self.available_file_types)].rows_per_scan
         one_swath = containers.SwathProduct(
             product_name=product_name, description=product_def.description, units=product_def.units,
             satellite=file_reader.satellite, instrument=file_reader.instrument,
@@ -339,17 +377,18 @@ class Frontend(roles.FrontendRole):
 
         # Load geolocation files
         for geo_pair_name in geo_pairs_needed:
-            ### Lon Product ###
             lon_product_name = GEO_PAIRS[geo_pair_name].lon_product
-            LOG.info("Creating navigation product '%s'", lon_product_name)
-            lon_swath = products_created[lon_product_name] = self.create_raw_swath_object(lon_product_name, None)
+            lat_product_name = GEO_PAIRS[geo_pair_name].lat_product
+            LOG.info("Creating navigation products '%s' and '%s'", lon_product_name, lat_product_name)
+            products_created.update(self.create_raw_swath_objects([lon_product_name, lat_product_name], [None, None]))
+
+            ### Lon Product ###
+            lon_swath = products_created[lon_product_name]
             if lon_product_name in products:
                 scene[lon_product_name] = lon_swath
 
             ### Lat Product ###
-            lat_product_name = GEO_PAIRS[geo_pair_name].lat_product
-            LOG.info("Creating navigation product '%s'", lat_product_name)
-            lat_swath = products_created[lat_product_name] = self.create_raw_swath_object(lat_product_name, None)
+            lat_swath = products_created[lat_product_name]
             if lat_product_name in products:
                 scene[lat_product_name] = lat_swath
 
@@ -357,10 +396,23 @@ class Frontend(roles.FrontendRole):
             swath_def = self.create_swath_definition(lon_swath, lat_swath)
             swath_definitions[swath_def["swath_name"]] = swath_def
 
-        # Create each raw products (products that are loaded directly from the file)
+        # Create all raw products (products that are loaded directly from the file) with one pass over each file
+        raw_products_needed = [p for p in raw_products_needed if p not in products_created]
+        if raw_products_needed:
+            try:
+                LOG.info("Creating data products: %s", ", ".join(raw_products_needed))
+                swath_defs = [swath_definitions[PRODUCTS[p].get_geo_pair_name(self.available_file_types)]
+                              for p in raw_products_needed]
+                products_created.update(self.create_raw_swath_objects(raw_products_needed, swath_defs))
+            except (ValueError, OSError, RuntimeError):
+                LOG.warning("Could not create raw products together, creating them one at a time")
+                LOG.debug("Raw product exception: ", exc_info=True)
+
         for product_name in raw_products_needed:
             if product_name in products_created:
-                # already created
+                if product_name in products:
+                    # the user wants this product
+                    scene[product_name] = products_created[product_name]
                 continue
 
             try:
@@ -453,9 +505,10 @@ class Frontend(roles.FrontendRole):
         swath_name = refl_swath["swath_definition"]["swath_name"]
         if swath_name not in self._day_percentage:
             from pyorbital import astronomy
-            lons = refl_swath["swath_definition"].get_longitude_array()
-            lats = refl_swath["swath_definition"].get_latitude_array()
-            invalid_mask = refl_swath.get_data_mask()
+            # only every Nth row and column are needed to estimate the day fraction
+            lons = refl_swath["swath_definition"].get_longitude_array()[::DAY_FRACTION_STRIDE, ::DAY_FRACTION_STRIDE]
+            lats = refl_swath["swath_definition"].get_latitude_array()[::DAY_FRACTION_STRIDE, ::DAY_FRACTION_STRIDE]
+            invalid_mask = refl_swath.get_data_mask()[::DAY_FRACTION_STRIDE, ::DAY_FRACTION_STRIDE]
             sza_data = astronomy.sun_zenith_angle(refl_swath["begin_time"], lons, lats)
             valid_day_mask = (sza_data < self.sza_threshold) & ~invalid_mask
             fraction_day = numpy.count_nonzero(valid_day_mask) / (float(sza_data.size) - numpy.count_nonzero(invalid_mask))
@@ -491,6 +544,8 @@ def add_frontend_argument_groups(parser):
                        help="Angle threshold of solar zenith angle used when deciding day or night (default 100)")
     group.add_argument("--list-products", dest="list_products", action="store_true",
                         help="List available frontend products")
+    group.add_argument("--geo-workers", dest="geo_workers", type=int, default=1,
+                       help="Number of threads to use when interpolating the 40km navigation (default 1)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("-p", "--products", dest="products", nargs="*", default=None, action=ExtendAction,
@@ -44,17 +44,17 @@ https://github.com/mraspaud/mpop
 __docformat__ = "restructuredtext en"
 
 from datetime import datetime, timedelta
-from numpy import arccos, sign, rad2deg, sqrt, arcsin
 
 import logging
 import numpy
 import os
 from collections import namedtuple
-from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader
+from contextlib import ExitStack
+from polar2grid.core.fbf import FileAppender
+from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader, interpolate_cartesian_geolocation
 from scipy.interpolate import splrep, splev
 
 LOG = logging.getLogger(__name__)
-EARTH_RADIUS = 6370997.0
 
 FT_AAPP = "FT_AAPP"
 FT_NOAA = "FT_NOAA"
@@ -264,22 +264,17 @@ class AVHRRReader(object):
             return self._header[key]
 
 
-def _vis_calibrate(data_reader, chn, calib_type, pre_launch_coeffs=False):
-    """Visible channel calibration only.
-    *calib_type* = 0: Counts
-    *calib_type* = 1: Reflectances
-    *calib_type* = 2: Radiances
-    """
-    # Calibration count to albedo, the calibration is performed separately for
-    # two value ranges.
+# Number of scan lines calibrated at a time
+CALIBRATION_BLOCK_ROWS = 256
+IR_CONST_1 = 1.1910659e-5
+IR_CONST_2 = 1.438833
 
-    channel = data_reader["hrpt"][:, :, chn].astype(numpy.float)
-    if calib_type == 0:
-        return channel
 
-    if calib_type == 2:
-        LOG.warning("Radiances are not yet supported for the VIS/NIR channels!")
+def _vis_coefficients(data_reader, chn, pre_launch_coeffs=False):
+    """Per-scan line (intersection, slope1, intercept1, slope2, intercept2) for visible channel `chn`.
 
+    Each coefficient is a float32 (rows, 1) array so it can be broadcast against a block of counts.
+    """
     if pre_launch_coeffs:
         coeff_idx = 2
     else:
@@ -290,55 +285,31 @@ def _vis_calibrate(data_reader, chn, calib_type, pre_launch_coeffs=False):
         else:
             coeff_idx = 0
 
-    intersection = data_reader["calvis"][:, chn, coeff_idx, 4]
-    slope1 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 0] * 1e-10, 1)
-    intercept1 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 1] * 1e-7, 1)
-    slope2 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 2] * 1e-10, 1)
-    intercept2 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 3] * 1e-7, 1)
+    calvis = data_reader["calvis"][:, chn, coeff_idx, :]
+    intersection = calvis[:, 4]
+    slope1 = calvis[:, 0] * 1e-10
+    intercept1 = calvis[:, 1] * 1e-7
+    slope2 = calvis[:, 2] * 1e-10
+    intercept2 = calvis[:, 3] * 1e-7
 
     if chn == 2:
         slope2[slope2 < 0] += 0.4294967296
 
-    mask1 = channel <= numpy.expand_dims(intersection, 1)
-    mask2 = channel > numpy.expand_dims(intersection, 1)
+    return tuple(numpy.expand_dims(x, 1).astype(numpy.float32)
+                 for x in (intersection, slope1, intercept1, slope2, intercept2))
 
-    channel[mask1] = (channel * slope1 + intercept1)[mask1]
 
-    channel[mask2] = (channel * slope2 + intercept2)[mask2]
-
-    channel[channel < 0] = numpy.nan
-    return numpy.ma.masked_invalid(channel)
-
-
-def _ir_calibrate(data_reader, irchn, calib_type):
-    """IR calibration
-    *calib_type* = 0: Counts
-    *calib_type* = 1: BT
-    *calib_type* = 2: Radiances
+def _ir_coefficients(data_reader, irchn):
+    """Per-scan line (k1, k2, k3) radiance coefficients as float64 (rows, 1) arrays and the
+    (central wavenumber, band correction 2, band correction 3) constants for IR channel `irchn`.
     """
+    k1_ = data_reader['calir'][:, irchn, 0, 0] / 1.0e9
+    k2_ = data_reader['calir'][:, irchn, 0, 1] / 1.0e6
+    k3_ = data_reader['calir'][:, irchn, 0, 2] / 1.0e6
 
-    count = data_reader['hrpt'][:, :, irchn + 2].astype(numpy.float)
-
-    if calib_type == 0:
-        return count
-
-    k1_ = numpy.expand_dims(data_reader['calir'][:, irchn, 0, 0] / 1.0e9, 1)
-    k2_ = numpy.expand_dims(data_reader['calir'][:, irchn, 0, 1] / 1.0e6, 1)
-    k3_ = numpy.expand_dims(data_reader['calir'][:, irchn, 0, 2] / 1.0e6, 1)
-
-    # Count to radiance conversion:
-    rad = k1_ * count * count + k2_ * count + k3_
-
-    all_zero = numpy.logical_and(numpy.logical_and(numpy.equal(k1_, 0),
-                                             numpy.equal(k2_, 0)),
-                              numpy.equal(k3_, 0))
-    idx = numpy.indices((all_zero.shape[0],))
-    suspect_line_nums = numpy.repeat(idx[0], all_zero[:, 0])
+    suspect_line_nums = numpy.nonzero((k1_ == 0) & (k2_ == 0) & (k3_ == 0))[0]
     if suspect_line_nums.any():
-        LOG.debug("Suspicious scan lines: " + str(suspect_line_nums))
-
-    if calib_type == 2:
-        return rad
+        LOG.debug("Suspect scan lines: " + str(suspect_line_nums))
 
     # Central wavenumber:
     cwnum = data_reader['radtempcnv'][0, irchn, 0]
@@ -350,95 +321,145 @@ def _ir_calibrate(data_reader, irchn, calib_type):
     bandcor_2 = data_reader['radtempcnv'][0, irchn, 1] / 1e5
     bandcor_3 = data_reader['radtempcnv'][0, irchn, 2] / 1e6
 
-    # Count to radiance conversion:
-    rad = k1_ * count * count + k2_ * count + k3_
+    k_coeffs = tuple(numpy.expand_dims(x, 1) for x in (k1_, k2_, k3_))
+    return k_coeffs, (float(cwnum), float(bandcor_2), float(bandcor_3))
 
-    if calib_type == 2:
-        return rad
 
-    all_zero = numpy.logical_and(numpy.logical_and(numpy.equal(k1_, 0),
-                                             numpy.equal(k2_, 0)),
-                              numpy.equal(k3_, 0))
-    idx = numpy.indices((all_zero.shape[0],))
-    suspect_line_nums = numpy.repeat(idx[0], all_zero[:, 0])
-    if suspect_line_nums.any():
-        LOG.debug("Suspect scan lines: " + str(suspect_line_nums))
+def _get_coefficients(data_reader, calibrate_func, chn):
+    """Get the calibration coefficients for a channel, only computing them the first time for each file."""
+    key = (calibrate_func, chn)
+    if key not in data_reader.calibration_coefficients:
+        if calibrate_func is _vis_calibrate:
+            data_reader.calibration_coefficients[key] = _vis_coefficients(data_reader, chn)
+        else:
+            data_reader.calibration_coefficients[key] = _ir_coefficients(data_reader, chn)
+    return data_reader.calibration_coefficients[key]
 
-    ir_const_1 = 1.1910659e-5
-    ir_const_2 = 1.438833
 
-    t_planck = (ir_const_2 * cwnum) / \
-        numpy.log(1 + ir_const_1 * cwnum * cwnum * cwnum / rad)
+def _vis_calibrate_block(counts, out, coeffs):
+    intersection, slope1, intercept1, slope2, intercept2 = coeffs
+    # Calibration count to albedo, the calibration is performed separately for
+    # two value ranges.
+    low_mask = counts <= intersection
+    numpy.multiply(counts, slope2, out=out)
+    out += intercept2
+    low_data = counts * slope1
+    low_data += intercept1
+    numpy.copyto(out, low_data, where=low_mask)
+    out[out < 0] = numpy.nan
+
+
+def _ir_calibrate_block(counts, out, coeffs, calib_type):
+    (k1_, k2_, k3_), (cwnum, bandcor_2, bandcor_3) = coeffs
+    # Count to radiance conversion (float64 because the terms nearly cancel for band 3B):
+    rad = counts * k1_
+    rad += k2_
+    rad *= counts
+    rad += k3_
+    if calib_type == 2:
+        out[:] = rad
+        return
+
+    # t_planck = (ir_const_2 * cwnum) / log(1 + ir_const_1 * cwnum ** 3 / rad)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        numpy.divide(IR_CONST_1 * cwnum * cwnum * cwnum, rad, out=rad)
+        numpy.log1p(rad, out=rad)
+        numpy.divide(IR_CONST_2 * cwnum, rad, out=out)
 
     # Band corrections applied to t_planck to get correct
     # brightness temperature for channel:
     if bandcor_2 < 0:  # Post AAPP-v4
-        tb_ = bandcor_2 + bandcor_3 * t_planck
+        out *= numpy.float32(bandcor_3)
+        out += numpy.float32(bandcor_2)
     else:  # AAPP 1 to 4
-        tb_ = (t_planck - bandcor_2) / bandcor_3
+        out -= numpy.float32(bandcor_2)
+        out /= numpy.float32(bandcor_3)
 
-    #tb_[tb_ <= 0] = np.nan
     # Data with count=0 are often related to erroneous (bad) lines, but in case
     # of saturation (channel 3b) count=0 can be observed and associated to a
     # real measurement. So we leave out this filtering to the user!
-    # tb_[count == 0] = np.nan
-    #tb_[rad == 0] = np.nan
-    return numpy.ma.masked_array(tb_, numpy.isnan(tb_))
 
 
-def interpolate_1km_geolocation(lons_40km, lats_40km):
-    """Interpolate AVHRR 40km navigation to 1km.
+def calibrate_channels(data_reader, channels, outs=None, block_rows=CALIBRATION_BLOCK_ROWS):
+    """Calibrate multiple channels of one file in one pass over the scan lines.
 
-    This code was extracted from the python-geotiepoints package from the PyTroll group. To avoid adding another
-    dependency to this package this simple case from the geotiepoints was copied.
+    Counts for every channel are read `block_rows` scan lines at a time and each requested channel is calibrated
+    from the same block. Calculations are done in float32 except for IR radiances which need float64.
+
+    :param channels: sequence of (calibrate_func, channel index, calib_type) where `calibrate_func` is
+                     `_vis_calibrate` or `_ir_calibrate`
+    :param outs: float32 (scan lines, 2048) arrays to write each channel to (default: allocate new arrays)
+    :returns: list of the calibrated arrays
     """
-    cols40km = numpy.arange(24, 2048, 40)
-    cols1km = numpy.arange(2048)
-    lines = lons_40km.shape[0]
-    # row_indices = rows40km = numpy.arange(lines)
-    rows1km = numpy.arange(lines)
-
-    lons_rad = numpy.radians(lons_40km)
-    lats_rad = numpy.radians(lats_40km)
-    x__ = EARTH_RADIUS * numpy.cos(lats_rad) * numpy.cos(lons_rad)
-    y__ = EARTH_RADIUS * numpy.cos(lats_rad) * numpy.sin(lons_rad)
-    z__ = EARTH_RADIUS * numpy.sin(lats_rad)
-    along_track_order = 1
-    cross_track_order = 3
+    hrpt = data_reader["hrpt"]
+    if outs is None:
+        outs = [numpy.empty(hrpt.shape[:2], dtype=numpy.float32) for _ in channels]
+    coeffs = []
+    for calibrate_func, chn, calib_type in channels:
+        if calibrate_func is _vis_calibrate and calib_type == 2:
+            LOG.warning("Radiances are not yet supported for the VIS/NIR channels!")
+        coeffs.append(_get_coefficients(data_reader, calibrate_func, chn) if calib_type != 0 else None)
+
+    for start_idx in range(0, hrpt.shape[0], block_rows):
+        rows = slice(start_idx, start_idx + block_rows)
+        counts_block = hrpt[rows].astype(numpy.float32)
+        for (calibrate_func, chn, calib_type), chn_coeffs, out in zip(channels, coeffs, outs):
+            hrpt_idx = chn if calibrate_func is _vis_calibrate else chn + 2
+            counts = counts_block[:, :, hrpt_idx]
+            if calib_type == 0:
+                out[rows] = counts
+            elif calibrate_func is _vis_calibrate:
+                _vis_calibrate_block(counts, out[rows], tuple(c[rows] for c in chn_coeffs))
+            else:
+                k_coeffs = tuple(c[rows] for c in chn_coeffs[0])
+                _ir_calibrate_block(counts, out[rows], (k_coeffs, chn_coeffs[1]), calib_type)
+    return outs
+
+
+def _vis_calibrate(data_reader, chn, calib_type, out=None):
+    """Visible channel calibration only.
+    *calib_type* = 0: Counts
+    *calib_type* = 1: Reflectances
+    *calib_type* = 2: Radiances
+    """
+    return calibrate_channels(data_reader, [(_vis_calibrate, chn, calib_type)], outs=None if out is None else [out])[0]
+
+
+def _ir_calibrate(data_reader, irchn, calib_type, out=None):
+    """IR calibration
+    *calib_type* = 0: Counts
+    *calib_type* = 1: BT
+    *calib_type* = 2: Radiances
+    """
+    return calibrate_channels(data_reader, [(_ir_calibrate, irchn, calib_type)], outs=None if out is None else [out])[0]
+
+
+def _spline_weights(x, new_x, order):
+    """Get the weights to evaluate an interpolating spline through points at `x` at the `new_x` positions.
 
-    lines = len(rows1km)
-    newx = numpy.empty((len(rows1km), len(cols1km)), x__.dtype)
-    newy = numpy.empty((len(rows1km), len(cols1km)), y__.dtype)
-    newz = numpy.empty((len(rows1km), len(cols1km)), z__.dtype)
-    for cnt in range(lines):
-        tck = splrep(cols40km, x__[cnt, :], k=cross_track_order, s=0)
-        newx[cnt, :] = splev(cols1km, tck, der=0)
-        tck = splrep(cols40km, y__[cnt, :], k=cross_track_order, s=0)
-        newy[cnt, :] = splev(cols1km, tck, der=0)
-        tck = splrep(cols40km, z__[cnt, :], k=cross_track_order, s=0)
-        newz[cnt, :] = splev(cols1km, tck, der=0)
-
-    lons_1km = get_lons_from_cartesian(newx, newy)
-    lats_1km = get_lats_from_cartesian(newx, newy, newz)
-    return lons_1km, lats_1km
-
-
-def get_lons_from_cartesian(x__, y__):
-    """Get longitudes from cartesian coordinates.
+    An interpolating spline (no smoothing) is linear in the data being interpolated so the spline for any data is the
+    weighted sum of the splines through each of the unit vectors.
+
+    :returns: (len(new_x), len(x)) weights array
     """
-    return rad2deg(arccos(x__ / sqrt(x__ ** 2 + y__ ** 2))) * sign(y__)
+    return numpy.array([splev(new_x, splrep(x, unit_vector, k=order, s=0), der=0)
+                        for unit_vector in numpy.eye(len(x))]).T
+
 
+def interpolate_1km_geolocation(lons_40km, lats_40km, num_workers=1):
+    """Interpolate AVHRR 40km navigation to 1km.
 
-def get_lats_from_cartesian(x__, y__, z__, thr=0.8):
-    """Get latitudes from cartesian coordinates.
+    This code was extracted from the python-geotiepoints package from the PyTroll group. To avoid adding another
+    dependency to this package this simple case from the geotiepoints was copied. The same cubic spline is used for
+    every scan line so it is applied to all of them as one set of weights.
     """
-    # if we are at low latitudes - small z, then get the
-    # latitudes only from z. If we are at high latitudes (close to the poles)
-    # then derive the latitude using x and y:
-    lats = numpy.where((z__ < thr * EARTH_RADIUS) & (z__ > -thr * EARTH_RADIUS),
-                       90 - rad2deg(arccos(z__/EARTH_RADIUS)),
-                       sign(z__) * (90 - rad2deg(arcsin(sqrt(x__ ** 2 + y__ ** 2) / EARTH_RADIUS))))
-    return lats
+    cols40km = numpy.arange(24, 2048, 40)
+    cols1km = numpy.arange(2048)
+    cross_track_order = 3
+    col_weights = _spline_weights(cols40km, cols1km, cross_track_order)
+    # no interpolation along track
+    row_weights = numpy.ones((1, 1), dtype=numpy.float64)
+    return interpolate_cartesian_geolocation(lons_40km, lats_40km, row_weights, col_weights, num_workers=num_workers)
 
 
 def geolocation_calibration(data_reader, chn, calib_type):
@@ -454,7 +475,7 @@ def geolocation_calibration(data_reader, chn, calib_type):
     lons_40km = data_reader["pos"][:, :, 1] * 1e-4
     lats_40km = data_reader["pos"][:, :, 0] * 1e-4
     LOG.debug("Interpolating 40km navigation to 1km...")
-    lons_1km, lats_1km = interpolate_1km_geolocation(lons_40km, lats_40km)
+    lons_1km, lats_1km = interpolate_1km_geolocation(lons_40km, lats_40km, num_workers=data_reader.geo_workers)
 
     # save our results for when the other is requested (if lon-chn 0 now, then lat-chn 1 later)
     data_reader.lons_1km = lons_1km
@@ -521,6 +542,10 @@ class AVHRRSingleFileReader(BaseFileReader):
 
     def __init__(self, file_handle, file_type_info):
         super(AVHRRSingleFileReader, self).__init__(file_handle, file_type_info)
+        # (calibration function, channel) -> per-scan line calibration coefficients
+        self.calibration_coefficients = {}
+        # Number of threads used to interpolate the 40km navigation
+        self.geo_workers = 1
 
         try:
             yr = self.file_handle["startdatayr"][0]
@@ -563,10 +588,64 @@ class AVHRRSingleFileReader(BaseFileReader):
 
         return data
 
-    def get_swath_data(self, item):
-        return self[item]
+    def get_swath_data(self, item, out=None):
+        """Get the data for `item`, calibrated channels can be written directly to the float32 `out` array."""
+        known_item = self.file_type_info.get(item)
+        if out is not None and known_item.calibrate_func in (_vis_calibrate, _ir_calibrate):
+            return known_item.calibrate_func(self, known_item.index, known_item.calibrate_level, out=out)
+        data = self[item]
+        if out is not None:
+            out[:] = data
+            return out
+        return data
+
+    def get_swath_data_multiple(self, items):
+        """Get the data for multiple items, calibrating every requested channel in one pass over the file."""
+        results = [None] * len(items)
+        channel_idxs = [idx for idx, item in enumerate(items)
+                        if self.file_type_info[item].calibrate_func in (_vis_calibrate, _ir_calibrate)]
+        channels = [(self.file_type_info[items[idx]].calibrate_func, self.file_type_info[items[idx]].index,
+                     self.file_type_info[items[idx]].calibrate_level) for idx in channel_idxs]
+        for idx, data in zip(channel_idxs, calibrate_channels(self, channels)):
+            results[idx] = data
+        for idx, item in enumerate(items):
+            if results[idx] is None:
+                results[idx] = self.get_swath_data(item)
+        return results
 
 
 class AVHRRMultiFileReader(BaseMultiFileReader):
-    def __init__(self, file_type_info):
+    def __init__(self, file_type_info, geo_workers=1):
         super(AVHRRMultiFileReader, self).__init__(file_type_info, AVHRRSingleFileReader)
+        self.geo_workers = geo_workers
+
+    def add_file(self, fn):
+        super(AVHRRMultiFileReader, self).add_file(fn)
+        self.file_readers[-1].geo_workers = self.geo_workers
+
+    def write_vars_to_flat_binary(self, items, filenames, dtypes):
+        """Write multiple variables to their own concatenated flat binary files.
+
+        Each file is only read once for all of the calibrated channels requested.
+
+        :returns: list of shapes for each file written
+        """
+        if len(self) == 0:
+            LOG.error("Can't extract swath data, file reader is empty")
+            raise RuntimeError("Empty file reader")
+
+        LOG.debug("Writing binary data for %r to files %r", items, filenames)
+        try:
+            with ExitStack() as stack:
+                file_appenders = [FileAppender(stack.enter_context(open(filename, "w")), dtype)
+                                  for filename, dtype in zip(filenames, dtypes)]
+                for file_reader in self.file_readers:
+                    for file_appender, data in zip(file_appenders, file_reader.get_swath_data_multiple(items)):
+                        file_appender.append(data)
+        except (IOError, ValueError, TypeError):
+            for filename in filenames:
+                if os.path.isfile(filename):
+                    os.remove(filename)
+            raise
+
+        return [file_appender.shape for file_appender in file_appenders]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test the AVHRR AAPP file readers."""
+__docformat__ = "restructuredtext en"
+
+import os
+
+import numpy
+import pytest
+
+from polar2grid.avhrr import avhrr2swath, readers
+
+
+def _write_aapp_file(filename, num_lines=24, seed=0):
+    """Write a small AAPP l1b file with random counts and realistic calibration coefficients."""
+    rs = numpy.random.RandomState(seed)
+    header = numpy.zeros(1, dtype=readers._HEADERTYPE)
+    header["satid"] = 12
+    header["startdatayr"] = header["enddatayr"] = 2015
+    header["startdatady"] = header["enddatady"] = 32
+    header["startdatatime"] = 3600000
+    header["enddatatime"] = 3660000
+    # central wavenumber, band correction 2 and 3 (post AAPP-v4) for 3B, 4 and 5
+    header["radtempcnv"][0] = [[267000, -180000, 1001000], [927000, -40000, 1000500], [837000, -30000, 1000200]]
+
+    scans = numpy.zeros(num_lines, dtype=readers._SCANTYPE)
+    scans["hrpt"] = rs.randint(0, 1024, scans["hrpt"].shape)
+    for chn in range(3):
+        # slope1, intercept1, slope2, intercept2, intersection
+        scans["calvis"][:, chn, 0] = [5.4e8 + chn * 1e7, -2.2e7, 1.6e9, -1.1e9, 500 + chn]
+        scans["calvis"][:, chn, 2] = [5.6e8, -2.1e7, 1.7e9, -1.2e9, 501]
+    scans["calvis"][num_lines // 2:, 1, 0, 4] += 10
+    for irchn in range(3):
+        scans["calir"][:, irchn, 0] = [2.0e4 + irchn * 1e3, -1.7e5, 1.8e8 + irchn * 1e6]
+    scans["calir"][:, 1, 0, 2] += numpy.arange(num_lines) * 1000
+    lat, lon = numpy.meshgrid(numpy.linspace(40., 60., num_lines), numpy.linspace(170., 200., 51), indexing="ij")
+    lon[lon > 180.] -= 360.
+    scans["pos"][:, :, 0] = lat * 1e4
+    scans["pos"][:, :, 1] = lon * 1e4
+    scans["scnlinbit"] = numpy.arange(num_lines) % 2
+
+    with open(filename, "wb") as aapp_file:
+        aapp_file.write(header.tobytes())
+        aapp_file.write(b"\0" * (22016 - header.itemsize))
+        aapp_file.write(scans.tobytes())
+    return filename
+
+
+def _old_vis_calibrate(data_reader, chn):
+    """Reflectances calculated the way the reader did before channels were calibrated in blocks."""
+    channel = data_reader["hrpt"][:, :, chn].astype(numpy.float64)
+    coeff_idx = 2 if numpy.all(data_reader["calvis"][:, chn, 0, 4] == 0) else 0
+    intersection = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 4], 1)
+    slope1 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 0] * 1e-10, 1)
+    intercept1 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 1] * 1e-7, 1)
+    slope2 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 2] * 1e-10, 1)
+    intercept2 = numpy.expand_dims(data_reader["calvis"][:, chn, coeff_idx, 3] * 1e-7, 1)
+    if chn == 2:
+        slope2[slope2 < 0] += 0.4294967296
+    channel = numpy.where(channel <= intersection, channel * slope1 + intercept1, channel * slope2 + intercept2)
+    channel[channel < 0] = numpy.nan
+    return channel
+
+
+def _old_ir_calibrate(data_reader, irchn):
+    """Brightness temperatures calculated the way the reader did before channels were calibrated in blocks."""
+    count = data_reader["hrpt"][:, :, irchn + 2].astype(numpy.float64)
+    k1_ = numpy.expand_dims(data_reader["calir"][:, irchn, 0, 0] / 1.0e9, 1)
+    k2_ = numpy.expand_dims(data_reader["calir"][:, irchn, 0, 1] / 1.0e6, 1)
+    k3_ = numpy.expand_dims(data_reader["calir"][:, irchn, 0, 2] / 1.0e6, 1)
+    rad = k1_ * count * count + k2_ * count + k3_
+    cwnum = data_reader["radtempcnv"][0, irchn, 0] / (1.0e2 if irchn == 0 else 1.0e3)
+    bandcor_2 = data_reader["radtempcnv"][0, irchn, 1] / 1e5
+    bandcor_3 = data_reader["radtempcnv"][0, irchn, 2] / 1e6
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        t_planck = (1.438833 * cwnum) / numpy.log(1 + 1.1910659e-5 * cwnum * cwnum * cwnum / rad)
+    return bandcor_2 + bandcor_3 * t_planck
+
+
+@pytest.fixture
+def aapp_filename(tmpdir):
+    return _write_aapp_file(str(tmpdir.join("hrpt_metop02_20150201_0100_12345.l1b")))
+
+
+def test_geolocation_workers(aapp_filename, monkeypatch):
+    num_workers_used = []
+    interpolate_cartesian_geolocation = readers.interpolate_cartesian_geolocation
+
+    def _record_workers(lons, lats, row_weights, col_weights, num_workers=1):
+        num_workers_used.append(num_workers)
+        # small chunks so the thread pool is used
+        return interpolate_cartesian_geolocation(lons, lats, row_weights, col_weights, chunk_rows=5,
+                                                 num_workers=num_workers)
+    monkeypatch.setattr(readers, "interpolate_cartesian_geolocation", _record_workers)
+
+    results = []
+    for geo_workers in (1, 3):
+        file_reader = readers.AVHRRMultiFileReader(readers.FILE_TYPES[readers.FT_AAPP], geo_workers=geo_workers)
+        file_reader.add_file(readers.AVHRRReader(aapp_filename))
+        assert file_reader.file_readers[0].geo_workers == geo_workers
+        results.append([file_reader.get_swath_data(key) for key in (readers.K_LONGITUDE, readers.K_LATITUDE)])
+    assert num_workers_used == [1, 3]
+    assert results[0][0].shape == (24, 2048)
+    for serial, threaded in zip(*results):
+        numpy.testing.assert_array_equal(serial, threaded)
+
+
+def test_calibrate_channels(aapp_filename):
+    file_reader = readers.AVHRRSingleFileReader(readers.AVHRRReader(aapp_filename), readers.FILE_TYPES[readers.FT_AAPP])
+    channels = [(readers._vis_calibrate, chn, 1) for chn in range(3)] + \
+               [(readers._ir_calibrate, irchn, 1) for irchn in range(3)] + \
+               [(readers._vis_calibrate, 1, 0), (readers._ir_calibrate, 2, 2)]
+    # 24 scan lines in blocks of 7 so the last block is partial
+    batched = readers.calibrate_channels(file_reader, channels, block_rows=7)
+    band_keys = [readers.K_BAND1, readers.K_BAND2, readers.K_BAND3a, readers.K_BAND3b, readers.K_BAND4, readers.K_BAND5]
+    multiple = file_reader.get_swath_data_multiple(band_keys)
+    for (calibrate_func, chn, calib_type), batched_data in zip(channels, batched):
+        assert batched_data.dtype == numpy.float32
+        numpy.testing.assert_array_equal(batched_data, calibrate_func(file_reader, chn, calib_type))
+    for (calibrate_func, chn, _), batched_data, multiple_data in zip(channels, batched, multiple):
+        numpy.testing.assert_array_equal(batched_data, multiple_data)
+        old_func = _old_vis_calibrate if calibrate_func is readers._vis_calibrate else _old_ir_calibrate
+        numpy.testing.assert_allclose(batched_data, old_func(file_reader, chn), rtol=1e-5, atol=1e-4)
+    assert numpy.isnan(batched[0]).any() and not numpy.isnan(batched[0]).all()
+    numpy.testing.assert_array_equal(batched[6], file_reader["hrpt"][:, :, 1])
+
+
+def test_create_scene_product_fallback(aapp_filename, tmpdir, monkeypatch):
+    # numpy 2 no longer has the `issubclass_` used by the default fill value lookup
+    monkeypatch.setattr(readers.AVHRRMultiFileReader, "get_fill_value", lambda self, item: numpy.nan)
+    products = [avhrr2swath.PRODUCT_BAND4_BT, avhrr2swath.PRODUCT_BAND5_BT]
+
+    def _load_scene(work_dir):
+        monkeypatch.chdir(str(tmpdir.mkdir(work_dir)))
+        frontend = avhrr2swath.Frontend(search_paths=[aapp_filename])
+        scene = frontend.create_scene(products=products)
+        return {name: numpy.array(scene[name].get_data_array()) for name in scene}
+
+    together = _load_scene("together")
+
+    write_vars_to_flat_binary = readers.AVHRRMultiFileReader.write_vars_to_flat_binary
+    multi_calls = []
+
+    def _fail_for_bands(self, items, filenames, dtypes):
+        if readers.K_LONGITUDE not in items:
+            multi_calls.append(set(items))
+            raise ValueError("Simulated failure writing multiple products")
+        return write_vars_to_flat_binary(self, items, filenames, dtypes)
+    monkeypatch.setattr(readers.AVHRRMultiFileReader, "write_vars_to_flat_binary", _fail_for_bands)
+
+    one_at_a_time = _load_scene("one_at_a_time")
+    assert multi_calls == [{readers.K_BAND4, readers.K_BAND5}]
+    assert sorted(one_at_a_time) == sorted(together) == sorted(products)
+    for name in products:
+        assert os.path.isfile(name + ".dat")
+        assert one_at_a_time[name].shape == (24, 2048)
+        numpy.testing.assert_array_equal(one_at_a_time[name], together[name])
@@ -45,8 +45,130 @@ import numpy
 
 import os
 import logging
+from collections import deque, OrderedDict
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 
 LOG = logging.getLogger(__name__)
+# Every Nth row and column of the solar zenith angle is used to estimate how much of a swath is day
+DAY_FRACTION_STRIDE = 10
+# Maximum number of day fractions kept, least recently used are dropped first
+DAY_FRACTION_CACHE_SIZE = 64
+# (files, item, threshold, stride) -> day fraction, files are (filepath, mtime) so modified files are read again
+_DAY_FRACTION_CACHE = OrderedDict()
+
+
+def swath_intersects_ll_bbox(lon, lat, ll_bbox):
+    """Check if any part of a swath is inside a longitude/latitude bounding box.
+
+    The swath is treated as cells formed by neighboring longitude/latitude points so coarse (subsampled) geolocation
+    can be used without missing bounding boxes smaller than the distance between points. Cells are compared using their
+    longitude and latitude extents which may include some extra area, but never misses any. If `lon_min` is greater
+    than `lon_max` the bounding box is assumed to cross the anti-meridian.
+
+    :param lon: 2D longitude array in degrees
+    :param lat: 2D latitude array in degrees
+    :param ll_bbox: (lon_min, lat_min, lon_max, lat_max) in degrees
+    """
+    lon_min, lat_min, lon_max, lat_max = ll_bbox
+    valid = (lon >= -180) & (lon <= 180) & (lat >= -90) & (lat <= 90)
+    if lon.shape[0] < 2 or lon.shape[1] < 2:
+        cell_lons = cell_lats = cell_valid = None
+    else:
+        cell_lons = (lon[:-1, :-1], lon[:-1, 1:], lon[1:, :-1], lon[1:, 1:])
+        cell_lats = (lat[:-1, :-1], lat[:-1, 1:], lat[1:, :-1], lat[1:, 1:])
+        cell_valid = valid[:-1, :-1] & valid[:-1, 1:] & valid[1:, :-1] & valid[1:, 1:]
+    if cell_valid is None or not cell_valid.any():
+        # not enough neighboring points, check the individual points
+        cell_lons, cell_lats, cell_valid = (lon,), (lat,), valid
+
+    cell_lon_min = numpy.minimum.reduce(cell_lons)
+    cell_lon_max = numpy.maximum.reduce(cell_lons)
+    cell_lat_min = numpy.minimum.reduce(cell_lats)
+    cell_lat_max = numpy.maximum.reduce(cell_lats)
+    in_bbox = cell_valid & (cell_lat_max >= lat_min) & (cell_lat_min <= lat_max)
+    if lon_min <= lon_max:
+        in_bbox &= (cell_lon_max >= lon_min) & (cell_lon_min <= lon_max)
+    else:
+        in_bbox &= (cell_lon_max >= lon_min) | (cell_lon_min <= lon_max)
+    return bool(in_bbox.any())
+
+
+def linear_interpolation_weights(positions, num_points):
+    """Get the indexes and weights to linearly interpolate `num_points` points to fractional `positions`.
+
+    Positions outside of the points use the nearest point (like ``scipy.ndimage.map_coordinates(..., mode='nearest')``).
+
+    :returns: (indexes, weights) arrays of shape ``(len(positions), 2)``
+    """
+    positions = numpy.clip(numpy.asarray(positions, dtype=numpy.float64), 0, num_points - 1)
+    idx0 = numpy.minimum(numpy.floor(positions).astype(numpy.int64), max(num_points - 2, 0))
+    idx1 = numpy.minimum(idx0 + 1, num_points - 1)
+    frac = positions - idx0
+    return numpy.stack((idx0, idx1), axis=-1), numpy.stack((1 - frac, frac), axis=-1)
+
+
+def interpolate_cartesian_geolocation(lon_array, lat_array, row_weights, col_weights, col_indexes=None,
+                                      chunk_rows=200, num_workers=1):
+    """Interpolate longitude and latitude arrays made of blocks (ex. scans) that all use the same interpolation.
+
+    Longitude and latitude are converted to cartesian (X, Y, Z) coordinates first to avoid problems with the
+    anti-meridian and the poles. Every block of ``row_weights.shape[1]`` rows is interpolated to
+    ``row_weights.shape[0]`` rows by ``numpy.dot(row_weights, block)``. Columns are then interpolated with a
+    ``(out_cols, in_cols)`` `col_weights` matrix or, if `col_indexes` is provided, output column `i` is
+    ``sum(col_weights[i] * block[:, col_indexes[i]])``.
+
+    The work is done on chunks of about `chunk_rows` input rows at a time, in a thread pool if `num_workers` is more
+    than 1.
+
+    :returns: float32 longitude and latitude arrays
+    """
+    out_rows_per_block, in_rows_per_block = row_weights.shape
+    num_blocks = lon_array.shape[0] // in_rows_per_block
+    blocks_per_chunk = max(1, chunk_rows // in_rows_per_block)
+    out_shape = (num_blocks * out_rows_per_block, col_weights.shape[0])
+    new_lons = numpy.empty(out_shape, dtype=numpy.float32)
+    new_lats = numpy.empty(out_shape, dtype=numpy.float32)
+
+    def _interpolate_columns(data):
+        if col_indexes is None:
+            return numpy.dot(data, col_weights.T)
+        new_data = data[:, col_indexes[:, 0]] * col_weights[:, 0]
+        for idx in range(1, col_indexes.shape[1]):
+            new_data += data[:, col_indexes[:, idx]] * col_weights[:, idx]
+        return new_data
+
+    def _interpolate_chunk(first_block):
+        last_block = min(first_block + blocks_per_chunk, num_blocks)
+        lons_rad = numpy.radians(lon_array[first_block * in_rows_per_block:last_block * in_rows_per_block])
+        lats_rad = numpy.radians(lat_array[first_block * in_rows_per_block:last_block * in_rows_per_block])
+        cos_lats = numpy.cos(lats_rad)
+        new_xyz = []
+        for coord in (cos_lats * numpy.cos(lons_rad), cos_lats * numpy.sin(lons_rad), numpy.sin(lats_rad)):
+            coord = numpy.matmul(row_weights, coord.reshape((-1, in_rows_per_block, coord.shape[1])))
+            new_xyz.append(_interpolate_columns(coord.reshape((-1, coord.shape[2]))))
+        new_x, new_y, new_z = new_xyz
+
+        out_slice = slice(first_block * out_rows_per_block, last_block * out_rows_per_block)
+        numpy.degrees(numpy.arctan2(new_y, new_x), out=new_lons[out_slice])
+        # low latitudes are derived from Z, high latitudes (close to the poles) from X and Y
+        with numpy.errstate(invalid="ignore"):
+            new_lat = numpy.where(numpy.abs(new_z) < 0.8, numpy.arcsin(new_z),
+                                  numpy.sign(new_z) * numpy.arccos(numpy.hypot(new_x, new_y)))
+        numpy.degrees(new_lat, out=new_lats[out_slice])
+
+    chunk_starts = range(0, num_blocks, blocks_per_chunk)
+    if num_workers <= 1 or len(chunk_starts) <= 1:
+        for first_block in chunk_starts:
+            _interpolate_chunk(first_block)
+    else:
+        pool = ThreadPool(min(num_workers, len(chunk_starts)))
+        try:
+            pool.map(_interpolate_chunk, chunk_starts)
+        finally:
+            pool.close()
+            pool.join()
+    return new_lons, new_lats
 
 
 class ProductDefinition(object):
@@ -440,6 +562,26 @@ class BaseFileReader(object):
         """
         raise NotImplementedError("Frontend has not implemented this method yet")
 
+    def get_coarse_swath_data(self, item, stride=10):
+        """Get every `stride`-th row and column of `item` without any scaling or masking.
+
+        This is meant for quick checks of where a file's data is (ex. longitude and latitude). Only the sampled
+        elements should be read from the file.
+        """
+        return self[item][::stride, ::stride]
+
+    def get_coarse_day_counts(self, sza_item, sza_threshold, stride=DAY_FRACTION_STRIDE):
+        """Count the valid and day pixels in every `stride`-th row and column of the solar zenith angle `sza_item`.
+
+        Day pixels have a solar zenith angle below `sza_threshold`. The default implementation expects the file to
+        have angles in degrees where invalid values are outside of 0 to 180.
+
+        :returns: (number of valid pixels, number of day pixels)
+        """
+        sza_data = self.get_coarse_swath_data(sza_item, stride=stride)
+        valid_mask = (sza_data >= 0) & (sza_data <= 180)
+        return numpy.count_nonzero(valid_mask), numpy.count_nonzero(valid_mask & (sza_data < sza_threshold))
+
     def _compare(self, other, method):
         try:
             return method(self.begin_time, other.begin_time)
@@ -571,19 +713,128 @@ class BaseMultiFileReader(object):
     def get_swath_data(self, item):
         return numpy.concatenate([fr.get_swath_data(item) for fr in self.file_readers])
 
+    def files_in_ll_bbox(self, lon_item, lat_item, ll_bbox, stride=10):
+        """Check which files have geolocation data inside a longitude/latitude bounding box.
+
+        Only every `stride`-th row and column of the longitude and latitude variables are read.
+
+        :param ll_bbox: (lon_min, lat_min, lon_max, lat_max) in degrees
+        :returns: list of booleans, one for each file
+        """
+        return [swath_intersects_ll_bbox(fr.get_coarse_swath_data(lon_item, stride=stride),
+                                         fr.get_coarse_swath_data(lat_item, stride=stride), ll_bbox)
+                for fr in self.file_readers]
+
+    def get_day_fraction(self, sza_item, sza_threshold, stride=DAY_FRACTION_STRIDE):
+        """Estimate the fraction of valid pixels that are day (solar zenith angle below `sza_threshold`).
+
+        Only every `stride`-th row and column of the solar zenith angle are read. The result is cached for this set of
+        files so other readers and frontends using the same (unmodified) files don't read them again.
+        """
+        files_key = []
+        for fp in self.filepaths:
+            try:
+                files_key.append((fp, os.path.getmtime(fp)))
+            except (OSError, TypeError):
+                files_key.append((fp, None))
+        cache_key = (tuple(files_key), sza_item, sza_threshold, stride)
+        if cache_key not in _DAY_FRACTION_CACHE:
+            num_valid = 0
+            num_day = 0
+            for fr in self.file_readers:
+                file_valid, file_day = fr.get_coarse_day_counts(sza_item, sza_threshold, stride=stride)
+                num_valid += file_valid
+                num_day += file_day
+            day_fraction = num_day / float(num_valid) if num_valid else 0.
+            _DAY_FRACTION_CACHE[cache_key] = day_fraction
+            while len(_DAY_FRACTION_CACHE) > DAY_FRACTION_CACHE_SIZE:
+                _DAY_FRACTION_CACHE.popitem(last=False)
+        else:
+            LOG.debug("Using cached day fraction for '%s'", sza_item)
+            _DAY_FRACTION_CACHE.move_to_end(cache_key)
+            day_fraction = _DAY_FRACTION_CACHE[cache_key]
+        return day_fraction
+
+    def orbit_file_groups(self, threshold):
+        """Group the files (in sorted order) by orbit.
+
+        A new orbit is started when a file begins more than `threshold` (a `timedelta`) after the previous file ends.
+
+        :returns: list of lists of file indexes, one list for each orbit
+        """
+        groups = [[0]] if self.file_readers else []
+        for idx in range(1, len(self.file_readers)):
+            if self.file_readers[idx].begin_time - self.file_readers[idx - 1].end_time > threshold:
+                groups.append([])
+            groups[-1].append(idx)
+        return groups
+
+    def begin_times_in_ll_bbox(self, lon_item, lat_item, ll_bbox, stride=10):
+        """Get the begin times of the files that have geolocation data inside a longitude/latitude bounding box.
+
+        Begin times identify the same granule in other file types, see `subset_files_by_begin_time`.
+
+        :param ll_bbox: (lon_min, lat_min, lon_max, lat_max) in degrees
+        :returns: set of `datetime` objects
+        """
+        keep = self.files_in_ll_bbox(lon_item, lat_item, ll_bbox, stride=stride)
+        return set(fr.begin_time for fr, keep_file in zip(self.file_readers, keep) if keep_file)
+
+    def subset_files_by_begin_time(self, begin_times):
+        """Only use the files whose begin time is in `begin_times`.
+
+        Granules are matched by begin time rather than by position because file types don't always have the same
+        granules (ex. no MODIS HKM or QKM files at night).
+        """
+        self.file_readers = [fr for fr in self.file_readers if fr.begin_time in begin_times]
+
+    def subset_files(self, keep):
+        """Only use the files (in sorted order) where `keep` is True.
+        """
+        if len(keep) != len(self.file_readers):
+            LOG.error("Can't subset files, expected %d file flags, got %d", len(self.file_readers), len(keep))
+            raise ValueError("Can't subset files, expected %d file flags, got %d" % (len(self.file_readers), len(keep)))
+        self.file_readers = [fr for fr, keep_file in zip(self.file_readers, keep) if keep_file]
+
     def get_fill_value(self, item):
         return self.file_readers[0].get_fill_value(item)
 
     def get_data_type(self, item):
         return self.file_readers[0].get_data_type(item)
 
-    def write_var_to_flat_binary(self, item, filename, dtype=numpy.float32):
+    def _iter_swath_data(self, item, num_workers=1):
+        """Iterate over the swath data for `item` from each file, in file order.
+
+        If `num_workers` is greater than 1 then up to `num_workers` files are read in a thread pool ahead of the one
+        being handled by the caller.
+        """
+        if num_workers <= 1 or len(self.file_readers) <= 1:
+            for file_reader in self.file_readers:
+                yield file_reader.get_swath_data(item)
+            return
+
+        pool = ThreadPool(min(num_workers, len(self.file_readers)))
+        try:
+            remaining_readers = iter(self.file_readers)
+            pending = deque(pool.apply_async(fr.get_swath_data, (item,))
+                            for fr in islice(remaining_readers, num_workers))
+            while pending:
+                single_array = pending.popleft().get()
+                for file_reader in islice(remaining_readers, 1):
+                    pending.append(pool.apply_async(file_reader.get_swath_data, (item,)))
+                yield single_array
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def write_var_to_flat_binary(self, item, filename, dtype=numpy.float32, num_workers=1):
         """Write multiple variables to disk as one concatenated flat binary file.
 
         Data is written incrementally to reduce memory usage.
 
         :param item: Variable name to retrieve from these files
         :param filename: Filename to write to
+        :param num_workers: Number of threads reading files ahead of the one being written (default 1)
         """
         # sanity check
         if len(self) == 0:
@@ -594,8 +845,7 @@ class BaseMultiFileReader(object):
         try:
             with open(filename, "w") as file_obj:
                 file_appender = FileAppender(file_obj, dtype)
-                for file_reader in self.file_readers:
-                    single_array = file_reader.get_swath_data(item)
+                for single_array in self._iter_swath_data(item, num_workers=num_workers):
                     file_appender.append(single_array)
         except (IOError, ValueError, TypeError):
             if os.path.isfile(filename):
@@ -56,6 +56,13 @@ def histogram_equalization (data, mask_to_equalize,
 
     out = out if out is not None else data.copy()
     mask_to_use = mask_to_equalize if valid_data_mask is None else valid_data_mask
+
+    if clip_limit is None and slope_limit is None :
+        # the common case, use integer bins and a lookup table instead of numpy's histogram and interp
+        return _histogram_equalization_fast (data, mask_to_equalize, mask_to_use, out,
+                                             number_of_bins=number_of_bins,
+                                             std_mult_cutoff=std_mult_cutoff,
+                                             do_zerotoone_normalization=do_zerotoone_normalization)
     
     log.debug("    determining DNB data range for histogram equalization")
     avg = numpy.mean(data[mask_to_use])
@@ -75,6 +82,93 @@ def histogram_equalization (data, mask_to_equalize,
     
     return out
 
+def _histogram_equalization_fast (data, mask_to_equalize, mask_to_use, out,
+                                  number_of_bins=1000,
+                                  std_mult_cutoff=4.0,
+                                  do_zerotoone_normalization=True) :
+    """
+    Same result as `histogram_equalization` (without clip or slope limits), but faster for large arrays.
+
+    The valid data is pulled out of the data array once and reused for the statistics, the data is
+    quantized to integer bins so the histogram can be counted with `numpy.bincount`, and the cumulative
+    distribution function is applied as a lookup table instead of with `numpy.interp`.
+    """
+
+    log.debug("    determining DNB data range for histogram equalization")
+    valid_data = data[mask_to_use]
+    avg = valid_data.mean()
+    std = valid_data.std()
+    # limit our range to +/- std_mult_cutoff*std; e.g. the default std_mult_cutoff is 4.0 so about 99.8% of the data
+    valid_data = valid_data[(valid_data < (avg + std*std_mult_cutoff)) & (valid_data > (avg - std*std_mult_cutoff))]
+
+    log.debug("    running histogram equalization")
+    cumulative_dist_function, first_edge, bin_scale = _histogram_equalization_lut (valid_data, number_of_bins)
+    del valid_data
+
+    # if we were asked to, normalize our data to be between zero and one, rather than zero and number_of_bins
+    # (scaling the table is the same as scaling every equalized pixel)
+    if do_zerotoone_normalization :
+        cumulative_dist_function /= number_of_bins
+
+    out[mask_to_equalize] = _apply_cdf_lut (data[mask_to_equalize], cumulative_dist_function, first_edge, bin_scale)
+
+    return out
+
+def _histogram_equalization_lut (valid_data, number_of_bins) :
+    """
+    calculate the same cumulative distribution function as `_histogram_equalization_helper` (without clip or
+    slope limits), by quantizing the data to integer bins and counting them with `numpy.bincount`
+
+    returns the cumulative distribution function, the left edge of the first bin, and the number of bins per data unit
+    """
+
+    if valid_data.size == 0 :
+        # numpy's histogram uses a 0 to 1 range when there is no data
+        return numpy.zeros(number_of_bins, dtype=numpy.float64), 0.0, float(number_of_bins)
+
+    # same bin edges numpy's histogram would use
+    first_edge = float(valid_data.min())
+    last_edge = float(valid_data.max())
+    if first_edge == last_edge :
+        first_edge -= 0.5
+        last_edge += 0.5
+    bin_scale = number_of_bins / (last_edge - first_edge)
+
+    bin_indexes = valid_data - first_edge
+    bin_indexes *= bin_scale
+    bin_indexes = bin_indexes.astype(numpy.intp)
+    # the maximum value goes in the last bin, not a new one
+    numpy.clip(bin_indexes, 0, number_of_bins - 1, out=bin_indexes)
+
+    cumulative_dist_function = numpy.bincount(bin_indexes, minlength=number_of_bins).cumsum()
+    # now normalize the overall distribution function
+    cumulative_dist_function = (number_of_bins - 1) * cumulative_dist_function / float(cumulative_dist_function[-1])
+
+    return cumulative_dist_function, first_edge, bin_scale
+
+def _apply_cdf_lut (values, cumulative_dist_function, first_edge, bin_scale) :
+    """
+    equivalent to `numpy.interp(values, bin_edges[:-1], cumulative_dist_function)` for the evenly spaced
+    bins created by `_histogram_equalization_lut`, but uses the bin position of each value to index
+    the distribution function directly
+
+    returns the equalized values (`values` is used as scratch space if it is a floating point array)
+    """
+
+    # fractional bin position of every value, anything outside of the bins gets the first or last value
+    positions = values if values.dtype.kind == 'f' else values.astype(numpy.float64)
+    positions -= first_edge
+    positions *= bin_scale
+    numpy.clip(positions, 0, cumulative_dist_function.size - 1, out=positions)
+    bin_indexes = positions.astype(numpy.intp)
+    positions -= bin_indexes
+
+    # linearly interpolate between the two nearest bins
+    bin_slopes = numpy.append(numpy.diff(cumulative_dist_function), 0.0)
+    result = cumulative_dist_function.take(bin_indexes)
+    result += bin_slopes.take(bin_indexes) * positions
+    return result
+
 def local_histogram_equalization (data, mask_to_equalize, valid_data_mask=None, number_of_bins=1000,
                                   std_mult_cutoff=3.0,
                                   do_zerotoone_normalization=True,
@@ -83,7 +177,8 @@ def local_histogram_equalization (data, mask_to_equalize, valid_data_mask=None,
                                   slope_limit=3.0, #0.5,
                                   do_log_scale=True,
                                   log_offset=0.00001, # can't take the log of zero, so the offset may be needed; pass 0.0 if your data doesn't need it
-                                  out=None
+                                  out=None,
+                                  num_workers=1
                                   ) :
     """
     equalize the provided data (in the mask_to_equalize) using adaptive histogram equalization
@@ -93,6 +188,12 @@ def local_histogram_equalization (data, mask_to_equalize, valid_data_mask=None,
     
     if do_zerotoone_normalization is True the data will be scaled so that all data in the mask_to_equalize falls between 0 and 1; otherwise the data
     in mask_to_equalize will all fall between 0 and number_of_bins
+
+    the image is processed one row of tiles at a time; the histograms for every tile in a row are counted with a single
+    `numpy.bincount` and the tile contributions for every pixel in a row are interpolated together
+
+    if num_workers is more than 1 the rows of tiles are processed in that many threads; the rows are independent
+    and the numpy operations used release the GIL
     
     returns the equalized data
     """
@@ -106,142 +207,227 @@ def local_histogram_equalization (data, mask_to_equalize, valid_data_mask=None,
     total_rows = data.shape[0]
     total_cols = data.shape[1]
     tile_size = int((local_radius_px * 2.0) + 1.0)
-    row_tiles = int(total_rows / tile_size) if (total_rows % tile_size is 0) else int(total_rows / tile_size) + 1
-    col_tiles = int(total_cols / tile_size) if (total_cols % tile_size is 0) else int(total_cols / tile_size) + 1
-    
-    # an array of our distribution functions for equalization
-    all_cumulative_dist_functions = [ [ ] ]
-    # an array of our bin information for equalization
-    all_bin_information           = [ [ ] ]
-    
-    # loop through our tiles and create the histogram equalizations for each one
-    for num_row_tile in range(row_tiles) :
-        
-        # make sure we have enough rows available to store info on this next row of tiles
-        if len(all_cumulative_dist_functions) <= num_row_tile :
-            all_cumulative_dist_functions.append( [ ] )
-        if len(all_bin_information)           <= num_row_tile :
-            all_bin_information          .append( [ ] )
-        
-        # go through each tile in this row and calculate the equalization
-        for num_col_tile in range(col_tiles) :
-            
-            # calculate the range for this tile (min is inclusive, max is exclusive)
-            min_row = num_row_tile * tile_size
-            max_row = min_row + tile_size
-            min_col = num_col_tile * tile_size
-            max_col = min_col + tile_size
-            
-            # for speed of calculation, pull out the mask of pixels that should be used to calculate the histogram
-            mask_valid_data_in_tile  = valid_data_mask[min_row:max_row, min_col:max_col]
-            
-            # if we have any valid data in this tile, calculate a histogram equalization for this tile
-            # (note: even if this tile does no fall in the mask_to_equalize, it's histogram may be used by other tiles)
-            cumulative_dist_function, temp_bins = None, None
-            if mask_valid_data_in_tile.any():
-                
-                # use all valid data in the tile, so separate sections will blend cleanly
-                temp_valid_data = data[min_row:max_row, min_col:max_col][mask_valid_data_in_tile]
-                temp_valid_data = temp_valid_data[temp_valid_data >= 0] # TEMP, testing to see if negative data is messing everything up
-                # limit the contrast by only considering data within a certain range of the average
-                if std_mult_cutoff is not None :
-                    avg               = numpy.mean(temp_valid_data)
-                    std               = numpy.std (temp_valid_data)
-                    # limit our range to avg +/- std_mult_cutoff*std; e.g. the default std_mult_cutoff is 4.0 so about 99.8% of the data
-                    concervative_mask = (temp_valid_data < (avg + std*std_mult_cutoff)) & (temp_valid_data > (avg - std*std_mult_cutoff))
-                    temp_valid_data   = temp_valid_data[concervative_mask]
-                
-                # if we are taking the log of our data, do so now
-                if do_log_scale :
-                    temp_valid_data = numpy.log(temp_valid_data + log_offset)
-                
-                # do the histogram equalization and get the resulting distribution function and bin information
-                if temp_valid_data.size > 0 :
-                    cumulative_dist_function, temp_bins = _histogram_equalization_helper (temp_valid_data, number_of_bins, clip_limit=clip_limit, slope_limit=slope_limit)
-            
-            # hang on to our equalization related information for use later
-            all_cumulative_dist_functions[num_row_tile].append(cumulative_dist_function)
-            all_bin_information          [num_row_tile].append(temp_bins)
-    
-    # get the tile weight array so we can use it to interpolate our data
-    tile_weights = _calculate_weights(tile_size)
-    
-    # now loop through our tiles and linearly interpolate the equalized versions of the data
-    for num_row_tile in range(row_tiles) :
-        for num_col_tile in range(col_tiles) :
-            
-            # calculate the range for this tile (min is inclusive, max is exclusive)
-            min_row = num_row_tile * tile_size
-            max_row = min_row + tile_size
-            min_col = num_col_tile * tile_size
-            max_col = min_col + tile_size
-            
-            # for convenience, pull some of these tile sized chunks out
-            temp_all_data = data[min_row:max_row, min_col:max_col].copy()
-            temp_mask_to_equalize = mask_to_equalize[min_row:max_row, min_col:max_col]
-            temp_all_valid_data_mask = valid_data_mask[min_row:max_row, min_col:max_col]
-
-            # if we have any data in this tile, calculate our weighted sum
-            if temp_mask_to_equalize.any():
-                if do_log_scale:
-                    temp_all_data[temp_all_valid_data_mask] = numpy.log(temp_all_data[temp_all_valid_data_mask] + log_offset)
-                temp_data_to_equalize = temp_all_data[temp_mask_to_equalize]
-                temp_all_valid_data = temp_all_data[temp_all_valid_data_mask]
-
-                # a place to hold our weighted sum that represents the interpolated contributions
-                # of the histogram equalizations from the surrounding tiles
-                temp_sum = numpy.zeros_like(temp_data_to_equalize)
-
-                # how much weight were we unable to use because those tiles fell off the edge of the image?
-                unused_weight = numpy.zeros(temp_data_to_equalize.shape, dtype=tile_weights.dtype)
-
-                # loop through all the surrounding tiles and process their contributions to this tile
-                for weight_row in range(3):
-                    for weight_col in range(3):
-                        # figure out which adjacent tile we're processing (in overall tile coordinates instead of relative to our current tile)
-                        calculated_row = num_row_tile - 1 + weight_row
-                        calculated_col = num_col_tile - 1 + weight_col
-                        tmp_tile_weights = tile_weights[weight_row, weight_col][numpy.where(temp_mask_to_equalize)]
-                        
-                        # if we're inside the tile array and the tile we're processing has a histogram equalization for us to use, process it
-                        if ( (calculated_row >= 0) and (calculated_row < row_tiles) and
-                             (calculated_col >= 0) and (calculated_col < col_tiles) and
-                             (all_bin_information[calculated_row][calculated_col] is not None) and
-                             (all_cumulative_dist_functions[calculated_row][calculated_col] is not None)) :
-                            
-                            # equalize our current tile using the histogram equalization from the tile we're processing
-                            temp_equalized_data = numpy.interp(temp_all_valid_data,
-                                                               all_bin_information[calculated_row][calculated_col][:-1],
-                                                               all_cumulative_dist_functions[calculated_row][calculated_col])
-                            temp_equalized_data = temp_equalized_data[numpy.where(temp_mask_to_equalize[temp_all_valid_data_mask])]
-                            
-                            # add the contribution for the tile we're processing to our weighted sum
-                            temp_sum += (temp_equalized_data * tmp_tile_weights)
-                            
-                        else : # if the tile we're processing doesn't exist, hang onto the weight we would have used for it so we can correct that later
-                            unused_weight -= tmp_tile_weights
-
-                # if we have unused weights, scale our values to correct for that
-                if unused_weight.any():
-                    # TODO, if the mask masks everything out this will be a zero!
-                    temp_sum /= unused_weight + 1
-
-                # now that we've calculated the weighted sum for this tile, set it in our data array
-                out[min_row:max_row, min_col:max_col][temp_mask_to_equalize] = temp_sum
-                
-                """
-                # TEMP, test without using weights
-                data[min_row:max_row, min_col:max_col][temp_mask_to_equalize] = numpy.interp(temp_data_to_equalize,
-                                                                                             all_bin_information          [num_row_tile  ][num_col_tile][:-1],
-                                                                                             all_cumulative_dist_functions[num_row_tile  ][num_col_tile])
-                """
+    row_tiles = int(total_rows / tile_size) if (total_rows % tile_size == 0) else int(total_rows / tile_size) + 1
+    col_tiles = int(total_cols / tile_size) if (total_cols % tile_size == 0) else int(total_cols / tile_size) + 1
 
-    # if we were asked to, normalize our data to be between zero and one, rather than zero and number_of_bins
-    if do_zerotoone_normalization :
-        _linear_normalization_from_0to1 (out, mask_to_equalize, number_of_bins)
+    # our distribution functions and bin information for equalization, one per tile
+    all_cumulative_dist_functions = numpy.zeros((row_tiles, col_tiles, number_of_bins), dtype=numpy.float64)
+    all_first_edges = numpy.zeros((row_tiles, col_tiles), dtype=numpy.float64)
+    all_bin_scales = numpy.zeros((row_tiles, col_tiles), dtype=numpy.float64)
+    all_has_cdf = numpy.zeros((row_tiles, col_tiles), dtype=numpy.bool_)
+
+    # create the histogram equalizations for each tile, one row of tiles at a time
+    def _tile_row_cdfs (num_row_tile) :
+        min_row = num_row_tile * tile_size
+        max_row = min_row + tile_size
+        (all_cumulative_dist_functions[num_row_tile], all_first_edges[num_row_tile],
+         all_bin_scales[num_row_tile], all_has_cdf[num_row_tile]) = _calculate_tile_row_cdfs(
+            data[min_row:max_row], valid_data_mask[min_row:max_row], tile_size, col_tiles, number_of_bins,
+            std_mult_cutoff=std_mult_cutoff, clip_limit=clip_limit, slope_limit=slope_limit,
+            do_log_scale=do_log_scale, log_offset=log_offset)
+    _map_tile_rows(_tile_row_cdfs, row_tiles, num_workers)
+
+    # tiles without any data are never used, but give them harmless values so they can be looked up like any other tile
+    all_cumulative_dist_functions[~all_has_cdf] = 0
+    all_first_edges[~all_has_cdf] = 0
+    all_bin_scales[~all_has_cdf] = 0
+    # slope of each tile's distribution function from one bin to the next, for interpolating between bins
+    all_bin_slopes = numpy.zeros_like(all_cumulative_dist_functions)
+    numpy.subtract(all_cumulative_dist_functions[..., 1:], all_cumulative_dist_functions[..., :-1], out=all_bin_slopes[..., :-1])
+
+    # get the tile weights so we can use them to interpolate our data
+    tile_weights = _calculate_weights_1d(tile_size)
     
+    # now go through our rows of tiles and linearly interpolate the equalized versions of the data
+    # (every row of tiles writes to its own rows of the output)
+    def _tile_row_equalize (num_row_tile) :
+        min_row = num_row_tile * tile_size
+        max_row = min_row + tile_size
+        _equalize_tile_row(data[min_row:max_row], mask_to_equalize[min_row:max_row], out[min_row:max_row],
+                           num_row_tile, all_cumulative_dist_functions, all_bin_slopes, all_first_edges, all_bin_scales,
+                           all_has_cdf, tile_weights, tile_size, do_log_scale=do_log_scale, log_offset=log_offset,
+                           # if we were asked to, normalize our data to be between zero and one, rather than zero and number_of_bins
+                           normalization_factor=number_of_bins if do_zerotoone_normalization else None)
+    _map_tile_rows(_tile_row_equalize, row_tiles, num_workers)
+
     return out
 
+def _map_tile_rows (func, row_tiles, num_workers=1) :
+    """
+    call `func` for every row of tiles, in a pool of `num_workers` threads if more than 1
+    """
+
+    num_workers = min(num_workers or 1, row_tiles)
+    if num_workers <= 1 :
+        return [func(num_row_tile) for num_row_tile in range(row_tiles)]
+
+    from multiprocessing.pool import ThreadPool
+    log.debug("    processing %d rows of tiles with %d threads", row_tiles, num_workers)
+    with ThreadPool(num_workers) as pool :
+        return pool.map(func, range(row_tiles))
+
+def _calculate_tile_row_cdfs (data, valid_data_mask, tile_size, col_tiles, number_of_bins,
+                              std_mult_cutoff=3.0, clip_limit=None, slope_limit=None,
+                              do_log_scale=True, log_offset=0.00001) :
+    """
+    calculate the histogram equalization for every tile in one row of tiles
+
+    returns the cumulative distribution functions (col_tiles x number_of_bins), the left edge of the first bin
+    and the number of bins per data unit for each tile, and a mask of which tiles had any data to equalize
+    """
+
+    # NaN marks anything we shouldn't use in the histograms, including the padding past the last full tile
+    # (use all valid data in the tile, so separate sections will blend cleanly)
+    tile_data = numpy.empty((data.shape[0], col_tiles * tile_size), dtype=numpy.result_type(data.dtype, numpy.float32))
+    tile_data[:, data.shape[1]:] = numpy.nan
+    numpy.copyto(tile_data[:, :data.shape[1]], data)
+    tile_data[:, :data.shape[1]][~valid_data_mask] = numpy.nan
+    # view the data as (rows, tile, column in tile) so tile statistics are reductions over axes 0 and 2
+    tile_data = tile_data.reshape((data.shape[0], col_tiles, tile_size))
+
+    with numpy.errstate(invalid='ignore', divide='ignore') :
+        tile_data[tile_data < 0] = numpy.nan # TEMP, testing to see if negative data is messing everything up
+
+        # limit the contrast by only considering data within a certain range of the average
+        if std_mult_cutoff is not None :
+            tile_counts = (~numpy.isnan(tile_data)).sum(axis=(0, 2))
+            avg = numpy.nansum(tile_data, axis=(0, 2)) / tile_counts
+            std = numpy.sqrt(numpy.nansum((tile_data - avg[None, :, None]) ** 2, axis=(0, 2)) / tile_counts)
+            # limit our range to avg +/- std_mult_cutoff*std; e.g. the default std_mult_cutoff is 4.0 so about 99.8% of the data
+            concervative_mask = ((tile_data < (avg + std*std_mult_cutoff)[None, :, None]) &
+                                 (tile_data > (avg - std*std_mult_cutoff)[None, :, None]))
+            tile_data[~concervative_mask] = numpy.nan
+            del concervative_mask
+
+        # if we are taking the log of our data, do so now
+        if do_log_scale :
+            tile_data += log_offset
+            numpy.log(tile_data, out=tile_data)
+
+        # same bin edges numpy's histogram would use for each tile
+        first_edges = numpy.fmin.reduce(tile_data, axis=(0, 2))
+        last_edges = numpy.fmax.reduce(tile_data, axis=(0, 2))
+        same_edges = first_edges == last_edges
+        first_edges[same_edges] -= 0.5
+        last_edges[same_edges] += 0.5
+        bin_scales = number_of_bins / (last_edges - first_edges)
+
+    # bucket all the selected data in every tile at once, each tile gets its own range of bins
+    valid_mask = ~numpy.isnan(tile_data)
+    tile_ids = numpy.broadcast_to(numpy.arange(col_tiles)[None, :, None], tile_data.shape)[valid_mask]
+    bin_indexes = tile_data[valid_mask]
+    del tile_data, valid_mask
+    bin_indexes -= first_edges.take(tile_ids)
+    bin_indexes *= bin_scales.take(tile_ids)
+    bin_indexes = bin_indexes.astype(numpy.intp)
+    numpy.clip(bin_indexes, 0, number_of_bins - 1, out=bin_indexes)
+    bin_indexes += tile_ids * number_of_bins
+    temp_histograms = numpy.bincount(bin_indexes, minlength=col_tiles * number_of_bins).reshape((col_tiles, number_of_bins))
+    del tile_ids, bin_indexes
+
+    has_cdf = temp_histograms.sum(axis=1) > 0
+    cumulative_dist_functions = _clipped_cdf(temp_histograms, number_of_bins, clip_limit=clip_limit, slope_limit=slope_limit)
+    return cumulative_dist_functions, first_edges, bin_scales, has_cdf
+
+def _equalize_tile_row (data, mask_to_equalize, out, num_row_tile,
+                        all_cumulative_dist_functions, all_bin_slopes, all_first_edges, all_bin_scales, all_has_cdf,
+                        tile_weights, tile_size, do_log_scale=True, log_offset=0.00001, normalization_factor=None) :
+    """
+    equalize the pixels in one row of tiles using the weighted sum of the equalizations of the surrounding tiles
+
+    a pixel only gets weight from its own tile, the tile above or below it, the tile beside it, and the
+    diagonal between those two, so the 4 contributions are calculated for every pixel at once
+
+    the results are written to `out`, which should be the same rows of the full output array as `data`
+    """
+
+    # for speed of calculation, pull out only the pixels we need to equalize
+    pixel_rows, pixel_cols = numpy.nonzero(mask_to_equalize)
+    if pixel_rows.size == 0 :
+        return
+
+    temp_data_to_equalize = data[mask_to_equalize].astype(numpy.result_type(data.dtype, numpy.float32))
+    if do_log_scale :
+        with numpy.errstate(invalid='ignore', divide='ignore') :
+            temp_data_to_equalize += log_offset
+            numpy.log(temp_data_to_equalize, out=temp_data_to_equalize)
+
+    row_tiles, col_tiles = all_has_cdf.shape
+    # pad the tile mask so the tiles off the edge of the image can be looked up (they never have any data)
+    has_cdf = numpy.zeros((row_tiles + 2, col_tiles + 2), dtype=numpy.bool_)
+    has_cdf[1:-1, 1:-1] = all_has_cdf
+    has_cdf = has_cdf.ravel()
+
+    # which tile each pixel is in and which tiles (before or after) are beside it
+    center_index = int(tile_size / 2)
+    pixel_tile_cols = pixel_cols // tile_size
+    pixel_cols_in_tile = pixel_cols - pixel_tile_cols * tile_size
+    row_sides = numpy.where(pixel_rows < center_index, -1, 1)
+    col_sides = numpy.where(pixel_cols_in_tile < center_index, -1, 1)
+    # only one of the before or after weights is non-zero for any position in a tile
+    side_weights = tile_weights[0] + tile_weights[2]
+    row_weights = (tile_weights[1].take(pixel_rows), side_weights.take(pixel_rows))
+    col_weights = (tile_weights[1].take(pixel_cols_in_tile), side_weights.take(pixel_cols_in_tile))
+
+    # a place to hold our weighted sum that represents the interpolated contributions
+    # of the histogram equalizations from the surrounding tiles
+    temp_sum = numpy.zeros(temp_data_to_equalize.shape, dtype=numpy.float64)
+
+    # how much weight were we unable to use because those tiles fell off the edge of the image?
+    unused_weight = numpy.zeros(temp_data_to_equalize.shape, dtype=numpy.float64)
+
+    # process the contributions of this tile, the vertical and horizontal neighbors, and the diagonal neighbor
+    for use_row_side in (False, True) :
+        calculated_rows = num_row_tile + row_sides if use_row_side else numpy.full(pixel_rows.shape, num_row_tile)
+        for use_col_side in (False, True) :
+            calculated_cols = pixel_tile_cols + col_sides if use_col_side else pixel_tile_cols
+            pixel_weights = row_weights[use_row_side] * col_weights[use_col_side]
+
+            # if the tile we're processing doesn't exist, hang onto the weight we would have used for it so we can correct that later
+            tile_exists = has_cdf.take((calculated_rows + 1) * (col_tiles + 2) + calculated_cols + 1)
+            unused_weight += numpy.where(tile_exists, 0, pixel_weights)
+
+            # add the contribution for the tile we're processing to our weighted sum
+            pixel_weights[~tile_exists] = 0
+            tile_ids = numpy.clip(calculated_rows, 0, row_tiles - 1) * col_tiles + numpy.clip(calculated_cols, 0, col_tiles - 1)
+            temp_sum += pixel_weights * _apply_tile_cdf_luts(temp_data_to_equalize, tile_ids,
+                                                             all_cumulative_dist_functions, all_bin_slopes,
+                                                             all_first_edges, all_bin_scales)
+
+    # if we have unused weights, scale our values to correct for that
+    # TODO, if the mask masks everything out this will be a zero!
+    with numpy.errstate(invalid='ignore', divide='ignore') :
+        temp_sum /= 1.0 - unused_weight
+    if normalization_factor is not None :
+        temp_sum /= normalization_factor
+
+    # now that we've calculated the weighted sum for this row of tiles, set it in our data array
+    out[mask_to_equalize] = temp_sum
+
+def _apply_tile_cdf_luts (values, tile_ids, all_cumulative_dist_functions, all_bin_slopes, all_first_edges, all_bin_scales) :
+    """
+    same as `_apply_cdf_lut`, but every value is equalized with the distribution function of its own tile
+
+    `tile_ids` are flat indexes in to the first two dimensions of the tile arrays
+    """
+
+    number_of_bins = all_cumulative_dist_functions.shape[-1]
+    positions = values - all_first_edges.take(tile_ids)
+    positions *= all_bin_scales.take(tile_ids)
+    # values that couldn't be log scaled stay invalid
+    nan_mask = numpy.isnan(positions)
+    positions[nan_mask] = 0
+    numpy.clip(positions, 0, number_of_bins - 1, out=positions)
+    bin_indexes = positions.astype(numpy.intp)
+    positions -= bin_indexes
+    bin_indexes += tile_ids * number_of_bins
+
+    # linearly interpolate between the two nearest bins of each tile
+    result = all_cumulative_dist_functions.take(bin_indexes)
+    result += all_bin_slopes.take(bin_indexes) * positions
+    result[nan_mask] = numpy.nan
+    return result
+
 def _histogram_equalization_helper (valid_data, number_of_bins, clip_limit=None, slope_limit=None) :
     """
     calculate the simplest possible histogram equalization, using only valid data
@@ -251,46 +437,79 @@ def _histogram_equalization_helper (valid_data, number_of_bins, clip_limit=None,
     
     # bucket all the selected data using numpy's histogram function
     temp_histogram, temp_bins = numpy.histogram(valid_data, number_of_bins)
+    cumulative_dist_function = _clipped_cdf(temp_histogram, number_of_bins, clip_limit=clip_limit, slope_limit=slope_limit)
+    
+    # return what someone else will need in order to apply the equalization later
+    return cumulative_dist_function, temp_bins
+
+def _clipped_cdf (temp_histogram, number_of_bins, clip_limit=None, slope_limit=None) :
+    """
+    calculate the normalized cumulative distribution function from one histogram or a 2D array of histograms
+    (one per row), applying the clip and slope limits if provided
+
+    returns the cumulative distribution function(s)
+    """
+
+    one_histogram = temp_histogram.ndim == 1
+    temp_histogram = numpy.atleast_2d(temp_histogram)
+    # number of pixels that went in to each histogram
+    valid_data_size = temp_histogram.sum(axis=1)
     
     # if we have a clip limit and we should do our clipping before building the cumulative distribution function, clip off our histogram
     if (clip_limit is not None) :
         
-        # clip our histogram and remember how much we removed
-        pixels_to_clip_at            = int(clip_limit * (valid_data.size / float(number_of_bins)))
+        # clip our histogram
+        pixels_to_clip_at            = (clip_limit * (valid_data_size / float(number_of_bins))).astype(temp_histogram.dtype)
         mask_to_clip                 = temp_histogram > clip_limit
-        num_bins_clipped             = sum(mask_to_clip)
-        num_pixels_clipped           = sum(temp_histogram[mask_to_clip]) - (num_bins_clipped * pixels_to_clip_at)
-        temp_histogram[mask_to_clip] = pixels_to_clip_at
+        temp_histogram               = numpy.where(mask_to_clip, pixels_to_clip_at[:, None], temp_histogram)
     
     # calculate the cumulative distribution function
-    cumulative_dist_function  = temp_histogram.cumsum()
+    cumulative_dist_function  = temp_histogram.cumsum(axis=1)
     
     # if we have a clip limit and we should do our clipping after building the cumulative distribution function, clip off our cdf
     if (slope_limit is not None) :
         
-        # clip our cdf and remember how much we removed
-        pixel_height_limit       = int(slope_limit * (valid_data.size / float(number_of_bins)))
-        cumulative_excess_height = 0
-        num_clipped_pixels       = 0
-        weight_metric            = numpy.zeros(cumulative_dist_function.shape, dtype=float)
-        
-        for pixel_index in range(1, cumulative_dist_function.size) :
-            
-            current_pixel_count = cumulative_dist_function[pixel_index]
-            
-            diff_from_acceptable      = (current_pixel_count - cumulative_dist_function[pixel_index-1] -
-                                              pixel_height_limit - cumulative_excess_height)
-            if diff_from_acceptable < 0:
-                weight_metric[pixel_index] = abs(diff_from_acceptable)
-            cumulative_excess_height += max( diff_from_acceptable, 0)
-            cumulative_dist_function[pixel_index] = current_pixel_count - cumulative_excess_height
-            num_clipped_pixels = num_clipped_pixels + cumulative_excess_height
+        # clip our cdf: any bin taller than the height limit is cut down to the limit, and everything after it in
+        # the cdf is shifted down by the total amount removed so far
+        pixel_height_limit       = (slope_limit * (valid_data_size / float(number_of_bins))).astype(temp_histogram.dtype)
+        excess_height            = numpy.maximum(temp_histogram[:, 1:] - pixel_height_limit[:, None], 0)
+        cumulative_dist_function[:, 1:] -= excess_height.cumsum(axis=1)
     
     # now normalize the overall distribution function
-    cumulative_dist_function  = (number_of_bins - 1) * cumulative_dist_function / cumulative_dist_function[-1]
+    with numpy.errstate(invalid='ignore', divide='ignore') :
+        cumulative_dist_function  = (number_of_bins - 1) * cumulative_dist_function / cumulative_dist_function[:, -1:]
     
-    # return what someone else will need in order to apply the equalization later
-    return cumulative_dist_function, temp_bins
+    return cumulative_dist_function[0] if one_histogram else cumulative_dist_function
+
+def _calculate_weights_1d (tile_size) :
+    """
+    calculate the weights that will be used to quickly bilinearly-interpolate the histogram equalizations
+    tile size should be the width and height of a tile in pixels
+
+    returns a (3, tile_size) weight array, where the first dimension is the tile before, the current tile,
+    and the tile after the pixel; the bilinear weight of a pixel is the product of its row and column weights
+    """
+
+    weights = numpy.zeros((3, tile_size), dtype=numpy.float64)
+
+    # for ease of calculation, figure out the index of the center pixel in a tile
+    # and how far each pixel is from the center of the tile (in pixel units)
+    center_index = int(tile_size / 2)
+    center_dist  =     tile_size / 2.0
+    positions = numpy.arange(tile_size)
+    dist = numpy.abs(center_dist - positions)
+
+    # pixels before the center use the tile before, the rest use the tile after
+    # (note: these calculations aren't quite right if center_index equals the position)
+    before_center = positions < center_index
+    weights[1] = (tile_size - dist) / tile_size
+    weights[0][before_center] = dist[before_center] / tile_size
+    weights[2][~before_center] = dist[~before_center] / tile_size
+
+    # all of the weight for the center pixel comes from its own tile
+    weights[:, center_index] = (0.0, 1.0, 0.0)
+
+    return weights
 
 def _calculate_weights (tile_size) :
     """
@@ -300,90 +519,10 @@ def _calculate_weights (tile_size) :
     returns a 4D weight array, where the first 2 dimensions correspond to the grid of where the tiles are
     relative to the tile being interpolated
     """
-    
+
     # we are essentially making a set of weight masks for an ideal center tile that has all 8 surrounding tiles available
-    
-    # create our empty template tiles
-    template_tile = numpy.zeros((3, 3, tile_size, tile_size), dtype=numpy.float32)
-    
-    """
-    # TEMP FOR TESTING, create a weight tile that does no interpolation
-    template_tile[1,1] = template_tile[1,1] + 1.0
-    """
-    
-    # for ease of calculation, figure out the index of the center pixel in a tile
-    # and how far that pixel is from the edge of the tile (in pixel units)
-    center_index = int(tile_size / 2)
-    center_dist  =     tile_size / 2.0
-    
-    # loop through each pixel in the tile and calculate the 9 weights for that pixel
-    # were weights for a pixel are 0.0 they are not set (since the template_tile
-    # starts out as all zeros)
-    for row in range(tile_size) :
-        for col in range(tile_size) :
-            
-            vertical_dist   = abs(center_dist - row) # the distance from our pixel to the center of our tile, vertically
-            horizontal_dist = abs(center_dist - col) # the distance from our pixel to the center of our tile, horizontally
-            
-            # pre-calculate which 3 adjacent tiles will affect our tile
-            # (note: these calculations aren't quite right if center_index equals the row or col)
-            horizontal_index = 0 if col < center_index else 2
-            vertical_index   = 0 if row < center_index else 2
-            
-            # if this is the center pixel, we only need to use it's own tile for it
-            if (row is center_index) and (col is center_index) :
-                
-                # all of the weight for this pixel comes from it's own tile
-                template_tile[1,1][row, col] = 1.0
-                
-            # if this pixel is in the center row, but is not the center pixel
-            # we're going to need to linearly interpolate it's tile and the
-            # tile that is horizontally nearest to it
-            elif (row is     center_index)    and (col is not center_index) :
-                
-                # linear interp horizontally
-                
-                beside_weight = horizontal_dist / tile_size               # the weight from the adjacent tile
-                local_weight  = (tile_size - horizontal_dist) / tile_size # the weight from this tile
-                
-                # set the weights for the two relevant tiles
-                template_tile[1, 1]               [row, col] = local_weight
-                template_tile[1, horizontal_index][row, col] = beside_weight
-                
-            # if this pixel is in the center column, but is not the center pixel
-            # we're going to need to linearly interpolate it's tile and the
-            # tile that is vertically nearest to it
-            elif (row is not center_index)    and (col is     center_index) :
-                
-                # linear interp vertical
-                
-                beside_weight = vertical_dist / tile_size               # the weight from the adjacent tile
-                local_weight  = (tile_size - vertical_dist) / tile_size # the weight from this tile
-                
-                # set the weights for the two relevant tiles
-                template_tile[1,              1][row, col]   = local_weight
-                template_tile[vertical_index, 1][row, col]   = beside_weight
-                
-            # if the pixel is in one of the four quadrants that are above or below the center
-            # row and column, we need to bilinearly interpolate it between the nearest four tiles
-            else:
-                
-                # bilinear interpolation
-                
-                local_weight      = ((tile_size - vertical_dist) / tile_size) * ((tile_size - horizontal_dist) / tile_size) # the weight from this tile
-                vertical_weight   = ((            vertical_dist) / tile_size) * ((tile_size - horizontal_dist) / tile_size) # the weight from the vertically   adjacent tile
-                horizontal_weight = ((tile_size - vertical_dist) / tile_size) * ((            horizontal_dist) / tile_size) # the weight from the horizontally adjacent tile
-                diagonal_weight   = ((            vertical_dist) / tile_size) * ((            horizontal_dist) / tile_size) # the weight from the diagonally   adjacent tile
-                
-                # set the weights for the four relevant tiles
-                template_tile[1,              1,                row, col] = local_weight
-                template_tile[vertical_index, 1,                row, col] = vertical_weight
-                template_tile[1,              horizontal_index, row, col] = horizontal_weight
-                template_tile[vertical_index, horizontal_index, row, col] = diagonal_weight
-    
-    
-    # return the weights for an ideal center tile
-    return template_tile
+    weights = _calculate_weights_1d(tile_size)
+    return (weights[:, None, :, None] * weights[None, :, None, :]).astype(numpy.float32)
 
 def _linear_normalization_from_0to1 (data, mask, theoretical_max, theoretical_min=0, message="    normalizing equalized data to fit in 0 to 1 range") :
                                                                                             #"    normalizing DNB data into 0 to 1 range") :
@@ -393,7 +532,7 @@ def _linear_normalization_from_0to1 (data, mask, theoretical_max, theoretical_mi
     """
     
     log.debug(message)
-    if (theoretical_min is not 0) :
+    if (theoretical_min != 0) :
         data[mask]      = data[mask]      - theoretical_min
         theoretical_max = theoretical_max - theoretical_min
     data[mask] = data[mask] / theoretical_max
@@ -183,6 +183,10 @@ class INIConfigReader(SimpleINIConfigReader):
         self.section_prefix = kwargs.pop("section_prefix", None)
         self.empty_ok = kwargs.pop("empty_ok", False)
         self.config = []
+        # combined regex of every section pattern and per-process lookup caches (see `load_config`)
+        self._config_regex = None
+        self._section_cache = {}
+        self._options_cache = {}
 
         # defaults to string (meaning nothing happens)
         # this only affects non-ID fields
@@ -234,6 +238,38 @@ class INIConfigReader(SimpleINIConfigReader):
         # If 2 or more entries have the same number of wildcards they may not be sorted optimally
         # (i.e. specific first field highest)
         self.config.sort(key=lambda x: (x[0], next(re.finditer(r'[^\^:.*].*', x[2].pattern)).start(), x[3]))
+        self._compile_config_regex()
+
+    def _compile_config_regex(self):
+        """Combine all section patterns in to one regular expression and reset the lookup caches.
+
+        Each section's pattern becomes one named alternative, in sorted order, so the first alternative to match
+        is the same section a linear search through `self.config` would have found.
+        """
+        self._section_cache = {}
+        self._options_cache = {}
+        alternatives = ["(?P<_s%d>%s)" % (idx, config_key[2].pattern) for idx, config_key in enumerate(self.config)]
+        try:
+            self._config_regex = re.compile("|".join(alternatives)) if alternatives else None
+        except re.error:
+            # section patterns with their own group references can't be combined, search them one by one
+            LOG.debug("Could not combine configuration regular expressions, will match sections individually")
+            self._config_regex = None
+
+    def _match_config_section(self, id_key):
+        if self._config_regex is not None:
+            m = self._config_regex.match(id_key)
+            if m is None:
+                return None
+            config_key = self.config[int(m.lastgroup[2:])]
+            LOG.debug("Key '%s' matched config regular expression '%s'", id_key, config_key[2].pattern)
+            return config_key[3]
+
+        for num_wildcards, first_valid_idx, regex_obj, section in self.config:
+            if regex_obj.match(id_key):
+                LOG.debug("Key '%s' matched config regular expression '%s'", id_key, regex_obj.pattern)
+                return section
+        return None
 
     def get_config_section(self, **kwargs):
         if len(kwargs) != len(self.id_fields):
@@ -242,29 +278,33 @@ class INIConfigReader(SimpleINIConfigReader):
             raise ValueError("Incorrect number of identifying arguments, expected %d, got %d" % (len(self.id_fields), len(kwargs)))
 
         id_key = self.sep_char.join(str(kwargs.get(k, None)) for k in self.id_fields)
-        for num_wildcards, first_valid_idx, regex_obj, section in self.config:
-            if regex_obj.match(id_key):
-                LOG.debug("Key '%s' matched config regular expression '%s'", id_key, regex_obj.pattern)
-                return section
-        LOG.debug("No match found in config for key: %s", id_key)
-        return None
+        try:
+            return self._section_cache[id_key]
+        except KeyError:
+            pass
+
+        section = self._match_config_section(id_key)
+        if section is None:
+            LOG.debug("No match found in config for key: %s", id_key)
+        self._section_cache[id_key] = section
+        return section
+
+    def _parse_section_options(self, section):
+        """Read and convert the options for `section` (`None` for the defaults), cached after the first call.
+        """
+        try:
+            return self._options_cache[section]
+        except KeyError:
+            pass
 
-    def get_config_options(self, **kwargs):
-        allow_default = kwargs.pop("allow_default", True)
-        section = self.get_config_section(**kwargs)
         if section is not None:
-            LOG.debug("Using configuration section: %s", section)
             section_options = dict((k, self.config_parser.get(section, k)) for k in self.config_parser.options(section))
             # gotta get the defaults too
             for k, v in self.config_parser.defaults().items():
                 if k not in section_options:
                     section_options[k] = v
-        elif allow_default:
-            LOG.debug("Using default configuration section")
-            section_options = self.config_parser.defaults().copy()
         else:
-            LOG.error("No configuration section found")
-            raise RuntimeError("No configuration section found")
+            section_options = self.config_parser.defaults().copy()
 
         # Convert values
         for k, v in section_options.items():
@@ -278,6 +318,22 @@ class INIConfigReader(SimpleINIConfigReader):
                 section_options[k] = v == "True"
                 continue
 
+        self._options_cache[section] = section_options
+        return section_options
+
+    def get_config_options(self, **kwargs):
+        allow_default = kwargs.pop("allow_default", True)
+        section = self.get_config_section(**kwargs)
+        if section is not None:
+            LOG.debug("Using configuration section: %s", section)
+        elif allow_default:
+            LOG.debug("Using default configuration section")
+        else:
+            LOG.error("No configuration section found")
+            raise RuntimeError("No configuration section found")
+        # callers are free to modify what we give them, don't let that leak in to the cache
+        section_options = self._parse_section_options(section).copy()
+
         for k, v in kwargs.items():
             # overwrite any wildcards with what we were provided
             section_options[k] = v
@@ -490,10 +546,12 @@ class BackendRole(object):
     """
     __metaclass__ = ABCMeta
 
-    def __init__(self, overwrite_existing=False, keep_intermediate=False, exit_on_error=True, **kwargs):
+    def __init__(self, overwrite_existing=False, keep_intermediate=False, exit_on_error=True, writer_workers=1,
+                 **kwargs):
         self.overwrite_existing = overwrite_existing
         self.keep_intermediate = keep_intermediate
         self.exit_on_error = exit_on_error
+        self.writer_workers = writer_workers or 1
 
     @property
     @abstractmethod
@@ -740,10 +798,15 @@ class BackendRole(object):
         """Create output files for each product in the scene.
 
         Default implementation is to call `create_output_from_product` for each product in the provided `gridded_scene`.
+        If the backend was created with more than one `writer_workers` the products are written in parallel threads.
+        Rescaling and most file encoding libraries release the GIL so this helps when output is the bottleneck.
 
         :param gridded_scene: `GriddedScene` object to create output from
-        :returns: list of created output files
+        :returns: list of created output files (in the same order as the scene's products)
         """
+        if self.writer_workers > 1 and len(gridded_scene) > 1:
+            return self._create_output_from_scene_parallel(gridded_scene, **kwargs)
+
         output_filenames = []
         for product_name, gridded_product in gridded_scene.items():
             try:
@@ -757,6 +820,27 @@ class BackendRole(object):
                 continue
         return output_filenames
 
+    def _create_output_from_scene_parallel(self, gridded_scene, **kwargs):
+        from multiprocessing.pool import ThreadPool
+        num_workers = min(self.writer_workers, len(gridded_scene))
+        LOG.debug("Creating output for %d products with %d writer threads", len(gridded_scene), num_workers)
+        output_filenames = []
+        # exiting the context terminates the pool so queued products aren't written after an error
+        with ThreadPool(num_workers) as pool:
+            # each product gets its own copy of the keyword arguments in case the backend modifies them
+            results = [(product_name, pool.apply_async(self.create_output_from_product, (gridded_product,), dict(kwargs)))
+                       for product_name, gridded_product in gridded_scene.items()]
+            for product_name, result in results:
+                try:
+                    output_filenames.append(result.get())
+                except (ValueError, KeyError, RuntimeError):
+                    LOG.error("Could not create output for '%s'", product_name)
+                    if self.exit_on_error:
+                        raise
+                    LOG.debug("Backend exception: ", exc_info=True)
+                    continue
+        return output_filenames
+
     @abstractmethod
     def create_output_from_product(self, gridded_product, **kwargs):
         """Create output file for the provided product.
@@ -823,6 +907,14 @@ class FrontendRole(object):
         """
         pass
 
+    def orbit_search_paths(self):
+        """Split the input in to one list of search paths for each orbit.
+
+        Each list can be given to a new Frontend as `search_paths` to process that orbit as an independent scene.
+        Frontends that can't tell orbits apart return all of their search paths as one orbit.
+        """
+        return [self.search_paths]
+
     def find_files_with_extensions(self, extensions=None, search_paths=None, warn_invalid=True):
         """Generator that uses `self.search_paths` to yield any file with extensions from `FILE_EXTENSIONS`.
 
@@ -112,6 +112,285 @@ this,is,item,*,id,id,stuffwild,stuffwild
         pass
 
 
+class _TestINIConfigReader(roles.INIConfigReader):
+    id_fields = ("product_name", "satellite", "instrument")
+
+
+class TestINIConfig(unittest.TestCase):
+    string_1 = """[test:wild_product]
+product_name=
+satellite=npp
+instrument=viirs
+value=1
+
+[test:specific_product]
+product_name=i04
+satellite=npp
+instrument=viirs
+value=2
+
+[test:regex_product]
+product_name=m1[0-6]
+satellite=npp
+instrument=
+value=3
+"""
+    def _get_reader(self):
+        return _TestINIConfigReader(StringIO(self.string_1), section_prefix="test:", int_kwargs=("value",))
+
+    def test_basic_1(self):
+        """Test that the most specific section is matched first.
+        """
+        reader = self._get_reader()
+        self.assertEqual(reader.get_config_section(product_name="i04", satellite="npp", instrument="viirs"),
+                         "test:specific_product")
+        self.assertEqual(reader.get_config_section(product_name="i05", satellite="npp", instrument="viirs"),
+                         "test:wild_product")
+        self.assertEqual(reader.get_config_section(product_name="m15", satellite="npp", instrument="viirs"),
+                         "test:regex_product")
+        self.assertIsNone(reader.get_config_section(product_name="m15", satellite="aqua", instrument="modis"))
+
+    def test_combined_matches_linear(self):
+        """Test that the combined regular expression finds the same section as a linear search.
+        """
+        reader = self._get_reader()
+        for product_name in ("i04", "i05", "m10", "m16", "m17", "dnb"):
+            for satellite in ("npp", "aqua"):
+                id_key = ":".join((product_name, satellite, "viirs"))
+                expected = None
+                for _, _, regex_obj, section in reader.config:
+                    if regex_obj.match(id_key):
+                        expected = section
+                        break
+                self.assertEqual(reader.get_config_section(product_name=product_name, satellite=satellite,
+                                                           instrument="viirs"), expected)
+
+    def test_cached_options(self):
+        """Test that modifying returned options does not change later lookups.
+        """
+        reader = self._get_reader()
+        options = reader.get_config_options(product_name="i04", satellite="npp", instrument="viirs")
+        self.assertEqual(options["value"], 2)
+        options["value"] = 10
+        options = reader.get_config_options(product_name="i04", satellite="npp", instrument="viirs")
+        self.assertEqual(options["value"], 2)
+        self.assertRaises(RuntimeError, reader.get_config_options,
+                          product_name="m15", satellite="aqua", instrument="modis", allow_default=False)
+
+
+class _TestBackend(roles.BackendRole):
+    @property
+    def known_grids(self):
+        return None
+
+    def create_output_from_product(self, gridded_product, **kwargs):
+        if gridded_product["product_name"] == "bad":
+            raise ValueError("Bad product")
+        return gridded_product["product_name"] + ".out"
+
+
+class TestBackendRole(unittest.TestCase):
+    def _get_scene(self, *product_names):
+        from collections import OrderedDict
+        return OrderedDict((p, {"product_name": p}) for p in product_names)
+
+    def test_parallel_order(self):
+        """Test that parallel writers return output filenames in product order.
+        """
+        scene = self._get_scene(*["p%02d" % idx for idx in range(20)])
+        serial = _TestBackend().create_output_from_scene(scene)
+        parallel = _TestBackend(writer_workers=4).create_output_from_scene(scene)
+        self.assertEqual(serial, parallel)
+
+    def test_parallel_errors(self):
+        """Test that parallel writers honor `exit_on_error`.
+        """
+        scene = self._get_scene("p1", "bad", "p2")
+        backend = _TestBackend(writer_workers=2, exit_on_error=True)
+        self.assertRaises(ValueError, backend.create_output_from_scene, scene)
+        backend = _TestBackend(writer_workers=2, exit_on_error=False)
+        self.assertEqual(backend.create_output_from_scene(scene), ["p1.out", "p2.out"])
+
+
+class _TestFileReader(object):
+    def __init__(self, file_handle, file_type_info):
+        self.file_handle = file_handle
+
+    @property
+    def begin_time(self):
+        from datetime import datetime, timedelta
+        return datetime(2015, 1, 1) + timedelta(minutes=self.file_handle)
+
+    @property
+    def end_time(self):
+        from datetime import timedelta
+        return self.begin_time + timedelta(minutes=1)
+
+    def get_swath_data(self, item):
+        import time
+        import numpy
+        # make the later files finish first
+        time.sleep(0.01 * (5 - self.file_handle))
+        return numpy.zeros((2, 3), dtype=numpy.float64) + self.file_handle
+
+
+class TestBaseMultiFileReader(unittest.TestCase):
+    def setUp(self):
+        from polar2grid.core import frontend_utils
+        frontend_utils._DAY_FRACTION_CACHE.clear()
+
+    def tearDown(self):
+        from polar2grid.core import frontend_utils
+        frontend_utils._DAY_FRACTION_CACHE.clear()
+
+    def test_parallel_flat_binary(self):
+        """Test that reading files in parallel writes them in file order.
+        """
+        import os
+        import numpy
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from polar2grid.core.frontend_utils import BaseMultiFileReader
+        file_reader = BaseMultiFileReader({}, _TestFileReader)
+        file_reader.add_files(range(6))
+        tmp_dir = mkdtemp()
+        try:
+            for num_workers in (1, 3):
+                fn = os.path.join(tmp_dir, "test_%d.dat" % (num_workers,))
+                shape = file_reader.write_var_to_flat_binary("test", fn, num_workers=num_workers)
+                self.assertEqual(shape, (12, 3))
+                data = numpy.fromfile(fn, dtype=numpy.float32).reshape(shape)
+                numpy.testing.assert_array_equal(data[:, 0], numpy.repeat(numpy.arange(6), 2))
+        finally:
+            rmtree(tmp_dir)
+
+    def test_subset_files(self):
+        from polar2grid.core.frontend_utils import BaseMultiFileReader
+        file_reader = BaseMultiFileReader({}, _TestFileReader)
+        file_reader.add_files(range(4))
+        file_reader.subset_files([True, False, False, True])
+        self.assertEqual([fr.file_handle for fr in file_reader.file_readers], [0, 3])
+        self.assertRaises(ValueError, file_reader.subset_files, [True])
+
+    def test_subset_files_by_begin_time(self):
+        from polar2grid.core.frontend_utils import BaseMultiFileReader
+        geo_reader = BaseMultiFileReader({}, _TestFileReader)
+        geo_reader.add_files(range(4))
+        # a file type that is missing some of the granules (ex. MODIS HKM at night)
+        band_reader = BaseMultiFileReader({}, _TestFileReader)
+        band_reader.add_files([1, 3])
+        keep_times = set(fr.begin_time for fr in geo_reader.file_readers if fr.file_handle in (0, 3))
+        geo_reader.subset_files_by_begin_time(keep_times)
+        band_reader.subset_files_by_begin_time(keep_times)
+        self.assertEqual([fr.file_handle for fr in geo_reader.file_readers], [0, 3])
+        self.assertEqual([fr.file_handle for fr in band_reader.file_readers], [3])
+
+    def test_orbit_file_groups(self):
+        from datetime import timedelta
+        from polar2grid.core.frontend_utils import BaseMultiFileReader
+        file_reader = BaseMultiFileReader({}, _TestFileReader)
+        file_reader.add_files([0, 1, 2, 100, 101])
+        self.assertEqual(file_reader.orbit_file_groups(timedelta(seconds=10)), [[0, 1, 2], [3, 4]])
+        self.assertEqual(file_reader.orbit_file_groups(timedelta(hours=2)), [[0, 1, 2, 3, 4]])
+
+    def test_day_fraction(self):
+        import numpy
+        from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader
+
+        class _SZAHandle(dict):
+            def __init__(self, filepath, sza):
+                super(_SZAHandle, self).__init__(sza=sza)
+                self.filepath = self.filename = filepath
+
+        sza = numpy.full((20, 20), 120., dtype=numpy.float32)
+        sza[:, :10] = 30.
+        sza[:5] = -999.
+        file_reader = BaseMultiFileReader({}, BaseFileReader)
+        file_reader.add_files([_SZAHandle("day_fraction_1.h5", sza), _SZAHandle("day_fraction_2.h5", sza[::-1])])
+        self.assertAlmostEqual(file_reader.get_day_fraction("sza", 100, stride=2), 0.5)
+        self.assertAlmostEqual(file_reader.get_day_fraction("sza", 130, stride=2), 1.0)
+        # cached for the same files
+        file_reader.file_readers[0].file_handle["sza"] = sza + 100
+        self.assertAlmostEqual(file_reader.get_day_fraction("sza", 100, stride=2), 0.5)
+
+    def test_day_fraction_cache(self):
+        import os
+        import numpy
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from polar2grid.core import frontend_utils
+        from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader
+
+        class _SZAHandle(dict):
+            def __init__(self, filepath, sza):
+                super(_SZAHandle, self).__init__(sza=sza)
+                self.filepath = self.filename = filepath
+
+        sza = numpy.full((20, 20), 120., dtype=numpy.float32)
+        sza[:, :10] = 30.
+        tmp_dir = mkdtemp()
+        try:
+            fn = os.path.join(tmp_dir, "day_fraction.h5")
+            open(fn, "w").close()
+            os.utime(fn, (1000000000, 1000000000))
+            file_reader = BaseMultiFileReader({}, BaseFileReader)
+            file_reader.add_files([_SZAHandle(fn, sza)])
+            self.assertAlmostEqual(file_reader.get_day_fraction("sza", 100, stride=2), 0.5)
+            # modified files are read again
+            file_reader.file_readers[0].file_handle["sza"] = sza - 100
+            self.assertAlmostEqual(file_reader.get_day_fraction("sza", 100, stride=2), 0.5)
+            os.utime(fn, (1000000100, 1000000100))
+            self.assertAlmostEqual(file_reader.get_day_fraction("sza", 100, stride=2), 1.0)
+        finally:
+            rmtree(tmp_dir)
+
+        # least recently used day fractions are dropped
+        for thresholds in (range(frontend_utils.DAY_FRACTION_CACHE_SIZE + 5), (0, 1)):
+            for sza_threshold in thresholds:
+                file_reader.get_day_fraction("sza", sza_threshold, stride=2)
+        self.assertEqual(len(frontend_utils._DAY_FRACTION_CACHE), frontend_utils.DAY_FRACTION_CACHE_SIZE)
+        self.assertEqual([key[2] for key in frontend_utils._DAY_FRACTION_CACHE][-2:], [0, 1])
+        self.assertNotIn(2, [key[2] for key in frontend_utils._DAY_FRACTION_CACHE])
+
+    def test_interpolate_cartesian_geolocation(self):
+        import numpy
+        from polar2grid.core.frontend_utils import linear_interpolation_weights, interpolate_cartesian_geolocation
+        indexes, weights = linear_interpolation_weights([-0.5, 0., 0.25, 2.5], 3)
+        numpy.testing.assert_array_equal(indexes, [[0, 1], [0, 1], [0, 1], [1, 2]])
+        numpy.testing.assert_allclose(weights, [[1., 0.], [1., 0.], [0.75, 0.25], [0., 1.]])
+
+        lon, lat = numpy.meshgrid(numpy.linspace(170., 190., 8), numpy.linspace(10., 20., 6))
+        lon[lon > 180.] -= 360.
+        # double the rows of every block of 2 rows and the number of columns
+        row_weights = numpy.array([[1., 0.], [0.5, 0.5], [0., 1.], [-0.5, 1.5]])
+        col_indexes, col_weights = linear_interpolation_weights(numpy.arange(16) * 0.5, 8)
+        new_lon, new_lat = interpolate_cartesian_geolocation(lon, lat, row_weights, col_weights,
+                                                             col_indexes=col_indexes, chunk_rows=2)
+        self.assertEqual(new_lon.shape, (12, 16))
+        self.assertEqual(new_lon.dtype, numpy.float32)
+        numpy.testing.assert_allclose(new_lon[::4, ::2], lon[::2], atol=1e-4)
+        numpy.testing.assert_allclose(new_lat[::4, ::2], lat[::2], atol=1e-4)
+        # crossing the anti-meridian doesn't average to 0
+        self.assertTrue(numpy.all(numpy.abs(new_lon) > 169.))
+        threaded = interpolate_cartesian_geolocation(lon, lat, row_weights, col_weights, col_indexes=col_indexes,
+                                                     chunk_rows=2, num_workers=3)
+        numpy.testing.assert_array_equal(threaded[0], new_lon)
+        numpy.testing.assert_array_equal(threaded[1], new_lat)
+
+    def test_swath_intersects_ll_bbox(self):
+        import numpy
+        from polar2grid.core.frontend_utils import swath_intersects_ll_bbox
+        lon, lat = numpy.meshgrid(numpy.arange(-100., -80., 5.), numpy.arange(30., 50., 5.))
+        # smaller than the distance between points
+        self.assertTrue(swath_intersects_ll_bbox(lon, lat, (-92., 41., -91., 42.)))
+        self.assertFalse(swath_intersects_ll_bbox(lon, lat, (0., 0., 10., 10.)))
+        # crosses the anti-meridian
+        self.assertTrue(swath_intersects_ll_bbox(lon, lat, (170., 30., -95., 40.)))
+        self.assertFalse(swath_intersects_ll_bbox(lon, lat, (170., 30., -120., 40.)))
+        # invalid geolocation
+        self.assertFalse(swath_intersects_ll_bbox(numpy.zeros_like(lon) - 999., lat, (-180., -90., 180., 90.)))
+
+
 def main():
     return unittest.main()
 
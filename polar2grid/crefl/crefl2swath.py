@@ -63,12 +63,13 @@ single band images since AWIPS does not support 3-dimensional arrays. These
 defaults can all be turned off with the ``--no-compositors`` flag.
 
 The CREFL reader accepts output from MODIS and VIIRS corrected reflectance
-processing. If provided with L1B or SDR files it will attempt to call the proper
-programs to convert the files. The required commands that must be available
-are:
+processing. If provided with VIIRS SDR files the corrected reflectances are
+computed in memory. If provided with MODIS L1B files (or VIIRS SDR files and
+the ``--cviirs`` flag) it will attempt to call the proper programs to convert
+the files. The required commands that must be available are:
 
- - h5SDS_transfer_rename
- - cviirs (for VIIRS corrected reflectance)
+ - h5SDS_transfer_rename (for ``--cviirs``)
+ - cviirs (for ``--cviirs``)
  - crefl (for MODIS corrected reflectance)
 
 The CREFL software also requires ancillary data in the form of ``tbase.hdf``
@@ -157,6 +158,9 @@ from datetime import datetime, timedelta
 import logging
 import numpy
 import os
+import shutil
+from contextlib import ExitStack
+from tempfile import mkdtemp
 
 import polar2grid.modis.modis_guidebook as modis_guidebook
 import polar2grid.modis.modis_to_swath as modis_module
@@ -164,6 +168,7 @@ import polar2grid.viirs.guidebook as viirs_guidebook
 import polar2grid.viirs.io as viirs_io
 import polar2grid.viirs.swath as viirs_module
 from polar2grid.core import containers, roles
+from polar2grid.core.fbf import FileAppender
 from polar2grid.core.frontend_utils import ProductDict, GeoPairDict
 
 LOG = logging.getLogger(__name__)
@@ -284,6 +289,60 @@ class MultiFileReader(modis_guidebook.MultiFileReader):
     def __init__(self, file_type_info, single_class=MODISFileReader):
         super(MultiFileReader, self).__init__(file_type_info, single_class)
 
+
+class FlatBinaryReader(object):
+    """Stand-in for a CREFL `MultiFileReader` holding corrected reflectances already written to flat binary files.
+
+    Requested items are moved out of the work directory instead of copied. Any files left in the work directory are
+    removed (unless `keep_intermediate` is set) when the reader is garbage collected, along with the work directory
+    once it is empty.
+    """
+    def __init__(self, source_reader, work_dir, filenames, shapes, filepaths, keep_intermediate=False):
+        self.satellite = source_reader.satellite
+        self.instrument = source_reader.instrument
+        self.begin_time = source_reader.begin_time
+        self.end_time = source_reader.end_time
+        self.filepaths = filepaths
+        self.work_dir = work_dir
+        self.filenames = filenames
+        self.shapes = shapes
+        self.keep_intermediate = keep_intermediate
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __del__(self):
+        if self.keep_intermediate:
+            return
+        for filename in self.filenames.values():
+            if os.path.dirname(filename) == self.work_dir and os.path.isfile(filename):
+                LOG.debug("Removing unused CREFL data file: %s", filename)
+                os.remove(filename)
+        try:
+            os.rmdir(self.work_dir)
+        except OSError:
+            # still used by another reader or already removed
+            pass
+
+    def get_data_type(self, item):
+        return numpy.float32
+
+    def get_fill_value(self, item):
+        return numpy.nan
+
+    def write_var_to_flat_binary(self, item, filename, dtype=numpy.float32):
+        LOG.debug("Writing binary data for '%s' to file '%s'", item, filename)
+        if numpy.dtype(dtype) != numpy.float32:
+            data = numpy.memmap(self.filenames[item], dtype=numpy.float32, mode="r", shape=self.shapes[item])
+            data.astype(dtype).tofile(filename)
+        elif os.path.dirname(self.filenames[item]) == self.work_dir:
+            shutil.move(self.filenames[item], filename)
+            self.filenames[item] = filename
+        else:
+            # already moved for a previous request
+            shutil.copyfile(self.filenames[item], filename)
+        return self.shapes[item]
+
 # VIIRS crefl products
 # Low resolution (M band resolution)
 PRODUCT_VCR01 = "viirs_crefl01"
@@ -405,9 +464,13 @@ FALSE_COLOR_PRODUCTS = VIIRS_FALSE_COLOR_PRODUCTS + MODIS_FALSE_COLOR_PRODUCTS
 # I03 = CR10
 
 class Frontend(roles.FrontendRole):
-    def __init__(self, use_terrain_corrected=True, ignore_crefl=False, **kwargs):
+    def __init__(self, use_terrain_corrected=True, ignore_crefl=False, crefl_workers=1, native_crefl=True, **kwargs):
         super(Frontend, self).__init__(**kwargs)
         self.use_terrain_corrected = use_terrain_corrected
+        # Number of threads (or VIIRS granules when running cviirs) to process at the same time
+        self.crefl_workers = crefl_workers
+        # Compute VIIRS corrected reflectances in memory instead of running cviirs
+        self.native_crefl = native_crefl
         # Ignore existing CREFL files and just create from SDRs
         self.ignore_crefl = ignore_crefl
         # FUTURE: Remove these files or give the option to remove them when an error is encountered
@@ -580,11 +643,9 @@ class Frontend(roles.FrontendRole):
                 LOG.error("Can not create MODIS crefl files with out 1000m files")
                 raise RuntimeError("Can not create MODIS crefl files with out 1000m files")
 
-            # Use the MODIS Frontend to determine if we have enough day time data
-            LOG.debug("Loading the MODIS frontend to check for daytime data")
-            f = modis_module.Frontend(search_paths=self.file_readers[FT_GEO].filepaths)
-            scene = f.create_scene(products=[modis_module.PRODUCT_SZA])
-            day_percentage = f._get_day_percentage(scene[modis_module.PRODUCT_SZA])
+            # Use the geolocation files to determine if we have enough day time data
+            LOG.debug("Checking the MODIS geolocation for daytime data")
+            day_percentage = self.file_readers[FT_GEO].get_day_fraction(modis_guidebook.K_SZA, 90) * 100.0
             if day_percentage < 10:
                 LOG.error("Will not create modis crefl products because there is less than 10%% of day data")
                 raise RuntimeError("Will not create modis crefl products because there is less than 10%% of day data")
@@ -621,17 +682,19 @@ class Frontend(roles.FrontendRole):
                 raise RuntimeError("M-band geolocation is required for crefl processing")
             geo_files = self.file_readers[ft].filepaths
 
-            # Use the VIIRS Frontend to determine if we have enough day time data
-            LOG.debug("Loading the VIIRS frontend to check for daytime data")
-            f = viirs_module.Frontend(search_paths=geo_files, use_terrain_corrected=self.use_terrain_corrected)
-            scene = f.create_scene(products=[viirs_module.PRODUCT_M_SZA])
-            day_percentage = f._get_day_percentage(scene[viirs_module.PRODUCT_M_SZA])
+            # Use the geolocation files to determine if we have enough day time data
+            LOG.debug("Checking the VIIRS geolocation for daytime data")
+            day_percentage = self.file_readers[ft].get_day_fraction(viirs_guidebook.K_SOLARZENITH, 100) * 100.0
             if day_percentage < 10:
                 LOG.error("Will not create viirs crefl products because there is less than 10%% of day data")
                 raise RuntimeError("Will not create viirs crefl products because there is less than 10%% of day data")
             LOG.debug("Will attempt crefl creation, found %f%% day data", day_percentage)
 
-            kwargs = {"keep_intermediate": self.keep_intermediate}
+            if self.native_crefl:
+                self.create_native_viirs_crefl(self.file_readers[ft])
+                return
+
+            kwargs = {"keep_intermediate": self.keep_intermediate, "num_workers": self.crefl_workers}
             for ft, kw_name in zip(self.viirs_refl_fts, kw_names):
                 if ft in self.file_readers:
                     kwargs[kw_name] = self.file_readers[ft].filepaths
@@ -648,6 +711,67 @@ class Frontend(roles.FrontendRole):
             LOG.error("Could not create crefl files from SDRs")
             raise
 
+    def create_native_viirs_crefl(self, geo_reader):
+        """Compute VIIRS corrected reflectances from the SDR data without creating any CREFL files.
+
+        Each granule is corrected separately and appended to a flat binary file for each band so memory use doesn't
+        grow with the length of the pass.
+        """
+        from polar2grid.crefl import cviirs
+        # CREFL band number and file key for each VIIRS reflectance file type
+        crefl_bands = [8, 9, 10, 1, 2, 3, 4, 5, 6, 7]
+        file_keys = [K_CREFL08, K_CREFL09, K_CREFL10, K_CREFL01, K_CREFL02, K_CREFL03, K_CREFL04, K_CREFL05,
+                     K_CREFL06, K_CREFL07]
+        available = [(ft, band, file_key) for ft, band, file_key in zip(self.viirs_refl_fts, crefl_bands, file_keys)
+                     if ft in self.file_readers and len(self.file_readers[ft])]
+        if not available:
+            LOG.error("No VIIRS reflectance files to create crefl products from")
+            raise RuntimeError("No VIIRS reflectance files to create crefl products from")
+        if any(len(self.file_readers[ft]) != len(geo_reader) for ft, _, _ in available):
+            LOG.error("Need the same number of geolocation and reflectance files to create crefl products")
+            raise RuntimeError("Need the same number of geolocation and reflectance files to create crefl products")
+
+        dem = cviirs.load_dem()
+        work_dir = mkdtemp(prefix="crefl_", dir=os.getcwd())
+        filenames = dict((file_key, os.path.join(work_dir, file_key + ".dat")) for _, _, file_key in available)
+        LOG.info("Computing corrected reflectances for %d VIIRS bands", len(available))
+        try:
+            with ExitStack() as stack:
+                file_appenders = [FileAppender(stack.enter_context(open(filenames[file_key], "wb")), numpy.float32)
+                                  for _, _, file_key in available]
+                for idx, geo_file_reader in enumerate(geo_reader.file_readers):
+                    LOG.debug("Computing corrected reflectances for granule %d", idx)
+                    geo_data = [geo_file_reader.get_swath_data(k) for k in (
+                        viirs_guidebook.K_LONGITUDE, viirs_guidebook.K_LATITUDE,
+                        viirs_guidebook.K_SOLARZENITH, viirs_guidebook.K_SOLARAZIMUTH,
+                        viirs_guidebook.K_SATZENITH, viirs_guidebook.K_SATAZIMUTH)]
+                    reflectances = [self.file_readers[ft].file_readers[idx].get_swath_data(
+                        viirs_guidebook.K_REFLECTANCE) for ft, _, _ in available]
+                    corrected = cviirs.run_crefl(reflectances, [band for _, band, _ in available], *geo_data, dem=dem,
+                                                 num_workers=self.crefl_workers)
+                    for file_appender, data in zip(file_appenders, corrected):
+                        file_appender.append(data)
+        except (IOError, ValueError, RuntimeError, KeyError):
+            if not self.keep_intermediate:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+
+        m_keys = []
+        i_keys = []
+        m_filepaths = list(geo_reader.filepaths)
+        i_filepaths = list(geo_reader.filepaths)
+        for (ft, band, file_key), file_appender in zip(available, file_appenders):
+            keys, filepaths = (i_keys, i_filepaths) if band >= 8 else (m_keys, m_filepaths)
+            keys.append((file_key, file_appender.shape))
+            filepaths.extend(self.file_readers[ft].filepaths)
+
+        self._clear_crefl_file_readers()
+        self._init_crefl_file_readers()
+        for ft, keys, filepaths in ((FT_CREFL_M, m_keys, m_filepaths), (FT_CREFL_I, i_keys, i_filepaths)):
+            self.file_readers[ft] = FlatBinaryReader(geo_reader, work_dir,
+                                                     dict((k, filenames[k]) for k, _ in keys), dict(keys), filepaths,
+                                                     keep_intermediate=self.keep_intermediate)
+
     @property
     def begin_time(self):
         for ft in self.crefl_fts:
@@ -871,6 +995,11 @@ def add_frontend_argument_groups(parser):
                        help="List available frontend products and exit")
     group.add_argument("--no-tc", dest="use_terrain_corrected", action="store_false",
                        help="Don't use terrain-corrected navigation (VIIRS products only)")
+    group.add_argument("--crefl-workers", dest="crefl_workers", type=int, default=1,
+                       help="Number of threads computing VIIRS CREFL (or granules running cviirs) at the same time")
+    group.add_argument("--cviirs", dest="native_crefl", action="store_false",
+                       help="Run the external 'cviirs' program to create VIIRS CREFL files instead of computing "
+                            "corrected reflectances in memory")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("-p", "--products", dest="products", nargs="+", default=None, action=ExtendAction,
@@ -42,7 +42,11 @@ __docformat__ = "restructuredtext en"
 import os
 import sys
 from subprocess import check_output, CalledProcessError, STDOUT
+from functools import partial
 from itertools import zip_longest
+from multiprocessing.pool import ThreadPool
+from shutil import rmtree
+from tempfile import mkdtemp
 import logging
 
 LOG = logging.getLogger(__name__)
@@ -129,83 +133,107 @@ def _run_cviirs(output_filename, input_filenames, bands=None, overwrite=True, ve
 
     return output_filename
 
+def _run_cviirs_granule(idx, geo_file, m_files, i_files, keep_intermediate=False):
+    """Run cviirs for one granule in its own temporary working directory.
+
+    The HDF4 files cviirs reads from always have the same names so each granule gets its own directory for them. The
+    CREFL output files are written to the current directory.
+
+    :returns: list of CREFL output filenames created for this granule
+    """
+    m_vars = ["Reflectance_Mod_M%d" % (i,) for i in [5, 7, 3, 4, 8, 10, 11]]
+    i_vars = ["Reflectance_Img_I%d" % (i,) for i in range(1, 4)]
+    m_bands = [str(x) for x in range(1, 8)]
+    i_bands = ["8", "9", "10"]
+    output_filenames = []
+    # GITCO_npp_d20120225_t1805407_e1807049_b01708_c20120226002721519187_noaa_ops.h5
+    # Result: npp_d20120225_t1805407_e1807049
+    output_suffix = "_".join(os.path.basename(geo_file).split("_")[1:5])
+    m_output_filename = "CREFLM_%s.hdf" % (output_suffix,)
+    i_output_filename = "CREFLI_%s.hdf" % (output_suffix,)
+    # transfer HDF5 files to HDF4 versions of themselves because that's how CREFL plays
+    work_dir = mkdtemp(prefix="crefl_%s_" % (output_suffix,), dir=os.getcwd())
+    svm_temp_file = os.path.join(work_dir, "NPP_VMAE_L1.hdf")
+    svi_temp_file = os.path.join(work_dir, "NPP_VIAE_L1.hdf")
+    try:
+        run_hdf5_rename(geo_file, svm_temp_file, "Latitude")
+        run_hdf5_rename(geo_file, svm_temp_file, "Longitude")
+        run_hdf5_rename(geo_file, svm_temp_file, "SatelliteAzimuthAngle", "SenAziAng_Mod")
+        run_hdf5_rename(geo_file, svm_temp_file, "SatelliteZenithAngle", "SenZenAng_Mod")
+        run_hdf5_rename(geo_file, svm_temp_file, "SolarZenithAngle", "SolZenAng_Mod")
+        run_hdf5_rename(geo_file, svm_temp_file, "SolarAzimuthAngle", "SolAziAng_Mod")
+
+        available_m_bands = []
+        for m_file_list, m_var, m_band in zip(m_files, m_vars, m_bands):
+            if m_file_list:
+                LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", m_band, m_var)
+                run_hdf5_rename(m_file_list[idx], svm_temp_file, "Reflectance", m_var)
+                available_m_bands.append(m_band)
+
+        if available_m_bands:
+            # only run this if we were given any files
+            LOG.info("Running CREFL for M bands (%s)", output_suffix)
+            _run_cviirs(m_output_filename, [svm_temp_file], bands=available_m_bands, output_1km=True)
+            output_filenames.append(m_output_filename)
+
+        available_i_bands = []
+        for i_file_list, i_var, i_band in zip(i_files, i_vars, i_bands):
+            if i_file_list:
+                LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", i_band, i_var)
+                run_hdf5_rename(i_file_list[idx], svi_temp_file, "Reflectance", i_var)
+                available_i_bands.append(i_band)
+
+        if available_i_bands:
+            # only run this if we have the necessary data
+            LOG.info("Running CREFL for I bands (%s)", output_suffix)
+            _run_cviirs(i_output_filename, [svm_temp_file, svi_temp_file], bands=available_i_bands, output_500m=True)
+            output_filenames.append(i_output_filename)
+    except (OSError, RuntimeError, ValueError, KeyError):
+        LOG.error("Could not create VIIRS CREFL files", exc_info=True)
+        LOG.error("Could not create VIIRS CREFL files")
+        if os.path.isfile(m_output_filename) and not keep_intermediate:
+            LOG.debug("Removing unfinished CREFLM file: %s", m_output_filename)
+            os.remove(m_output_filename)
+        if os.path.isfile(i_output_filename) and not keep_intermediate:
+            LOG.debug("Removing unfinished CREFLI file: %s", i_output_filename)
+            os.remove(i_output_filename)
+        raise
+    finally:
+        if not keep_intermediate:
+            LOG.debug("Removing temporary crefl directory: %s", work_dir)
+            rmtree(work_dir, ignore_errors=True)
+
+    return output_filenames
+
+
 def run_cviirs(geo_files,
                m05_files=None, m07_files=None, m03_files=None, m04_files=None,
                m08_files=None, m10_files=None, m11_files=None,
-               i01_files=None, i02_files=None, i03_files=None, keep_intermediate=False):
+               i01_files=None, i02_files=None, i03_files=None, keep_intermediate=False, num_workers=1):
     """Run cviirs for multiple granules worth of files.
 
+    Granules are processed independently, up to `num_workers` at a time. Output filenames are returned in granule
+    order.
+
     Note: cviirs requires a 'CMGDEM.hdf' to be in the same directory as the 'cviirs' executable. The search directory
     can be changed with the 'ANCPATH' environment variable.
     """
     m_files = [m05_files, m07_files, m03_files, m04_files, m08_files, m10_files, m11_files]
     i_files = [i01_files, i02_files, i03_files]
-    m_vars = ["Reflectance_Mod_M%d" % (i,) for i in [5, 7, 3, 4, 8, 10, 11]]
-    i_vars = ["Reflectance_Img_I%d" % (i,) for i in range(1, 4)]
-    m_bands = [str(x) for x in range(1, 8)]
-    i_bands = ["8", "9", "10"]
-    output_filenames = []
-    for idx, geo_file in enumerate(geo_files):
-        # transfer HDF5 files to HDF4 versions of themselves because that's how CREFL plays
-        svm_temp_file = "NPP_VMAE_L1.hdf"
-        svi_temp_file = "NPP_VIAE_L1.hdf"
-        # GITCO_npp_d20120225_t1805407_e1807049_b01708_c20120226002721519187_noaa_ops.h5
-        # Result: npp_d20120225_t1805407_e1807049
-        output_suffix = "_".join(os.path.basename(geo_file).split("_")[1:5])
-        m_output_filename = "CREFLM_%s.hdf" % (output_suffix,)
-        i_output_filename = "CREFLI_%s.hdf" % (output_suffix,)
+    run_granule = partial(_run_cviirs_granule, m_files=m_files, i_files=i_files, keep_intermediate=keep_intermediate)
+    if num_workers <= 1 or len(geo_files) <= 1:
+        granule_outputs = [run_granule(idx, geo_file) for idx, geo_file in enumerate(geo_files)]
+    else:
+        pool = ThreadPool(min(num_workers, len(geo_files)))
         try:
-            run_hdf5_rename(geo_file, svm_temp_file, "Latitude")
-            run_hdf5_rename(geo_file, svm_temp_file, "Longitude")
-            run_hdf5_rename(geo_file, svm_temp_file, "SatelliteAzimuthAngle", "SenAziAng_Mod")
-            run_hdf5_rename(geo_file, svm_temp_file, "SatelliteZenithAngle", "SenZenAng_Mod")
-            run_hdf5_rename(geo_file, svm_temp_file, "SolarZenithAngle", "SolZenAng_Mod")
-            run_hdf5_rename(geo_file, svm_temp_file, "SolarAzimuthAngle", "SolAziAng_Mod")
-
-            available_m_bands = []
-            for m_file_list, m_var, m_band in zip(m_files, m_vars, m_bands):
-                if m_file_list:
-                    LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", m_band, m_var)
-                    run_hdf5_rename(m_file_list[idx], svm_temp_file, "Reflectance", m_var)
-                    available_m_bands.append(m_band)
-
-            if available_m_bands:
-                # only run this if we were given any files
-                LOG.info("Running CREFL for M bands")
-                _run_cviirs(m_output_filename, [svm_temp_file], bands=available_m_bands, output_1km=True)
-                output_filenames.append(m_output_filename)
-
-            available_i_bands = []
-            for i_file_list, i_var, i_band in zip(i_files, i_vars, i_bands):
-                if i_file_list:
-                    LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", i_band, i_var)
-                    run_hdf5_rename(i_file_list[idx], svi_temp_file, "Reflectance", i_var)
-                    available_i_bands.append(i_band)
-
-            if available_i_bands:
-                # only run this if we have the necessary data
-                LOG.info("Running CREFL for I bands")
-                _run_cviirs(i_output_filename, [svm_temp_file, svi_temp_file], bands=available_i_bands, output_500m=True)
-                output_filenames.append(i_output_filename)
-        except (OSError, RuntimeError, ValueError, KeyError):
-            LOG.error("Could not create VIIRS CREFL files", exc_info=True)
-            LOG.error("Could not create VIIRS CREFL files")
-            if os.path.isfile(m_output_filename) and not keep_intermediate:
-                LOG.debug("Removing unfinished CREFLM file: %s", m_output_filename)
-                os.remove(m_output_filename)
-            if os.path.isfile(i_output_filename) and not keep_intermediate:
-                LOG.debug("Removing unfinished CREFLI file: %s", i_output_filename)
-                os.remove(i_output_filename)
-            raise
+            granule_outputs = pool.starmap(run_granule, enumerate(geo_files))
         finally:
-            if os.path.isfile(svm_temp_file) and not keep_intermediate:
-                LOG.debug("Removing temporary crefl file: %s", svm_temp_file)
-                os.remove(svm_temp_file)
-            if os.path.isfile(svi_temp_file) and not keep_intermediate:
-                LOG.debug("Removing temporary crefl file: %s", svi_temp_file)
-                os.remove(svi_temp_file)
-
-    output_filenames = list(set(output_filenames))
+            pool.close()
+            pool.join()
+
+    output_filenames = []
+    for granule_filenames in granule_outputs:
+        output_filenames.extend(fn for fn in granule_filenames if fn not in output_filenames)
     LOG.debug("cviirs output filenames:\n\t%s", "\n\t".join(output_filenames))
     return output_filenames
 
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2014 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""VIIRS corrected reflectance (Rayleigh scattering and gas absorption correction) computed in memory.
+
+This is a numpy version of the ``cviirs`` program (``viirs_crefl/cviirs.c``) that works directly on the arrays
+loaded from the SDR files instead of converting them to HDF4 files for an external executable. Results match
+``cviirs`` except that they are not quantized to 16-bit integers.
+
+CREFL band numbers 1 through 10 are VIIRS bands M05, M07, M03, M04, M08, M10, M11, I01, I02, and I03.
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+from multiprocessing.pool import ThreadPool
+
+import logging
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+DEM_FILENAME = "CMGDEM.hdf"
+DEM_SDS_NAME = "averaged elevation"
+UO3 = 0.285
+UH2O = 2.93
+REFLMIN = -0.01
+REFLMAX = 1.6
+MAXSOLZ = 86.5
+MAXAIRMASS = 18.
+SCALEHEIGHT = 8000.
+TAUSTEP4SPHALB = 0.0001
+MAXNUMSPHALBVALUES = 4000
+M_ROWS_PER_SCAN = 16
+# Number of M band scans processed at a time
+CHUNK_SCANS = 16
+
+# Coefficients for CREFL bands 1-10
+AH2O = numpy.array([0.000406601, 0.0015933, 0, 1.78644e-05, 0.00296457, 0.000617252, 0.000996563, 0.00222253,
+                    0.00094005, 0.000563288])
+BH2O = numpy.array([0.812659, 0.832931, 1., 0.8677850, 0.806816, 0.944958, 0.78812, 0.791204, 0.900564, 0.942907])
+AO3 = numpy.array([0.0433461, 0.0, 0.0178299, 0.0853012, 0, 0, 0, 0.0813531, 0, 0])
+TAUR0 = numpy.array([0.04350, 0.01582, 0.16176, 0.09740, 0.00369, 0.00132, 0.00033, 0.05373, 0.01561, 0.00129])
+
+_SPHALB_TABLE = None
+_DEM_CACHE = {}
+
+
+def _fintexp1(tau):
+    a = (-.57721566, 0.99999193, -0.24991055, 0.05519968, -0.00976004, 0.00107857)
+    xx = numpy.polynomial.polynomial.polyval(tau, a)
+    return xx - numpy.log(tau)
+
+
+def _fintexp3(tau):
+    return (numpy.exp(-tau) * (1. - tau) + tau * tau * _fintexp1(tau)) / 2.
+
+
+def _csalbr(tau):
+    return (3. * tau - _fintexp3(tau) * (4. + 2. * tau) + 2. * numpy.exp(-tau)) / (4. + 3. * tau)
+
+
+def _sphalb_table():
+    """Spherical albedo for every `TAUSTEP4SPHALB` step of optical depth (computed once).
+    """
+    global _SPHALB_TABLE
+    if _SPHALB_TABLE is None:
+        table = numpy.zeros(MAXNUMSPHALBVALUES, dtype=numpy.float64)
+        table[1:] = _csalbr(numpy.arange(1, MAXNUMSPHALBVALUES) * TAUSTEP4SPHALB)
+        _SPHALB_TABLE = table
+    return _SPHALB_TABLE
+
+
+def _neighbor_weights(positions, num_points):
+    """Indexes of the two points around fractional `positions` and the weight of the second point.
+
+    Positions before the first point or after the last point are extrapolated from the two closest points.
+    """
+    idx1 = numpy.minimum(numpy.floor(positions).astype(numpy.int64), num_points - 1)
+    idx2 = idx1 + 1
+    idx1 = numpy.where(idx1 < 0, idx2 + 1, idx1)
+    idx2 = numpy.where(idx2 > num_points - 1, idx1 - 1, idx2)
+    return idx1, idx2, (positions - idx1) / (idx2 - idx1)
+
+
+def load_dem(dem_filename=None):
+    """Load the CMGDEM digital elevation model, reusing the array if the file was loaded before.
+
+    :param dem_filename: Path to 'CMGDEM.hdf', defaults to the ancillary directory used for ``cviirs``
+    """
+    if dem_filename is None:
+        from polar2grid.crefl.crefl_wrapper import CMGDEM_PATH
+        dem_filename = os.path.join(CMGDEM_PATH, DEM_FILENAME)
+    dem_filename = os.path.realpath(dem_filename)
+    if dem_filename not in _DEM_CACHE:
+        from pyhdf import SD
+        LOG.debug("Loading DEM from %s", dem_filename)
+        try:
+            h = SD.SD(dem_filename, SD.SDC.READ)
+            try:
+                _DEM_CACHE[dem_filename] = h.select(DEM_SDS_NAME).get().astype(numpy.int16)
+            finally:
+                h.end()
+        except SD.HDF4Error:
+            LOG.error("Could not read DEM file '%s'", dem_filename)
+            raise RuntimeError("Could not read DEM file '%s'" % (dem_filename,))
+    return _DEM_CACHE[dem_filename]
+
+
+def interp_dem(lon, lat, dem):
+    """Bilinear interpolation of surface height (meters, never negative) from a global lat/lon `dem` array.
+    """
+    num_rows, num_cols = dem.shape
+    # fill latitudes are at sea level, don't use their (probably fill) longitudes to index the DEM
+    fill = numpy.asarray(lat) < -99.
+    lat = numpy.where(fill, 0., lat)
+    lon = numpy.where(fill, 0., lon)
+    row1, row2, t = _neighbor_weights((90. - lat) * num_rows / 180., num_rows)
+    col1, col2, u = _neighbor_weights((lon + 180.) * num_cols / 360., num_cols)
+    height = ((1. - t) * ((1. - u) * dem[row1, col1] + u * dem[row1, col2]) +
+              t * ((1. - u) * dem[row2, col1] + u * dem[row2, col2]))
+    height = numpy.clip(numpy.trunc(height), 0, None)
+    height[fill] = 0
+    return height
+
+
+def get_atm_variables(mus, muv, phi, height, bands):
+    """Get the atmospheric variables used to correct reflectances of each CREFL band.
+
+    Pixels where the air mass is too large or the optical depth is outside the spherical albedo table are NaN.
+
+    :param mus: Cosine of solar zenith angle
+    :param muv: Cosine of sensor zenith angle
+    :param phi: Solar azimuth minus sensor azimuth (degrees)
+    :param height: Surface height (meters)
+    :param bands: CREFL band numbers (1-10)
+    :returns: sphalb, rhoray, TtotraytH2O, and tOG arrays with an extra first dimension for each band
+    """
+    xfd = 0.958725775
+    xbeta2 = 0.5
+    as0 = (0.33243832, 0.16285370, -0.30924818, -0.10324388, 0.11493334,
+           -6.777104e-02, 1.577425e-03, -1.240906e-02, 3.241678e-02, -3.503695e-02)
+    as1 = (0.19666292, -5.439061e-02)
+    as2 = (0.14545937, -2.910845e-02)
+    band_idx = numpy.asarray(bands) - 1
+    band_shape = (len(band_idx),) + (1,) * mus.ndim
+
+    m = 1. / mus + 1. / muv
+    invalid = ~(m <= MAXAIRMASS)
+
+    phios = numpy.radians(phi + 180.)
+    xcos2 = numpy.cos(phios)
+    xcos3 = numpy.cos(2. * phios)
+    mus2 = mus * mus
+    muv2 = muv * muv
+    xph1 = 1. + (3. * mus2 - 1.) * (3. * muv2 - 1.) * xfd / 8.
+    xph2 = -xfd * xbeta2 * 1.5 * mus * muv * numpy.sqrt(1. - mus2) * numpy.sqrt(1. - muv2)
+    xph3 = xfd * xbeta2 * 0.375 * (1. - mus2) * (1. - muv2)
+    pl = (1., mus + muv, mus * muv, mus2 + muv2, mus2 * muv2)
+    fs01 = sum(p * a for p, a in zip(pl, as0[:5]))
+    fs02 = sum(p * a for p, a in zip(pl, as0[5:]))
+
+    # Rayleigh optical depth, reduced by surface pressure
+    taur = TAUR0[band_idx].reshape(band_shape) * numpy.exp(-height / SCALEHEIGHT)
+    xlntaur = numpy.log(taur)
+    fs0 = fs01 + fs02 * xlntaur
+    fs1 = as1[0] + xlntaur * as1[1]
+    fs2 = as2[0] + xlntaur * as2[1]
+    trdown = numpy.exp(-taur / mus)
+    trup = numpy.exp(-taur / muv)
+    xitm1 = (1. - trdown * trup) / 4. / (mus + muv)
+    xitm2 = (1. - trdown) * (1. - trup)
+    rhoray = (xph1 * (xitm1 + xitm2 * fs0) + xph2 * (xitm1 + xitm2 * fs1) * xcos2 * 2. +
+              xph3 * (xitm1 + xitm2 * fs2) * xcos3 * 2.)
+
+    sphalb_idx = taur / TAUSTEP4SPHALB
+    invalid = invalid | (sphalb_idx >= MAXNUMSPHALBVALUES)
+    sphalb_idx = numpy.where(invalid, 0, sphalb_idx + 0.5).astype(numpy.int64)
+    sphalb = _sphalb_table()[sphalb_idx]
+    invalid |= sphalb <= 0
+
+    ttotrayu = ((2 / 3. + muv) + (2 / 3. - muv) * trup) / (4 / 3. + taur)
+    ttotrayd = ((2 / 3. + mus) + (2 / 3. - mus) * trdown) / (4 / 3. + taur)
+    ao3 = AO3[band_idx].reshape(band_shape)
+    ah2o = AH2O[band_idx].reshape(band_shape)
+    bh2o = BH2O[band_idx].reshape(band_shape)
+    tO3 = numpy.where(ao3 != 0, numpy.exp(-m * UO3 * ao3), 1.)
+    tH2O = numpy.where(bh2o != 0, numpy.exp(-(ah2o * ((m * UH2O) ** bh2o))), 1.)
+    ttotraytH2O = ttotrayu * ttotrayd * tH2O
+    tOG = tO3
+
+    for arr in (sphalb, rhoray, ttotraytH2O, tOG):
+        arr[invalid] = numpy.nan
+    return sphalb, rhoray, ttotraytH2O, tOG
+
+
+def _to_fine_resolution(data, factor, rows_per_scan, bilinear):
+    """Expand coarse (M band) `data` to `factor` times the resolution inside each scan.
+
+    Bilinear interpolation treats coarse pixel centers as fine pixel centers the way ``cviirs`` does, otherwise the
+    coarse pixel covering each fine pixel is used.
+    """
+    if factor == 1:
+        return data
+    num_scans = data.shape[0] // rows_per_scan
+    num_cols = data.shape[1]
+    fine_rows = numpy.arange(rows_per_scan * factor)
+    fine_cols = numpy.arange(num_cols * factor)
+    scans = data.reshape((num_scans, rows_per_scan, num_cols))
+    if not bilinear:
+        fine = scans[:, fine_rows // factor][:, :, fine_cols // factor]
+        return fine.reshape((num_scans * rows_per_scan * factor, num_cols * factor))
+
+    row1, row2, t = _neighbor_weights(fine_rows / float(factor) - 0.5, rows_per_scan)
+    col1, col2, u = _neighbor_weights(fine_cols / float(factor) - 0.5, num_cols)
+    fine = scans[:, row1] * (1. - t[:, None]) + scans[:, row2] * t[:, None]
+    fine = fine[:, :, col1] * (1. - u) + fine[:, :, col2] * u
+    return fine.reshape((num_scans * rows_per_scan * factor, num_cols * factor))
+
+
+def run_crefl(reflectances, bands, lon, lat, solz, sola, senz, sena, dem=None, maxsolz=MAXSOLZ,
+              rows_per_scan=M_ROWS_PER_SCAN, chunk_scans=CHUNK_SCANS, num_workers=1):
+    """Compute corrected reflectances for multiple bands.
+
+    Angles and geolocation are at M band resolution. Reflectances (TOA reflectance factors with NaN fill) can be M
+    band or I band (twice the M band resolution). Atmospheric variables are computed for M band pixels and
+    interpolated to I band pixels.
+
+    The swath is processed `chunk_scans` scans at a time, in a thread pool if `num_workers` is more than 1.
+
+    :param reflectances: list of reflectance arrays
+    :param bands: CREFL band number (1-10) for each reflectance array
+    :param dem: Elevation array from `load_dem` or `None` to assume everything is at sea level
+    :returns: list of float32 corrected reflectance arrays (NaN for invalid pixels)
+    """
+    num_rows = lon.shape[0]
+    if num_rows % rows_per_scan != 0:
+        LOG.error("Number of geolocation rows (%d) is not a multiple of the rows per scan (%d)",
+                  num_rows, rows_per_scan)
+        raise ValueError("Number of geolocation rows is not a multiple of the rows per scan")
+    factors = [refl.shape[0] // num_rows for refl in reflectances]
+    for refl, factor in zip(reflectances, factors):
+        if factor not in (1, 2) or refl.shape != (num_rows * factor, lon.shape[1] * factor):
+            LOG.error("Reflectance array shape %r does not match geolocation shape %r", refl.shape, lon.shape)
+            raise ValueError("Reflectance array shape does not match geolocation shape")
+    results = [numpy.empty(refl.shape, dtype=numpy.float32) for refl in reflectances]
+
+    def _correct_chunk(first_row):
+        coarse_slice = slice(first_row, first_row + chunk_scans * rows_per_scan)
+        chunk_lon = lon[coarse_slice].astype(numpy.float64)
+        chunk_lat = lat[coarse_slice].astype(numpy.float64)
+        chunk_solz = solz[coarse_slice].astype(numpy.float64)
+        invalid = ~(chunk_solz < maxsolz) | numpy.isnan(chunk_lon) | numpy.isnan(chunk_lat)
+        mus = numpy.cos(numpy.radians(chunk_solz))
+        mus[invalid] = numpy.nan
+        muv = numpy.cos(numpy.radians(senz[coarse_slice].astype(numpy.float64)))
+        phi = sola[coarse_slice].astype(numpy.float64) - sena[coarse_slice]
+        if dem is None:
+            height = numpy.zeros(mus.shape)
+        else:
+            height = interp_dem(numpy.where(invalid, 0, chunk_lon), numpy.where(invalid, 0, chunk_lat), dem)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            sphalb, rhoray, ttotraytH2O, tOG = get_atm_variables(mus, muv, phi, height, bands)
+            for band_idx, (refl, factor, result) in enumerate(zip(reflectances, factors, results)):
+                fine_slice = slice(coarse_slice.start * factor, coarse_slice.stop * factor)
+                corr_refl = (refl[fine_slice] / _to_fine_resolution(tOG[band_idx], factor, rows_per_scan, False) -
+                             _to_fine_resolution(rhoray[band_idx], factor, rows_per_scan, True))
+                corr_refl /= _to_fine_resolution(ttotraytH2O[band_idx], factor, rows_per_scan, False)
+                corr_refl /= 1. + corr_refl * _to_fine_resolution(sphalb[band_idx], factor, rows_per_scan, True)
+                numpy.clip(corr_refl, REFLMIN, REFLMAX, out=result[fine_slice])
+
+    chunk_starts = range(0, num_rows, chunk_scans * rows_per_scan)
+    if num_workers <= 1 or len(chunk_starts) <= 1:
+        for first_row in chunk_starts:
+            _correct_chunk(first_row)
+    else:
+        pool = ThreadPool(min(num_workers, len(chunk_starts)))
+        try:
+            pool.map(_correct_chunk, chunk_starts)
+        finally:
+            pool.close()
+            pool.join()
+    return results
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test creating VIIRS corrected reflectances in the CREFL frontend without the ``cviirs`` executable."""
+__docformat__ = "restructuredtext en"
+
+import gc
+import os
+from datetime import datetime
+
+import numpy
+import pytest
+
+from polar2grid.crefl import crefl2swath, cviirs
+from polar2grid.viirs import guidebook as viirs_guidebook
+
+GEO_KEYS = (viirs_guidebook.K_LONGITUDE, viirs_guidebook.K_LATITUDE,
+            viirs_guidebook.K_SOLARZENITH, viirs_guidebook.K_SOLARAZIMUTH,
+            viirs_guidebook.K_SATZENITH, viirs_guidebook.K_SATAZIMUTH)
+
+
+class _FakeGranuleReader(object):
+    def __init__(self, filepath, data):
+        self.filepath = filepath
+        self.data = data
+
+    def get_swath_data(self, item):
+        return self.data[item].copy()
+
+
+class _FakeMultiReader(object):
+    satellite = "npp"
+    instrument = "viirs"
+    begin_time = datetime(2015, 1, 1)
+    end_time = datetime(2015, 1, 1, 0, 5)
+
+    def __init__(self, file_readers):
+        self.file_readers = file_readers
+
+    def __len__(self):
+        return len(self.file_readers)
+
+    @property
+    def filepaths(self):
+        return [fr.filepath for fr in self.file_readers]
+
+
+def _create_pass(num_granules=3, scans_per_granule=2, num_cols=8):
+    rs = numpy.random.RandomState(0)
+    shape = (num_granules * scans_per_granule * 16, num_cols)
+    geo_data = [rs.uniform(-100., -80., shape), rs.uniform(30., 50., shape), rs.uniform(10., 80., shape),
+                rs.uniform(-180., 180., shape), rs.uniform(0., 60., shape), rs.uniform(-180., 180., shape)]
+    geo_data = [x.astype(numpy.float32) for x in geo_data]
+    geo_data[2][40:50] = 88.
+    m_refl = rs.uniform(0., 0.8, shape).astype(numpy.float32)
+    i_refl = rs.uniform(0., 0.8, (shape[0] * 2, shape[1] * 2)).astype(numpy.float32)
+    m_refl[3, 3] = numpy.nan
+    return geo_data, m_refl, i_refl
+
+
+def _split_granules(name, data, num_granules, key):
+    return _FakeMultiReader([_FakeGranuleReader("%s_%d.h5" % (name, idx), {key: granule_data})
+                             for idx, granule_data in enumerate(numpy.split(data, num_granules))])
+
+
+@pytest.fixture
+def frontend(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    dem = numpy.random.RandomState(1).randint(-100, 3000, (18, 36)).astype(numpy.int16)
+    monkeypatch.setattr(cviirs, "load_dem", lambda: dem)
+    f = crefl2swath.Frontend.__new__(crefl2swath.Frontend)
+    f.crefl_workers = 2
+    f.keep_intermediate = False
+    f.viirs_refl_fts = (
+        viirs_guidebook.FILE_TYPE_I01, viirs_guidebook.FILE_TYPE_I02, viirs_guidebook.FILE_TYPE_I03,
+        viirs_guidebook.FILE_TYPE_M05, viirs_guidebook.FILE_TYPE_M07, viirs_guidebook.FILE_TYPE_M03,
+        viirs_guidebook.FILE_TYPE_M04, viirs_guidebook.FILE_TYPE_M08, viirs_guidebook.FILE_TYPE_M10,
+        viirs_guidebook.FILE_TYPE_M11
+    )
+    f.crefl_fts = (crefl2swath.FT_CREFL_M, crefl2swath.FT_CREFL_I, crefl2swath.FT_CREFL_1000M,
+                   crefl2swath.FT_CREFL_500M, crefl2swath.FT_CREFL_250M)
+    f.file_readers = {}
+    f._init_crefl_file_readers()
+    return f
+
+
+def test_native_viirs_crefl_per_granule(frontend):
+    geo_data, m_refl, i_refl = _create_pass()
+    geo_reader = _FakeMultiReader([
+        _FakeGranuleReader("GMTCO_%d.h5" % (idx,), dict(zip(GEO_KEYS, granule_data)))
+        for idx, granule_data in enumerate(zip(*[numpy.split(x, 3) for x in geo_data]))])
+    frontend.file_readers[viirs_guidebook.FILE_TYPE_I01] = _split_granules(
+        "SVI01", i_refl, 3, viirs_guidebook.K_REFLECTANCE)
+    frontend.file_readers[viirs_guidebook.FILE_TYPE_M05] = _split_granules(
+        "SVM05", m_refl, 3, viirs_guidebook.K_REFLECTANCE)
+    frontend.create_native_viirs_crefl(geo_reader)
+
+    # the whole pass at once
+    i_expected, m_expected = cviirs.run_crefl([i_refl, m_refl], [8, 1], *geo_data, dem=cviirs.load_dem())
+    m_reader = frontend.file_readers[crefl2swath.FT_CREFL_M]
+    i_reader = frontend.file_readers[crefl2swath.FT_CREFL_I]
+    assert m_reader.filepaths == geo_reader.filepaths + ["SVM05_%d.h5" % (idx,) for idx in range(3)]
+    for file_reader, file_key, expected in ((m_reader, crefl2swath.K_CREFL01, m_expected),
+                                            (i_reader, crefl2swath.K_CREFL08, i_expected)):
+        assert len(file_reader) == 1
+        for filename in ("first.dat", "second.dat"):
+            shape = file_reader.write_var_to_flat_binary(file_key, filename)
+            assert shape == expected.shape
+            data = numpy.fromfile(filename, dtype=numpy.float32).reshape(shape)
+            numpy.testing.assert_array_equal(data, expected)
+    assert numpy.isnan(m_expected[3, 3])
+
+    # work directory is removed with the readers
+    work_dir = m_reader.work_dir
+    assert os.listdir(work_dir) == []
+    del m_reader, i_reader
+    frontend.file_readers.clear()
+    gc.collect()
+    assert not os.path.exists(work_dir)
+
+
+def test_native_viirs_crefl_unused_files_removed(frontend):
+    geo_data, m_refl, i_refl = _create_pass(num_granules=1)
+    geo_reader = _FakeMultiReader([_FakeGranuleReader("GMTCO_0.h5", dict(zip(GEO_KEYS, geo_data)))])
+    frontend.file_readers[viirs_guidebook.FILE_TYPE_M05] = _split_granules(
+        "SVM05", m_refl, 1, viirs_guidebook.K_REFLECTANCE)
+    frontend.create_native_viirs_crefl(geo_reader)
+    m_reader = frontend.file_readers[crefl2swath.FT_CREFL_M]
+    assert len(frontend.file_readers[crefl2swath.FT_CREFL_I]) == 0
+    work_dir = m_reader.work_dir
+    assert os.listdir(work_dir) == [crefl2swath.K_CREFL01 + ".dat"]
+    del m_reader
+    frontend.file_readers.clear()
+    gc.collect()
+    assert not os.path.exists(work_dir)
+
+
+def test_native_viirs_crefl_missing_granules(frontend):
+    geo_data, m_refl, i_refl = _create_pass()
+    geo_reader = _FakeMultiReader([_FakeGranuleReader("GMTCO_0.h5", dict(zip(GEO_KEYS, geo_data)))])
+    frontend.file_readers[viirs_guidebook.FILE_TYPE_M05] = _split_granules(
+        "SVM05", m_refl, 3, viirs_guidebook.K_REFLECTANCE)
+    with pytest.raises(RuntimeError):
+        frontend.create_native_viirs_crefl(geo_reader)
+    assert os.listdir(".") == []
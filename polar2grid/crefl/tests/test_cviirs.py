@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test the in-memory VIIRS corrected reflectance against scalar versions of the ``cviirs.c`` formulas."""
+__docformat__ = "restructuredtext en"
+
+import math
+
+import numpy
+import pytest
+
+from polar2grid.crefl import cviirs
+
+
+def _c_csalbr(tau):
+    a = (-.57721566, 0.99999193, -0.24991055, 0.05519968, -0.00976004, 0.00107857)
+    fintexp1 = sum(a_i * tau ** i for i, a_i in enumerate(a)) - math.log(tau)
+    fintexp3 = (math.exp(-tau) * (1. - tau) + tau * tau * fintexp1) / 2.
+    return (3. * tau - fintexp3 * (4. + 2. * tau) + 2. * math.exp(-tau)) / (4. + 3. * tau)
+
+
+def _c_getatmvariables(mus, muv, phi, height, band):
+    """Scalar ``getatmvariables`` and ``chand`` for one band, None where cviirs flags the pixel as invalid."""
+    xfd = 0.958725775
+    xbeta2 = 0.5
+    as0 = (0.33243832, 0.16285370, -0.30924818, -0.10324388, 0.11493334,
+           -6.777104e-02, 1.577425e-03, -1.240906e-02, 3.241678e-02, -3.503695e-02)
+    as1 = (0.19666292, -5.439061e-02)
+    as2 = (0.14545937, -2.910845e-02)
+    ib = band - 1
+
+    m = 1. / mus + 1. / muv
+    if m > cviirs.MAXAIRMASS:
+        return None
+    taur = cviirs.TAUR0[ib] * math.exp(-height / float(cviirs.SCALEHEIGHT))
+
+    phios = phi + 180.
+    xcos2 = math.cos(math.radians(phios))
+    xcos3 = math.cos(2. * math.radians(phios))
+    xph1 = 1. + (3. * mus * mus - 1.) * (3. * muv * muv - 1.) * xfd / 8.
+    xph2 = -xfd * xbeta2 * 1.5 * mus * muv * math.sqrt(1. - mus * mus) * math.sqrt(1. - muv * muv)
+    xph3 = xfd * xbeta2 * 0.375 * (1. - mus * mus) * (1. - muv * muv)
+    pl = (1., mus + muv, mus * muv, mus * mus + muv * muv, mus * mus * muv * muv)
+    fs01 = sum(pl[i] * as0[i] for i in range(5))
+    fs02 = sum(pl[i] * as0[5 + i] for i in range(5))
+    xlntaur = math.log(taur)
+    fs0 = fs01 + fs02 * xlntaur
+    fs1 = as1[0] + xlntaur * as1[1]
+    fs2 = as2[0] + xlntaur * as2[1]
+    trdown = math.exp(-taur / mus)
+    trup = math.exp(-taur / muv)
+    xitm1 = (1. - trdown * trup) / 4. / (mus + muv)
+    xitm2 = (1. - trdown) * (1. - trup)
+    rhoray = (xph1 * (xitm1 + xitm2 * fs0) + xph2 * (xitm1 + xitm2 * fs1) * xcos2 * 2. +
+              xph3 * (xitm1 + xitm2 * fs2) * xcos3 * 2.)
+
+    if taur / cviirs.TAUSTEP4SPHALB >= cviirs.MAXNUMSPHALBVALUES:
+        return None
+    sphalb_idx = int(taur / cviirs.TAUSTEP4SPHALB + 0.5)
+    sphalb = _c_csalbr(sphalb_idx * cviirs.TAUSTEP4SPHALB) if sphalb_idx else 0.
+    if sphalb <= 0:
+        return None
+    ttotrayu = ((2 / 3. + muv) + (2 / 3. - muv) * trup) / (4 / 3. + taur)
+    ttotrayd = ((2 / 3. + mus) + (2 / 3. - mus) * trdown) / (4 / 3. + taur)
+    tO3 = tH2O = 1.
+    if cviirs.AO3[ib] != 0:
+        tO3 = math.exp(-m * cviirs.UO3 * cviirs.AO3[ib])
+    if cviirs.BH2O[ib] != 0:
+        tH2O = math.exp(-(cviirs.AH2O[ib] * ((m * cviirs.UH2O) ** cviirs.BH2O[ib])))
+    return sphalb, rhoray, ttotrayu * ttotrayd * tH2O, tO3
+
+
+def _c_interp_dem(lat, lon, dem):
+    """Scalar ``interp_dem``."""
+    if lat < -99.:
+        return 0
+    num_rows, num_cols = dem.shape
+    fractrow = (90. - lat) * num_rows / 180.
+    row1 = int(math.floor(fractrow))
+    row2 = row1 + 1
+    if row1 < 0:
+        row1 = row2 + 1
+    if row2 > num_rows - 1:
+        row2 = row1 - 1
+    t = (fractrow - row1) / (row2 - row1)
+    fractcol = (lon + 180.) * num_cols / 360.
+    col1 = int(math.floor(fractcol))
+    col2 = col1 + 1
+    if col1 < 0:
+        col1 = col2 + 1
+    if col2 > num_cols - 1:
+        col2 = col1 - 1
+    u = (fractcol - col1) / (col2 - col1)
+    height = int(t * u * dem[row2, col2] + t * (1. - u) * dem[row2, col1] +
+                 (1. - t) * u * dem[row1, col2] + (1. - t) * (1. - u) * dem[row1, col1])
+    return max(height, 0)
+
+
+def _c_fine_position(fine_idx, factor, num_points):
+    """Coarse neighbors and weight of a fine pixel the way cviirs interpolates within a scan."""
+    fract = float(fine_idx) / factor - 0.5
+    idx1 = int(math.floor(fract))
+    idx2 = idx1 + 1
+    if idx1 < 0:
+        idx1 = idx2 + 1
+    if idx2 > num_points - 1:
+        idx2 = idx1 - 1
+    return idx1, idx2, (fract - idx1) / (idx2 - idx1)
+
+
+def _c_to_fine_resolution(data, factor, rows_per_scan):
+    """Loop version of the bilinear interpolation cviirs uses for I band rhoray and sphalb."""
+    num_rows, num_cols = data.shape
+    fine = numpy.empty((num_rows * factor, num_cols * factor))
+    for irow in range(fine.shape[0]):
+        scan_start = (irow // (rows_per_scan * factor)) * rows_per_scan
+        row1, row2, t = _c_fine_position(irow % (rows_per_scan * factor), factor, rows_per_scan)
+        for jcol in range(fine.shape[1]):
+            col1, col2, u = _c_fine_position(jcol, factor, num_cols)
+            fine[irow, jcol] = (t * u * data[scan_start + row2, col2] +
+                                (1. - t) * u * data[scan_start + row1, col2] +
+                                t * (1. - u) * data[scan_start + row2, col1] +
+                                (1. - t) * (1. - u) * data[scan_start + row1, col1])
+    return fine
+
+
+def _create_swath(num_scans=2, rows_per_scan=16, num_cols=8):
+    rs = numpy.random.RandomState(0)
+    shape = (num_scans * rows_per_scan, num_cols)
+    lon = rs.uniform(-100., -80., shape).astype(numpy.float32)
+    lat = rs.uniform(30., 50., shape).astype(numpy.float32)
+    solz = rs.uniform(10., 80., shape).astype(numpy.float32)
+    sola = rs.uniform(-180., 180., shape).astype(numpy.float32)
+    senz = rs.uniform(0., 60., shape).astype(numpy.float32)
+    sena = rs.uniform(-180., 180., shape).astype(numpy.float32)
+    m_refl = rs.uniform(0., 0.8, shape).astype(numpy.float32)
+    i_refl = rs.uniform(0., 0.8, (shape[0] * 2, shape[1] * 2)).astype(numpy.float32)
+    return m_refl, i_refl, lon, lat, solz, sola, senz, sena
+
+
+def _c_crefl(refl, band, solz, sola, senz, sena, rows_per_scan=16):
+    """Per-pixel cviirs correction of one band at sea level, NaN for invalid pixels."""
+    coarse_shape = solz.shape
+    factor = refl.shape[0] // coarse_shape[0]
+    atm = numpy.full((4,) + coarse_shape, numpy.nan)
+    for idx in numpy.ndindex(*coarse_shape):
+        if not solz[idx] < cviirs.MAXSOLZ:
+            continue
+        mus = math.cos(math.radians(float(solz[idx])))
+        muv = math.cos(math.radians(float(senz[idx])))
+        variables = _c_getatmvariables(mus, muv, float(sola[idx]) - float(sena[idx]), 0., band)
+        if variables is not None:
+            atm[:, idx[0], idx[1]] = variables
+    sphalb, rhoray, ttotraytH2O, tOG = atm
+    if factor != 1:
+        # rhoray and sphalb are interpolated, the other variables use the coarse pixel
+        sphalb = _c_to_fine_resolution(sphalb, factor, rows_per_scan)
+        rhoray = _c_to_fine_resolution(rhoray, factor, rows_per_scan)
+        ttotraytH2O = ttotraytH2O.repeat(factor, axis=0).repeat(factor, axis=1)
+        tOG = tOG.repeat(factor, axis=0).repeat(factor, axis=1)
+    corr_refl = (refl / tOG - rhoray) / ttotraytH2O
+    corr_refl /= 1. + corr_refl * sphalb
+    return numpy.clip(corr_refl, cviirs.REFLMIN, cviirs.REFLMAX)
+
+
+class TestAtmVariables(object):
+    @pytest.mark.parametrize("height", [0., 1500., -4000.])
+    def test_get_atm_variables(self, height):
+        rs = numpy.random.RandomState(1)
+        mus = numpy.cos(numpy.radians(rs.uniform(0., 80., 20)))
+        muv = numpy.cos(numpy.radians(rs.uniform(0., 70., 20)))
+        phi = rs.uniform(-360., 360., 20)
+        bands = list(range(1, 11))
+        results = cviirs.get_atm_variables(mus, muv, phi, numpy.zeros(20) + height, bands)
+        for band_idx, band in enumerate(bands):
+            for idx in range(20):
+                expected = _c_getatmvariables(mus[idx], muv[idx], phi[idx], height, band)
+                numpy.testing.assert_allclose([r[band_idx, idx] for r in results], expected, rtol=1e-6)
+
+    def test_get_atm_variables_airmass(self):
+        # 1 / cos(87) + 1 / cos(10) > MAXAIRMASS
+        mus = numpy.cos(numpy.radians(numpy.array([87., 80.])))
+        muv = numpy.cos(numpy.radians(numpy.array([10., 10.])))
+        assert _c_getatmvariables(mus[0], muv[0], 0., 0., 1) is None
+        results = cviirs.get_atm_variables(mus, muv, numpy.zeros(2), numpy.zeros(2), [1, 2])
+        for result in results:
+            assert numpy.isnan(result[:, 0]).all()
+            assert not numpy.isnan(result[:, 1]).any()
+
+    def test_get_atm_variables_sphalb_overflow(self):
+        # the optical depth of band 3 is past the end of the spherical albedo table, band 1 isn't
+        height = numpy.array([-8000.])
+        mus = numpy.cos(numpy.radians(numpy.array([30.])))
+        muv = numpy.cos(numpy.radians(numpy.array([20.])))
+        assert _c_getatmvariables(mus[0], muv[0], 0., height[0], 3) is None
+        assert _c_getatmvariables(mus[0], muv[0], 0., height[0], 1) is not None
+        results = cviirs.get_atm_variables(mus, muv, numpy.zeros(1), height, [1, 3])
+        for result in results:
+            assert not numpy.isnan(result[0]).any()
+            assert numpy.isnan(result[1]).all()
+
+    def test_get_atm_variables_zero_sphalb(self):
+        # optical depth rounds to the first (zero) spherical albedo, which cviirs treats as invalid
+        mus = numpy.cos(numpy.radians(numpy.array([30.])))
+        muv = numpy.cos(numpy.radians(numpy.array([20.])))
+        height = numpy.array([16000.])
+        assert _c_getatmvariables(mus[0], muv[0], 0., height[0], 7) is None
+        results = cviirs.get_atm_variables(mus, muv, numpy.zeros(1), height, [7])
+        for result in results:
+            assert numpy.isnan(result).all()
+
+
+def test_interp_dem():
+    rs = numpy.random.RandomState(2)
+    dem = rs.randint(-100, 3000, (18, 36)).astype(numpy.int16)
+    # cviirs indexes past the end of the DEM for exactly -90 latitude or 180 longitude so those aren't compared
+    lats = numpy.array([90., 89.9, 45.3, 0., -44.1, -89.9])
+    lons = numpy.array([-180., -179.9, -95.5, 0., 100.2, 179.9])
+    lat, lon = [x.ravel() for x in numpy.meshgrid(lats, lons)]
+    # fill geolocation is at sea level
+    lat = numpy.append(lat, -999.)
+    lon = numpy.append(lon, -999.)
+    heights = cviirs.interp_dem(lon, lat, dem)
+    expected = [_c_interp_dem(y, x, dem) for y, x in zip(lat, lon)]
+    numpy.testing.assert_array_equal(heights, expected)
+
+
+class TestToFineResolution(object):
+    def test_bilinear_scans(self):
+        rs = numpy.random.RandomState(3)
+        data = rs.uniform(0., 1., (3 * 4, 5))
+        fine = cviirs._to_fine_resolution(data, 2, 4, True)
+        numpy.testing.assert_allclose(fine, _c_to_fine_resolution(data, 2, 4), rtol=1e-12)
+
+        # values never come from a neighboring scan
+        changed = data.copy()
+        changed[4:8] += 10.
+        changed_fine = cviirs._to_fine_resolution(changed, 2, 4, True)
+        numpy.testing.assert_array_equal(changed_fine[:8], fine[:8])
+        numpy.testing.assert_array_equal(changed_fine[16:], fine[16:])
+        numpy.testing.assert_allclose(changed_fine[8:16], fine[8:16] + 10.)
+
+    def test_nearest(self):
+        data = numpy.arange(2 * 4 * 3, dtype=numpy.float64).reshape((8, 3))
+        fine = cviirs._to_fine_resolution(data, 2, 4, False)
+        numpy.testing.assert_array_equal(fine, data.repeat(2, axis=0).repeat(2, axis=1))
+        assert cviirs._to_fine_resolution(data, 1, 4, True) is data
+
+
+class TestRunCrefl(object):
+    def test_m_and_i_bands(self):
+        m_refl, i_refl, lon, lat, solz, sola, senz, sena = _create_swath()
+        m_result, i_result = cviirs.run_crefl([m_refl, i_refl], [1, 8], lon, lat, solz, sola, senz, sena)
+        assert m_result.dtype == numpy.float32
+        assert i_result.shape == i_refl.shape
+        numpy.testing.assert_allclose(m_result, _c_crefl(m_refl, 1, solz, sola, senz, sena), rtol=1e-5, atol=1e-6)
+        numpy.testing.assert_allclose(i_result, _c_crefl(i_refl, 8, solz, sola, senz, sena), rtol=1e-5, atol=1e-6)
+
+    def test_invalid_pixels(self):
+        m_refl, i_refl, lon, lat, solz, sola, senz, sena = _create_swath()
+        m_refl[0, 0] = numpy.nan
+        lon[5, 3] = numpy.nan
+        solz[20, 6] = 88.
+        m_result, i_result = cviirs.run_crefl([m_refl, i_refl], [1, 8], lon, lat, solz, sola, senz, sena)
+        assert numpy.isnan(m_result[0, 0])
+        assert numpy.isnan(m_result[5, 3])
+        assert numpy.isnan(m_result[20, 6])
+        assert numpy.isnan(m_result).sum() == 3
+        # every I band pixel interpolated from an invalid M band pixel is invalid
+        assert numpy.isnan(i_result[10:12, 6:8]).all()
+        assert numpy.isnan(i_result[40:42, 12:14]).all()
+        assert not numpy.isnan(i_result[:4, :4]).any()
+        numpy.testing.assert_allclose(i_result, _c_crefl(i_refl, 8, numpy.where(numpy.isnan(lon), 90., solz),
+                                                         sola, senz, sena), rtol=1e-5, atol=1e-6)
+
+    def test_workers(self):
+        m_refl, i_refl, lon, lat, solz, sola, senz, sena = _create_swath(num_scans=5)
+        solz[30:40] = 88.
+        args = ([m_refl, i_refl], [2, 9], lon, lat, solz, sola, senz, sena)
+        single = cviirs.run_crefl(*args, chunk_scans=1, num_workers=1)
+        multiple = cviirs.run_crefl(*args, chunk_scans=1, num_workers=3)
+        for result1, result2 in zip(single, multiple):
+            numpy.testing.assert_array_equal(result1, result2)
+
+    def test_bad_shapes(self):
+        m_refl, i_refl, lon, lat, solz, sola, senz, sena = _create_swath()
+        with pytest.raises(ValueError):
+            cviirs.run_crefl([m_refl[:-1]], [1], lon, lat, solz, sola, senz, sena)
+        with pytest.raises(ValueError):
+            cviirs.run_crefl([m_refl[:-1]], [1], lon[:-1], lat[:-1], solz[:-1], sola[:-1], senz[:-1], sena[:-1])
@@ -90,7 +90,6 @@ __docformat__ = "restructuredtext en"
 
 import sys
 from datetime import datetime
-from scipy import interpolate
 
 import h5py
 import logging
@@ -188,14 +187,30 @@ def _swath_info(*h5s):
     return zult
 
 
+def _explode_stencil(size, factor):
+    """
+    linear interpolation stencil for upsampling an axis of `size` samples to `size * factor` samples
+    spanning the same first and last sample
+    :return: (lower sample index, weight of the upper sample) for each output sample
+    """
+    pos = np.linspace(0.0, float(size-1), size*factor)
+    lower = np.minimum(pos.astype(np.int64), max(size-2, 0))
+    return lower, pos - lower
+
+
 def _explode(data, factor):
-    rows,cols = data.shape
-    r = np.arange(rows, dtype=np.float64)
-    c = np.arange(cols, dtype=np.float64)
-    rr = np.linspace(0.0, float(rows-1), rows*factor)
-    cc = np.linspace(0.0, float(cols-1), cols*factor)
-    spl = interpolate.RectBivariateSpline(r, c, data, kx=1, ky=1)
-    return spl(rr,cc).astype(np.float32)
+    """
+    bilinearly upsample the first two (rows, cols) axes of `data` by `factor`, any trailing axes (levels)
+    are interpolated with the same stencil at once
+    """
+    data = np.asarray(data, dtype=np.float32)
+    trailing = (slice(None),) + (None,) * (data.ndim - 1)
+    r0, rw = _explode_stencil(data.shape[0], factor)
+    r1 = np.minimum(r0 + 1, data.shape[0] - 1)
+    data = data[r0] + rw[trailing].astype(np.float32) * (data[r1] - data[r0])
+    c0, cw = _explode_stencil(data.shape[1], factor)
+    c1 = np.minimum(c0 + 1, data.shape[1] - 1)
+    return data[:, c0] + cw[trailing[:-1]].astype(np.float32) * (data[:, c1] - data[:, c0])
 
 
 def _make_longitude_monotonic(lon_swath):
@@ -283,16 +298,33 @@ def _layer_at_pressure(h5v, plev=None, p=None, dex=None):
     return h5v[dex, :]
 
 
-def _write_var_to_binary_file(filename, h5_files, var_name, pressure=None):
-    if pressure is not None:
-        plev = h5_files[0]["Plevs"][:].squeeze()
-        dex = np.abs(plev - pressure).argmin()   # FUTURE: memo-ize this value since it shouldn't vary for DR-RTV files
-        LOG.debug('using level %d=%f near %r as %f' % (dex, plev[dex], plev[dex-1:dex+2], pressure))
-        tool = partial(_layer_at_pressure, dex=dex)
-    else:
-        tool = None
-    data = _get_whole_var(h5_files, var_name, tool)
+def _layers_at_indexes(h5v, dexes):
+    """
+    extract several layers of a variable assuming (layer, rows, cols) indexing with a single hyperslab read
+    :param h5v: hdf5 variable object
+    :param dexes: layer indexes to read, in the order they should be returned
+    :return: (len(dexes), rows, cols) array
+    """
+    # h5py point selections need increasing unique indexes
+    unique_dexes, order = np.unique(dexes, return_inverse=True)
+    return h5v[list(unique_dexes), :, :][order.ravel()]
+
 
+def _level_indexes(plev, pressures):
+    """
+    find the index of the layer nearest to each of the requested pressures
+    :param plev: pressure array corresponding to layer dimension
+    :param pressures: pressure level values to find
+    :return: numpy array of layer indexes
+    """
+    pressures = np.asarray(pressures, dtype=np.float64)
+    dexes = np.abs(plev[None, :] - pressures[:, None]).argmin(axis=1)
+    for dex, p in zip(dexes, pressures):
+        LOG.debug('using level %d=%f near %r as %f' % (dex, plev[dex], plev[max(dex-1, 0):dex+2], p))
+    return dexes
+
+
+def _write_data_to_binary_file(filename, data):
     if len(data.shape) != 2:
         LOG.warning('data %r shape is %r, ignoring' % (filename, data.shape))
         return None
@@ -307,6 +339,27 @@ def _write_var_to_binary_file(filename, h5_files, var_name, pressure=None):
     return data.shape
 
 
+def _write_levels_to_binary_files(filenames, h5_files, var_name, pressures):
+    """
+    write several pressure levels of a 3D variable to binary files, reading only those levels from each file
+    :param filenames: output filename for each pressure level
+    :param pressures: pressure level values to find
+    :return: list of data shapes written (None for data that could not be written)
+    """
+    plev = h5_files[0]["Plevs"][:].squeeze()   # levels don't vary between DR-RTV files
+    tool = partial(_layers_at_indexes, dexes=_level_indexes(plev, pressures))
+    # (rows, cols, levels)
+    data = _get_whole_var(h5_files, var_name, tool)
+    return [_write_data_to_binary_file(filename, data[:, :, idx]) for idx, filename in enumerate(filenames)]
+
+
+def _write_var_to_binary_file(filename, h5_files, var_name, pressure=None):
+    if pressure is not None:
+        return _write_levels_to_binary_files([filename], h5_files, var_name, [pressure])[0]
+    data = _get_whole_var(h5_files, var_name, None)
+    return _write_data_to_binary_file(filename, data)
+
+
 PRODUCT_CAPE = "CAPE"
 PRODUCT_CO2_AMOUNT = "CO2_Amount"
 PRODUCT_COT = "COT"
@@ -403,8 +456,13 @@ def _add_level_based_products(lvl_range):
 class Frontend(FrontendRole):
     FILE_EXTENSIONS = (".h5",)
 
-    def __init__(self, level_index_range=(45, 98), **kwargs):
-        _add_level_based_products(all_lvl_ranges[level_index_range[0]: level_index_range[1]])
+    def __init__(self, level_index_range=(45, 98), levels=None, **kwargs):
+        if levels:
+            # only make the levels nearest to the requested pressures available
+            lvl_range = np.array(all_lvl_ranges)[_level_indexes(np.array(all_lvl_ranges), levels)]
+            _add_level_based_products(sorted(set(lvl_range)))
+        else:
+            _add_level_based_products(all_lvl_ranges[level_index_range[0]: level_index_range[1]])
         super(Frontend, self).__init__(**kwargs)
         self._load_files(self.find_files_with_extensions())
 
@@ -456,6 +514,16 @@ class Frontend(FrontendRole):
     def all_product_names(self):
         return PRODUCTS.keys()
 
+    def _check_binary_file(self, product_name):
+        filename = product_name + ".dat"
+        if os.path.isfile(filename):
+            if not self.overwrite_existing:
+                LOG.error("Binary file already exists: %s" % (filename,))
+                raise RuntimeError("Binary file already exists: %s" % (filename,))
+            else:
+                LOG.warning("Binary file already exists, will overwrite: %s", filename)
+        return filename
+
     def create_raw_swath_object(self, product_name, swath_definition):
         product_def = PRODUCTS[product_name]
         # file_type = PRODUCTS.file_type_for_product(product_name, use_terrain_corrected=self.use_terrain_corrected)
@@ -466,23 +534,51 @@ class Frontend(FrontendRole):
         LOG.debug("Getting file key '%s' for product '%s'", file_key, product_name)
 
         LOG.debug("Writing product '%s' data to binary file", product_name)
-        filename = product_name + ".dat"
-        if os.path.isfile(filename):
-            if not self.overwrite_existing:
-                LOG.error("Binary file already exists: %s" % (filename,))
-                raise RuntimeError("Binary file already exists: %s" % (filename,))
-            else:
-                LOG.warning("Binary file already exists, will overwrite: %s", filename)
+        filename = self._check_binary_file(product_name)
 
         try:
-            filename = product_name + ".dat"
             shape = _write_var_to_binary_file(filename, self.file_objects, file_key, pressure=pressure)
-            rows_per_scan = self.rows_per_scan
         except OSError:
             LOG.error("Could not extract data from file")
             LOG.debug("Extraction exception: ", exc_info=True)
             raise
+        return self._raw_swath_product(product_name, swath_definition, filename, shape)
+
+    def create_level_swath_objects(self, product_names, swath_definition):
+        """Create multiple pressure level products at once so each variable's levels are read together.
+
+        :returns: dictionary of product name -> swath product
+        """
+        swath_products = {}
+        written_filenames = []
+        file_keys = [PRODUCTS[product_name].file_key for product_name in product_names]
+        try:
+            for file_key in sorted(set(file_keys)):
+                key_products = [p for p, fk in zip(product_names, file_keys) if fk == file_key]
+                filenames = [self._check_binary_file(product_name) for product_name in key_products]
+                pressures = [PRODUCTS[product_name].pressure for product_name in key_products]
+                LOG.debug("Writing products %r data to binary files", key_products)
+                written_filenames.extend(filenames)
+                try:
+                    shapes = _write_levels_to_binary_files(filenames, self.file_objects, file_key, pressures)
+                except OSError:
+                    LOG.error("Could not extract data from file")
+                    LOG.debug("Extraction exception: ", exc_info=True)
+                    raise
 
+                for product_name, filename, shape in zip(key_products, filenames, shapes):
+                    swath_products[product_name] = self._raw_swath_product(product_name, swath_definition, filename, shape)
+        except (RuntimeError, ValueError, OSError):
+            # the caller creates every product again one at a time, don't leave the files we already wrote behind
+            for filename in written_filenames:
+                if os.path.isfile(filename):
+                    os.remove(filename)
+            raise
+        return swath_products
+
+    def _raw_swath_product(self, product_name, swath_definition, filename, shape):
+        product_def = PRODUCTS[product_name]
+        rows_per_scan = self.rows_per_scan
         one_swath = containers.SwathProduct(
             product_name=product_name, description=product_def.description, units=product_def.units,
             satellite=self.satellite, instrument=self.instrument,
@@ -567,10 +663,23 @@ class Frontend(FrontendRole):
         swath_def = self.create_swath_definition(lon_swath, lat_swath)
         # swath_definitions[swath_def["swath_name"]] = swath_def
 
+        # Create the pressure level products, reading only the needed levels of each variable at once
+        level_products_needed = [p for p in raw_products_needed
+                                 if p not in products_created and getattr(PRODUCTS[p], "pressure", None) is not None]
+        if level_products_needed:
+            try:
+                LOG.info("Creating data products: %s", ", ".join(level_products_needed))
+                products_created.update(self.create_level_swath_objects(level_products_needed, swath_def))
+            except (RuntimeError, ValueError, OSError):
+                LOG.warning("Could not create level products together, creating them one at a time")
+                LOG.debug("Level product exception: ", exc_info=True)
+
         # Create each raw products (products that are loaded directly from the file)
         for product_name in raw_products_needed:
             if product_name in products_created:
-                # already created
+                if product_name in products and product_name not in scene:
+                    # the user wants this product
+                    scene[product_name] = products_created[product_name]
                 continue
 
             try:
@@ -606,6 +715,9 @@ def add_frontend_argument_groups(parser):
                        help="List available frontend products and exit")
     group.add_argument("--level-index-range", nargs=2, type=int, default=(45, 98),
                        help="Start(inclusive) and end(exclusive) index for level ranges to make available (0 -1 for all)")
+    group.add_argument("--levels", nargs="+", type=float, default=None,
+                       help="Pressure levels (mb) to make available, the nearest level is used "
+                            "(overrides --level-index-range)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("-p", "--products", dest="products", nargs="+", default=None, action=ExtendAction,
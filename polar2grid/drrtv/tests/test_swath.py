@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test the DR-RTV frontend's level products and swath upsampling."""
+__docformat__ = "restructuredtext en"
+
+import os
+
+import h5py
+import numpy
+import pytest
+
+from polar2grid.drrtv import swath
+
+NUM_ROWS = 12
+NUM_COLS = 30
+
+
+def _write_drrtv_file(filename, row_offset=0, seed=0):
+    """Write a small DR-RTV file with navigation and two level variables."""
+    rs = numpy.random.RandomState(seed)
+    with h5py.File(filename, "w") as h5:
+        h5["Plevs"] = numpy.array(swath.all_lvl_ranges, dtype=numpy.float32)[:, None]
+        lat, lon = numpy.meshgrid(numpy.linspace(30. + row_offset, 40. + row_offset, NUM_ROWS),
+                                  numpy.linspace(-100., -80., NUM_COLS), indexing="ij")
+        for var_name, data in (("Latitude", lat), ("Longitude", lon)):
+            h5[var_name] = data.astype(numpy.float32)
+            h5[var_name].attrs["missing_value"] = numpy.array([-9999.], dtype=numpy.float32)
+        for var_name in ("RelHum", "TAir"):
+            data = rs.uniform(0., 300., (len(swath.all_lvl_ranges), NUM_ROWS, NUM_COLS)).astype(numpy.float32)
+            data[:, 0, 0] = -9999.
+            h5[var_name] = data
+            h5[var_name].attrs["missing_value"] = numpy.array([-9999.], dtype=numpy.float32)
+    return filename
+
+
+@pytest.fixture
+def drrtv_filenames(tmpdir):
+    return [_write_drrtv_file(str(tmpdir.join("IASI_d20150201_t01%02d00_M02.atm_prof_rtv.h5" % (idx,))),
+                              row_offset=idx * 10, seed=idx) for idx in range(2)]
+
+
+def _load_scene(tmpdir, monkeypatch, work_dir, filenames, products):
+    monkeypatch.chdir(str(tmpdir.mkdir(work_dir)))
+    frontend = swath.Frontend(search_paths=filenames, levels=[100., 500.])
+    scene = frontend.create_scene(products=products)
+    return dict((name, numpy.array(scene[name].get_data_array())) for name in scene)
+
+
+def test_create_scene_level_fallback(drrtv_filenames, tmpdir, monkeypatch):
+    products = ["RelHum_103mb", "RelHum_496mb", "TAir_103mb", "TAir_496mb"]
+    together = _load_scene(tmpdir, monkeypatch, "together", drrtv_filenames, products)
+
+    write_levels_to_binary_files = swath._write_levels_to_binary_files
+    multi_calls = []
+
+    def _fail_after_first_level(filenames, h5_files, var_name, pressures):
+        if len(filenames) > 1:
+            multi_calls.append(var_name)
+            if var_name == "TAir":
+                # one level file is written before there is a swath product to clean it up
+                write_levels_to_binary_files(filenames[:1], h5_files, var_name, pressures[:1])
+                raise OSError("Simulated failure reading TAir")
+        return write_levels_to_binary_files(filenames, h5_files, var_name, pressures)
+    monkeypatch.setattr(swath, "_write_levels_to_binary_files", _fail_after_first_level)
+
+    # the files written before TAir failed must not stop the products being created one at a time
+    one_at_a_time = _load_scene(tmpdir, monkeypatch, "one_at_a_time", drrtv_filenames, products)
+    assert multi_calls == ["RelHum", "TAir"]
+    assert sorted(one_at_a_time) == sorted(together) == sorted(products)
+    for name in products:
+        assert one_at_a_time[name].shape == (2 * NUM_ROWS, NUM_COLS)
+        numpy.testing.assert_array_equal(one_at_a_time[name], together[name])
+    assert numpy.isnan(together["TAir_496mb"][0, 0])
+
+
+def test_create_level_swath_objects_cleanup(drrtv_filenames, tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    frontend = swath.Frontend(search_paths=drrtv_filenames, levels=[100., 500.])
+    # an existing output file for a later variable fails the whole call
+    with open("TAir_496mb.dat", "w") as existing_file:
+        existing_file.write("existing")
+    with pytest.raises(RuntimeError):
+        frontend.create_level_swath_objects(["RelHum_103mb", "RelHum_496mb", "TAir_496mb"], None)
+    assert sorted(fn for fn in os.listdir(".") if fn.endswith(".dat")) == ["TAir_496mb.dat"]
+    with open("TAir_496mb.dat") as existing_file:
+        assert existing_file.read() == "existing"
+
+
+def _spline_explode(data, factor):
+    """Upsample a 2D array the way `_explode` did before it used an interpolation stencil."""
+    interpolate = pytest.importorskip("scipy.interpolate")
+    rows, cols = data.shape
+    spl = interpolate.RectBivariateSpline(numpy.arange(rows, dtype=numpy.float64),
+                                          numpy.arange(cols, dtype=numpy.float64), data, kx=1, ky=1)
+    return spl(numpy.linspace(0.0, float(rows - 1), rows * factor),
+               numpy.linspace(0.0, float(cols - 1), cols * factor)).astype(numpy.float32)
+
+
+@pytest.mark.parametrize("shape", [(5, 7), (4, 6, 3), (2, 2), (2, 9, 2)])
+@pytest.mark.parametrize("factor", [1, 3, 8])
+def test_explode(shape, factor):
+    data = numpy.random.RandomState(0).uniform(-90., 300., shape).astype(numpy.float32)
+    exploded = swath._explode(data, factor)
+    assert exploded.dtype == numpy.float32
+    assert exploded.shape == (shape[0] * factor, shape[1] * factor) + shape[2:]
+    levels = [data] if data.ndim == 2 else [data[:, :, idx] for idx in range(shape[2])]
+    for idx, level in enumerate(levels):
+        result = exploded if data.ndim == 2 else exploded[:, :, idx]
+        numpy.testing.assert_allclose(result, _spline_explode(level, factor), rtol=1e-5, atol=1e-4)
@@ -188,137 +188,13 @@ def main_backend(argv=sys.argv[1:]):
     return 0
 
 
-def main(argv=sys.argv[1:]):
-    from polar2grid.core.script_utils import setup_logging, create_basic_parser, create_exc_handler, rename_log_file, ExtendAction
-    from polar2grid.compositors import CompositorManager
-    frontends = available_frontends()
-    backends = available_backends()
-    parser = create_basic_parser(description="Extract swath data, remap it, and write it to a new file format")
-    parser.add_argument("frontend", choices=sorted(frontends.keys()),
-                        help="Specify the swath extractor to use to read data (additional arguments are determined after this is specified)")
-    parser.add_argument("backend", choices=sorted(backends.keys()),
-                        help="Specify the backend to use to write data output (additional arguments are determined after this is specified)")
-    parser.add_argument("--compositor-configs", nargs="*", default=None,
-                        help="Specify alternative configuration file(s) for compositors")
-    # don't include the help flag
-    argv_without_help = [x for x in argv if x not in ["-h", "--help"]]
-    args, remaining_args = parser.parse_known_args(argv_without_help)
-    glue_name = args.frontend + "2" + args.backend
-    LOG = logging.getLogger(glue_name)
+def process_frontend(f, args, glue_name, remapper, remap_kwargs, forced_grids, backend, compositor_objects):
+    """Create a swath scene from an initialized frontend, remap it, and write it with the backend.
 
-    # Load compositor information (we can't know the compositor choices until we've loaded the configuration)
-    compositor_manager = CompositorManager(config_files=args.compositor_configs)
-    # Hack: argparse doesn't let you use choices and nargs=* on a positional argument
-    parser.add_argument("compositors", choices=list(compositor_manager.keys()) + [[]], nargs="*",
-                        help="Specify the compositors to apply to the provided scene (additional arguments are determined after this is specified)")
-
-    # load the actual components we need
-    farg_func = get_frontend_argument_func(frontends, args.frontend)
-    fcls = get_frontend_class(frontends, args.frontend)
-    barg_func = get_backend_argument_func(backends, args.backend)
-    bcls = get_backend_class(backends, args.backend)
-
-    # add_frontend_arguments(parser)
-    subgroup_titles = []
-    subgroup_titles += farg_func(parser)
-    subgroup_titles += add_remap_argument_groups(parser)
-    subgroup_titles += barg_func(parser)
-
-    parser.add_argument('-f', dest='data_files', nargs="+", default=[], action=ExtendAction,
-                        help="List of files or directories to extract data from")
-    parser.add_argument('-d', dest='data_files', nargs="+", default=[], action=ExtendAction,
-                        help="Data directories to look for input data files (equivalent to -f)")
-    global_keywords = ("keep_intermediate", "overwrite_existing", "exit_on_error")
-    args = parser.parse_args(argv, global_keywords=global_keywords, subgroup_titles=subgroup_titles)
-
-    if not args.data_files:
-        # FUTURE: When the -d flag is removed this won't be needed because -f will be required
-        parser.print_usage()
-        parser.exit(1, "ERROR: No data files provided (-f flag)\n")
-
-    # Logs are renamed once data the provided start date is known
-    rename_log = False
-    if args.log_fn is None:
-        rename_log = True
-        args.log_fn = glue_name + "_fail.log"
-    levels = [logging.ERROR, logging.WARN, logging.INFO, logging.DEBUG]
-    setup_logging(console_level=levels[min(3, args.verbosity)], log_filename=args.log_fn)
-    sys.excepthook = create_exc_handler(LOG.name)
-    LOG.debug("Starting script with arguments: %s", " ".join(sys.argv))
-
-    # Keep track of things going wrong to tell the user what went wrong (we want to create as much as possible)
+    :returns: status code for the processing of this scene
+    """
+    LOG = logging.getLogger(glue_name)
     status_to_return = STATUS_SUCCESS
-
-    # Compositor validation
-    # XXX: Hack to make `polar2grid.sh crefl gtiff` work like legacy crefl2gtiff.sh script
-    if args.subgroup_args['Frontend Swath Extraction'].get('no_compositors'):
-        LOG.debug("Removing all compositors")
-        args.compositors = []
-    elif args.frontend == 'crefl':
-        if args.backend in ['awips', 'scmi']:
-            LOG.debug("Adding 'crefl_sharpen' compositor")
-            args.compositors.append('crefl_sharpen' if args.backend == 'scmi' else 'crefl_sharpen_awips')
-        else:
-            LOG.debug("Adding 'true_color' compositor")
-            args.compositors.append('true_color')
-            if '--true-color' in sys.argv and 'true_color' not in args.compositors:
-                LOG.debug("Adding 'true_color' compositor")
-                args.compositors.append('true_color')
-            if '--false-color' in sys.argv and 'false_color' not in args.compositors:
-                LOG.debug("Adding 'false_color' compositor")
-                args.compositors.append('false_color')
-
-    # if "--true-color" in
-    for c in args.compositors:
-        if c not in compositor_manager:
-            LOG.error("Compositor '%s' is unknown" % (c,))
-            raise RuntimeError("Compositor '%s' is unknown" % (c,))
-
-    # Frontend
-    try:
-        LOG.info("Initializing reader...")
-        list_products = args.subgroup_args["Frontend Initialization"].pop("list_products")
-        f = fcls(search_paths=args.data_files, **args.subgroup_args["Frontend Initialization"])
-    except (ValueError, KeyError):
-        LOG.debug("Frontend exception: ", exc_info=True)
-        LOG.error("%s frontend failed to load and sort data files (see log for details)", args.frontend)
-        return STATUS_FRONTEND_FAIL
-
-    # Rename the log file
-    if rename_log:
-        rename_log_file(glue_name + f.begin_time.strftime("_%Y%m%d_%H%M%S.log"))
-
-    if list_products:
-        print("\n".join(sorted(f.available_product_names)))
-        return STATUS_SUCCESS
-
-    try:
-        LOG.info("Initializing remapping...")
-        remapper = Remapper(**args.subgroup_args["Remapping Initialization"])
-        remap_kwargs = args.subgroup_args["Remapping"]
-    except (ValueError, KeyError):
-        LOG.debug("Remapping initialization exception: ", exc_info=True)
-        LOG.error("Remapping initialization failed (see log for details)")
-        return STATUS_REMAP_FAIL
-
-    try:
-        LOG.info("Initializing backend...")
-        backend = bcls(**args.subgroup_args["Backend Initialization"])
-    except (ValueError, KeyError):
-        LOG.debug("Writer initialization exception: ", exc_info=True)
-        LOG.error("Writer initialization failed (see log for details)")
-        return STATUS_BACKEND_FAIL
-
-    try:
-        LOG.info("Initializing compositor objects...")
-        compositor_objects = {}
-        for c in args.compositors:
-            compositor_objects[c] = compositor_manager.get_compositor(c, **args.global_kwargs)
-    except (ValueError, KeyError):
-        LOG.debug("Compositor initialization exception: ", exc_info=True)
-        LOG.error("Compositor initialization failed (see log for details)")
-        return STATUS_COMP_FAIL
-
     try:
         LOG.info("Extracting swaths from data files available...")
         scene = f.create_scene(**args.subgroup_args["Frontend Swath Extraction"])
@@ -355,7 +231,7 @@ def main(argv=sys.argv[1:]):
     # What grids should we remap to (the user should tell us or the backend should have a good set of defaults)
     known_grids = backend.known_grids
     LOG.debug("Writer known grids: %r", known_grids)
-    grids = remap_kwargs.pop("forced_grids", None)
+    grids = forced_grids
     LOG.debug("Forced Grids: %r", grids)
     if resample_method == "sensor" and grids != ["sensor"]:
         LOG.error("'sensor' resampling method only supports the 'sensor' grid")
@@ -496,5 +372,163 @@ def main(argv=sys.argv[1:]):
     return status_to_return
 
 
+def main(argv=sys.argv[1:]):
+    from polar2grid.core.script_utils import setup_logging, create_basic_parser, create_exc_handler, rename_log_file, ExtendAction
+    from polar2grid.compositors import CompositorManager
+    frontends = available_frontends()
+    backends = available_backends()
+    parser = create_basic_parser(description="Extract swath data, remap it, and write it to a new file format")
+    parser.add_argument("frontend", choices=sorted(frontends.keys()),
+                        help="Specify the swath extractor to use to read data (additional arguments are determined after this is specified)")
+    parser.add_argument("backend", choices=sorted(backends.keys()),
+                        help="Specify the backend to use to write data output (additional arguments are determined after this is specified)")
+    parser.add_argument("--compositor-configs", nargs="*", default=None,
+                        help="Specify alternative configuration file(s) for compositors")
+    # don't include the help flag
+    argv_without_help = [x for x in argv if x not in ["-h", "--help"]]
+    args, remaining_args = parser.parse_known_args(argv_without_help)
+    glue_name = args.frontend + "2" + args.backend
+    LOG = logging.getLogger(glue_name)
+
+    # Load compositor information (we can't know the compositor choices until we've loaded the configuration)
+    compositor_manager = CompositorManager(config_files=args.compositor_configs)
+    # Hack: argparse doesn't let you use choices and nargs=* on a positional argument
+    parser.add_argument("compositors", choices=list(compositor_manager.keys()) + [[]], nargs="*",
+                        help="Specify the compositors to apply to the provided scene (additional arguments are determined after this is specified)")
+
+    # load the actual components we need
+    farg_func = get_frontend_argument_func(frontends, args.frontend)
+    fcls = get_frontend_class(frontends, args.frontend)
+    barg_func = get_backend_argument_func(backends, args.backend)
+    bcls = get_backend_class(backends, args.backend)
+
+    # add_frontend_arguments(parser)
+    subgroup_titles = []
+    subgroup_titles += farg_func(parser)
+    subgroup_titles += add_remap_argument_groups(parser)
+    subgroup_titles += barg_func(parser)
+
+    parser.add_argument('-f', dest='data_files', nargs="+", default=[], action=ExtendAction,
+                        help="List of files or directories to extract data from")
+    parser.add_argument('-d', dest='data_files', nargs="+", default=[], action=ExtendAction,
+                        help="Data directories to look for input data files (equivalent to -f)")
+    parser.add_argument('--split-orbits', dest='split_orbits', action='store_true',
+                        help="Process each orbit in the input data as a separate scene (if supported by the frontend)")
+    global_keywords = ("keep_intermediate", "overwrite_existing", "exit_on_error")
+    args = parser.parse_args(argv, global_keywords=global_keywords, subgroup_titles=subgroup_titles)
+
+    if not args.data_files:
+        # FUTURE: When the -d flag is removed this won't be needed because -f will be required
+        parser.print_usage()
+        parser.exit(1, "ERROR: No data files provided (-f flag)\n")
+
+    # Logs are renamed once data the provided start date is known
+    rename_log = False
+    if args.log_fn is None:
+        rename_log = True
+        args.log_fn = glue_name + "_fail.log"
+    levels = [logging.ERROR, logging.WARN, logging.INFO, logging.DEBUG]
+    setup_logging(console_level=levels[min(3, args.verbosity)], log_filename=args.log_fn)
+    sys.excepthook = create_exc_handler(LOG.name)
+    LOG.debug("Starting script with arguments: %s", " ".join(sys.argv))
+
+    # Keep track of things going wrong to tell the user what went wrong (we want to create as much as possible)
+    status_to_return = STATUS_SUCCESS
+
+    # Compositor validation
+    # XXX: Hack to make `polar2grid.sh crefl gtiff` work like legacy crefl2gtiff.sh script
+    if args.subgroup_args['Frontend Swath Extraction'].get('no_compositors'):
+        LOG.debug("Removing all compositors")
+        args.compositors = []
+    elif args.frontend == 'crefl':
+        if args.backend in ['awips', 'scmi']:
+            LOG.debug("Adding 'crefl_sharpen' compositor")
+            args.compositors.append('crefl_sharpen' if args.backend == 'scmi' else 'crefl_sharpen_awips')
+        else:
+            LOG.debug("Adding 'true_color' compositor")
+            args.compositors.append('true_color')
+            if '--true-color' in sys.argv and 'true_color' not in args.compositors:
+                LOG.debug("Adding 'true_color' compositor")
+                args.compositors.append('true_color')
+            if '--false-color' in sys.argv and 'false_color' not in args.compositors:
+                LOG.debug("Adding 'false_color' compositor")
+                args.compositors.append('false_color')
+
+    # if "--true-color" in
+    for c in args.compositors:
+        if c not in compositor_manager:
+            LOG.error("Compositor '%s' is unknown" % (c,))
+            raise RuntimeError("Compositor '%s' is unknown" % (c,))
+
+    # Frontend
+    try:
+        LOG.info("Initializing reader...")
+        frontend_kwargs = args.subgroup_args["Frontend Initialization"]
+        list_products = frontend_kwargs.pop("list_products")
+        f = fcls(search_paths=args.data_files, **frontend_kwargs)
+    except (ValueError, KeyError):
+        LOG.debug("Frontend exception: ", exc_info=True)
+        LOG.error("%s frontend failed to load and sort data files (see log for details)", args.frontend)
+        return STATUS_FRONTEND_FAIL
+
+    # Rename the log file
+    if rename_log:
+        rename_log_file(glue_name + f.begin_time.strftime("_%Y%m%d_%H%M%S.log"))
+
+    if list_products:
+        print("\n".join(sorted(f.available_product_names)))
+        return STATUS_SUCCESS
+
+    try:
+        LOG.info("Initializing remapping...")
+        remapper = Remapper(**args.subgroup_args["Remapping Initialization"])
+        remap_kwargs = args.subgroup_args["Remapping"]
+    except (ValueError, KeyError):
+        LOG.debug("Remapping initialization exception: ", exc_info=True)
+        LOG.error("Remapping initialization failed (see log for details)")
+        return STATUS_REMAP_FAIL
+
+    try:
+        LOG.info("Initializing backend...")
+        backend = bcls(**args.subgroup_args["Backend Initialization"])
+    except (ValueError, KeyError):
+        LOG.debug("Writer initialization exception: ", exc_info=True)
+        LOG.error("Writer initialization failed (see log for details)")
+        return STATUS_BACKEND_FAIL
+
+    try:
+        LOG.info("Initializing compositor objects...")
+        compositor_objects = {}
+        for c in args.compositors:
+            compositor_objects[c] = compositor_manager.get_compositor(c, **args.global_kwargs)
+    except (ValueError, KeyError):
+        LOG.debug("Compositor initialization exception: ", exc_info=True)
+        LOG.error("Compositor initialization failed (see log for details)")
+        return STATUS_COMP_FAIL
+
+    # Each orbit is processed as an independent scene, one after the other, because intermediate files are named
+    # by product
+    orbit_search_paths = f.orbit_search_paths() if args.split_orbits else [args.data_files]
+    forced_grids = remap_kwargs.pop("forced_grids", None)
+    for orbit_idx, search_paths in enumerate(orbit_search_paths):
+        if len(orbit_search_paths) > 1:
+            LOG.info("Processing orbit %d of %d...", orbit_idx + 1, len(orbit_search_paths))
+            try:
+                f = fcls(search_paths=search_paths, **frontend_kwargs)
+            except (ValueError, KeyError):
+                LOG.debug("Frontend exception: ", exc_info=True)
+                LOG.error("%s frontend failed to load and sort data files (see log for details)", args.frontend)
+                status_to_return |= STATUS_FRONTEND_FAIL
+                if args.exit_on_error:
+                    return status_to_return
+                continue
+
+        status_to_return |= process_frontend(f, args, glue_name, remapper, remap_kwargs, forced_grids, backend,
+                                             compositor_objects)
+        if status_to_return != STATUS_SUCCESS and args.exit_on_error:
+            return status_to_return
+    return status_to_return
+
+
 if __name__ == "__main__":
     sys.exit(main())
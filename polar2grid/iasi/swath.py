@@ -55,6 +55,9 @@ def real4fromvalue(x): return np.array([x],np.float32)
 def real4sfromdatetimes(L):
     return np.array([x.hour + x.minute/60. + x.second/3600. + x.microsecond/3.6e9 for x in L],np.float32)
 
+# numpy types for the fbf extensions, used when writing whole blocks of records
+FBF_EXT_DTYPES = {'.real4': np.float32, '.real8': np.float64, '.int4': np.int32}
+
 
 # FUTURE: make this into a generic fbf_writer that takes the table as a constructor parameter; add to fbf toolbox
 class fbf_writer(object):
@@ -134,6 +137,20 @@ class fbf_writer(object):
             if field_name not in self._ignore:
                 self._append(field_name, getattr(record,field_name))
 
+    def write_block(self,block):
+        """write a numpy structured array of records (one element per record) with one write per field,
+        producing the same files as calling this object with each record
+        """
+        for field_name in self._info.keys():
+            if field_name in self._ignore or field_name not in block.dtype.names or not len(block):
+                continue
+            stem, ext, _ = self._info[field_name]
+            if not stem: stem = field_name
+            if field_name not in self._files:
+                self._files[field_name] = self._create(stem, ext, block[field_name][0])
+            LOG.debug('writing %d records of %s' % (len(block), field_name))
+            block[field_name].astype(FBF_EXT_DTYPES[ext]).tofile(self._files[field_name])
+
 
 # example dictionary in cloud_dict
 # (22,29,2):
@@ -279,14 +296,21 @@ def extract_sounding(output_directory, detector_number=None, as_scan_lines=True,
             write = iasi_record_fbf_writer(output_directory, detector_number, comment, ignore=ignore or [], use_cloud=use_cloud, use_clusters=has_clusters)
 
         prod = iasi.open_product(filename)
-        if not as_scan_lines:
-            datagen = iasi.sounder_records(prod, detector_number, lines, cloud_dict = cloud_dict)
-        else:
-            datagen = iasi.sounder_scanlines(prod, detector_number, lines, cloud_dict = cloud_dict)
         if iis_images:
             tiles = iasi.imager_tiles(prod)
             LOG.debug("writing IIS tiles %s as one record" % str(tiles.GIrcImage.shape))
             write.write_iis(tiles)
+        if not as_scan_lines:
+            # one record per sounding: decode blocks of scan lines as structured arrays and write them in bulk
+            write.write_wavenumbers(iasi.sounder_wavenumbers(prod)[0]) # only does it once
+            for block in iasi.sounder_record_blocks(prod, detector_number, lines, cloud_dict = cloud_dict,
+                                                    with_radiances = 'radiances' not in (ignore or [])):
+                write.write_block(block)
+                rec_num += len(block)
+                print('wrote %5d records..   \r' % (rec_num,))
+                sys.stdout.flush()
+            continue
+        datagen = iasi.sounder_scanlines(prod, detector_number, lines, cloud_dict = cloud_dict)
         for record in datagen:
             LOG.debug(str(record))
             write( record )
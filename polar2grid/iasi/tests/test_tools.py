@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test reading IASI soundings as blocks of scan lines."""
+__docformat__ = "restructuredtext en"
+
+import os
+import re
+from datetime import datetime, timedelta
+
+import numpy
+import pytest
+
+from polar2grid.iasi import swath, tools
+
+NUM_WAVENUMBERS = 8
+QUERY_RE = re.compile(r"(mdr-1c\[\d+\])\.(\w+)((?:\[\d*\])*)$")
+
+
+class _FakeScaleFactors(object):
+    IDefScaleSondNbScale = 2
+    IDefScaleSondNsfirst = [1, 5]
+    IDefScaleSondNslast = [4, 8]
+    IDefScaleSondScaleFactor = [5, 7]
+
+
+class _FakeProduct(object):
+    """Answer the record queries made by the sounder readers from arrays of random data."""
+    def __init__(self, num_lines, seed=0):
+        rs = numpy.random.RandomState(seed)
+        self._records_ = {"mdr-1c": ["mdr-1c[%d]" % idx for idx in range(num_lines)]}
+        self.records = {}
+        start = datetime(2015, 2, 1, 1, 2, 3, 456789)
+        for idx, record_name in enumerate(self._records_["mdr-1c"]):
+            record = {
+                "OnboardUTC": [start + timedelta(seconds=8 * idx, microseconds=214286 * field)
+                               for field in range(30)],
+                "GGeoSondLoc": numpy.stack([rs.uniform(-180., 180., (30, 4)), rs.uniform(-90., 90., (30, 4))], -1),
+                "GGeoSondAnglesMETOP": rs.uniform(0., 360., (30, 4, 2)),
+                "GGeoSondAnglesSUN": rs.uniform(0., 360., (30, 4, 2)),
+                "GS1cSpect": rs.randint(-2000, 30000, (30, 4, NUM_WAVENUMBERS)).astype(numpy.int16),
+                "GQisFlagQual": rs.randint(0, 3, (30, 4)).astype(numpy.int8),
+            }
+            for name in tools.CLOUD_MASK_PRODUCTS:
+                record[name] = rs.uniform(0., 100., (30, 4)).astype(numpy.float32)
+            self.records[record_name] = record
+
+    def get(self, query):
+        if query == "giadr-scalefactors":
+            return _FakeScaleFactors
+        record_name, field, indexes = QUERY_RE.match(query).groups()
+        if field.startswith("IDef"):
+            return {"IDefNsfirst1b": 1, "IDefNslast1b": NUM_WAVENUMBERS, "IDefSpectDWn1b": 25}[field]
+        data = self.records[record_name][field]
+        if not indexes:
+            return data
+        return data[tuple(slice(None) if not idx else int(idx) for idx in re.findall(r"\[(\d*)\]", indexes))]
+
+
+def _records_as_arrays(prod, detector_number, line_indices, cloud_dict):
+    """Copy the fields of every iasi_record yielded by `sounder_records` (it reuses one record object)."""
+    names = ["scan_number", "detector_number", "longitude", "latitude", "metop_zenith_angle",
+             "metop_azimuth_angle", "sun_zenith_angle", "sun_azimuth_angle", "radiances",
+             "quality_flag"] + tools.CLOUD_MASK_PRODUCTS + list(cloud_dict[(0, 0, 0)].keys())
+    fields = dict((name, []) for name in names + ["time", "epoch"])
+    for record in tools.sounder_records(prod, detector_number, line_indices, cloud_dict=cloud_dict):
+        for name in names:
+            fields[name].append(numpy.array(getattr(record, name)))
+        fields["time"].append(swath.real4sfromdatetimes(record.time)[0])
+        fields["epoch"].append(record.epoch[0])
+    return dict((name, numpy.array(values)) for name, values in fields.items())
+
+
+def _cloud_dict(prod):
+    cloud_dict = {}
+    for record_idx in range(len(prod._records_["mdr-1c"])):
+        for field in range(30):
+            for detector in range(4):
+                value = record_idx + field / 100. + detector / 1000.
+                cloud_dict[(record_idx, field, detector)] = dict(
+                    (name, value + offset) for offset, name in enumerate(sorted(swath.iasi_record_fbf_writer.CLOUD_FBF_FILENAMES)))
+    return cloud_dict
+
+
+@pytest.mark.parametrize(("detector_number", "line_indices", "block_lines"), [
+    (None, None, 4),
+    (2, None, 4),
+    (None, [0, 2, 3, 5, 8, 9, 10], 3),
+    (1, [1, 4, 6, 7, 10], 2),
+])
+def test_sounder_record_blocks(tmpdir, detector_number, line_indices, block_lines):
+    prod = _FakeProduct(11)
+    cloud_dict = _cloud_dict(prod)
+    expected = _records_as_arrays(prod, detector_number, line_indices, cloud_dict)
+    blocks = list(tools.sounder_record_blocks(prod, detector_number, line_indices, cloud_dict=cloud_dict,
+                                              block_lines=block_lines))
+    num_lines = len(line_indices) if line_indices is not None else 11
+    soundings_per_line = 120 if detector_number is None else 30
+    # the last block only has some of the scan lines
+    assert num_lines % block_lines
+    assert [len(block) for block in blocks[:-1]] == [block_lines * soundings_per_line] * (len(blocks) - 1)
+    assert len(blocks[-1]) == (num_lines % block_lines) * soundings_per_line
+
+    block = numpy.concatenate(blocks)
+    assert len(block) == len(expected["latitude"])
+    for name, expected_data in expected.items():
+        if name == "time":
+            numpy.testing.assert_array_equal(block[name].astype(numpy.float32), expected_data)
+        elif name == "radiances":
+            numpy.testing.assert_array_equal(block[name], expected_data.astype(numpy.float32))
+        else:
+            numpy.testing.assert_array_equal(block[name], expected_data.reshape(block[name].shape))
+    if detector_number is not None:
+        assert (block["detector_number"] == detector_number).all()
+    assert numpy.isin(block["detector_number"], range(4)).all()
+
+    # writing whole blocks produces the same files as writing each record
+    record_dir = str(tmpdir.join("records"))
+    block_dir = str(tmpdir.join("blocks"))
+    record_writer = swath.iasi_record_fbf_writer(record_dir, detector_number, use_cloud=True)
+    for record in tools.sounder_records(prod, detector_number, line_indices, cloud_dict=cloud_dict):
+        record_writer(record)
+    block_writer = swath.iasi_record_fbf_writer(block_dir, detector_number, use_cloud=True)
+    for block in tools.sounder_record_blocks(prod, detector_number, line_indices, cloud_dict=cloud_dict,
+                                             block_lines=block_lines):
+        block_writer.write_block(block)
+    for writer in (record_writer, block_writer):
+        for file_obj in writer._files.values():
+            file_obj.close()
+
+    assert sorted(os.listdir(block_dir)) == sorted(os.listdir(record_dir))
+    assert "surface_temp.real4" in os.listdir(block_dir)
+    assert "radiances.real4.%d" % (NUM_WAVENUMBERS,) in os.listdir(block_dir)
+    for fn in os.listdir(record_dir):
+        with open(os.path.join(record_dir, fn), "rb") as record_file, open(os.path.join(block_dir, fn), "rb") as block_file:
+            assert block_file.read() == record_file.read(), fn
@@ -124,11 +124,11 @@ def scale_scanline(prod, spectra=None, factor_table = None):
         scaling = prod.get('giadr-scalefactors')
         nscales = scaling.IDefScaleSondNbScale
         offset = scaling.IDefScaleSondNsfirst[0]
-        factor_table = zip( range(nscales),
+        factor_table = list(zip( range(nscales),
                             array(scaling.IDefScaleSondNsfirst)-offset,
                             array(scaling.IDefScaleSondNslast)-offset+1,
                             array(scaling.IDefScaleSondScaleFactor)
-                            )
+                            ))
     if spectra is not None:
         for _,start,end,factor in factor_table:
             spectra[:,start:end] *= 10.**(-factor+5)  # UW scaling preferred has a 1e5 difference : nets us mW/m2 sr cm-1
@@ -355,6 +355,79 @@ def sounder_records(prod, detector_number=None, line_indices = None, only_geotem
                     setattr(R,k, cloud_dict[(R.record_index,R.scan_number,R.detector_number)][k] )
             yield R
 
+# number of scan lines decoded at a time by sounder_record_blocks
+SOUNDER_BLOCK_LINES = 8
+
+def _read_sounding_block(prod, record_names, query, dtype=None, remap=True):
+    """read query (a format string taking the record name) for each record and return one row per sounding
+    in the same order as sounder_records. remap splits the 4 detectors of each record into pseudo-scanlines.
+    """
+    data = array([prod.get(query.format(record_name)) for record_name in record_names], dtype)
+    if remap:
+        data = ifov_remap(data)
+    return data.reshape((-1,) + data.shape[2:])
+
+def sounder_record_blocks(prod, detector_number=None, line_indices = None, only_geotemporal = False, cloud_dict = None,
+                          with_radiances = True, block_lines = SOUNDER_BLOCK_LINES):
+    """iterate blocks of scan lines in a file, returning the same soundings as sounder_records as one numpy
+    structured array per block (one element per sounding) instead of an iasi_record per sounding.
+    time is in hours of the day and epoch is in whole seconds, the same as sounder_records.
+    with_radiances=False skips reading the spectra
+    """
+    all_detectors = detector_number is None
+    det = '' if all_detectors else '%d' % detector_number
+    if line_indices is not None:
+        lines = ['mdr-1c[%d]' % x for x in line_indices]
+    else:
+        lines = list(prod._records_['mdr-1c'])
+    crib = None
+    for start in range(0, len(lines), block_lines):
+        record_names = lines[start:start+block_lines]
+        fields = [ ]
+        utc = array([prod.get('%s.OnboardUTC' % (record_name,)) for record_name in record_names])
+        if all_detectors:
+            # both pseudo-scanlines have the field of regard time for each of their 2 detectors
+            utc = np.broadcast_to(utc.repeat(2, axis=1)[:, None, :], (len(record_names), 2, 60))
+        utc = np.array(utc.ravel().tolist(), dtype='datetime64[us]')
+        per_line = utc.size // len(record_names)
+        record_index = repeat([int( *RE_RECORD_INDEX.findall(record_name) ) for record_name in record_names], per_line)
+        if all_detectors:
+            scan_number = np.tile(repeat(arange(30), 2), 2*len(record_names))
+            detector = ifov_remap(np.broadcast_to(arange(4), (len(record_names), 30, 4))).ravel()
+        else:
+            scan_number = np.tile(arange(30), len(record_names))
+            detector = np.full(scan_number.shape, detector_number)
+        fields.append(('scan_number', scan_number))
+        fields.append(('detector_number', detector))
+        fields.append(('time', (utc - utc.astype('datetime64[D]')).astype(np.int64) / 3.6e9))
+        fields.append(('epoch', utc.astype('datetime64[s]').astype(np.int64).astype(float64)))
+
+        loc = _read_sounding_block(prod, record_names, '{0}.GGeoSondLoc[][%s][]' % det, remap=all_detectors)
+        metop = _read_sounding_block(prod, record_names, '{0}.GGeoSondAnglesMETOP[][%s][]' % det, remap=all_detectors)
+        sun = _read_sounding_block(prod, record_names, '{0}.GGeoSondAnglesSUN[][%s][]' % det, remap=all_detectors)
+        fields += [('longitude', loc[:,0]), ('latitude', loc[:,1]),
+                   ('metop_zenith_angle', metop[:,0]), ('metop_azimuth_angle', metop[:,1]),
+                   ('sun_zenith_angle', sun[:,0]), ('sun_azimuth_angle', sun[:,1])]
+
+        if not only_geotemporal:
+            if with_radiances:
+                spectra = _read_sounding_block(prod, record_names, '{0}.GS1cSpect[][%s][]' % det, float64, all_detectors)
+                crib = scale_scanline(prod, spectra, crib)
+                fields.append(('radiances', spectra.astype(float32)))
+            # NOTE: single detector records have the quality flags for all 4 detectors
+            fields.append(('quality_flag', _read_sounding_block(prod, record_names, '{0}.GQisFlagQual[][]', int8, all_detectors)))
+            for name in CLOUD_MASK_PRODUCTS:
+                fields.append((name, _read_sounding_block(prod, record_names, '{0}.%s[][%s]' % (name, det), remap=all_detectors)))
+        if cloud_dict:
+            keys = [(ri, sn, dn) for ri, sn, dn in zip(record_index, scan_number, detector)]
+            for k in cloud_dict[(0,0,0)].keys():
+                fields.append((k, array([cloud_dict[key][k] for key in keys])))
+
+        block = empty(utc.size, dtype=[(name, data.dtype, data.shape[1:]) for name, data in fields])
+        for name, data in fields:
+            block[name] = data
+        yield block
+
 def sounder_timerange(prod):
     """return min and max time range for the data in the product
     """
@@ -175,8 +175,11 @@ from datetime import datetime
 from netCDF4 import Dataset
 
 import logging
+import multiprocessing
 import numpy as np
 import os
+import zipfile
+from hashlib import md5
 
 from polar2grid.core import containers, roles
 from polar2grid.core.frontend_utils import BaseMultiFileReader, BaseFileReader, ProductDict, GeoPairDict
@@ -258,16 +261,25 @@ FILE_STRUCTURE = {
 
 LIMB_SEA_FILE = os.environ.get("ATMS_LIMB_SEA", "polar2grid.mirs:limball_atmssea.txt")
 LIMB_LAND_FILE = os.environ.get("ATMS_LIMB_LAND", "polar2grid.mirs:limball_atmsland.txt")
+# Where binary versions of the limb correction coefficient files are cached (per user)
+LIMB_CACHE_DIR = os.environ.get("ATMS_LIMB_CACHE_DIR", os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "polar2grid", "atms_limb"))
 
 
-def read_atms_limb_correction_coefficients(fn):
+def _read_limb_correction_text(fn):
     if os.path.isfile(fn):
-        coeff_str = open(fn, "r").readlines()
-    else:
-        parts = fn.split(":")
-        mod_part, file_part = parts if len(parts) == 2 else ("", parts[0])
-        mod_part = mod_part or __package__  # self.__module__
-        coeff_str = get_resource_string(mod_part, file_part).decode().split("\n")
+        with open(fn, "r") as coeff_file:
+            return coeff_file.read()
+    parts = fn.split(":")
+    mod_part, file_part = parts if len(parts) == 2 else ("", parts[0])
+    mod_part = mod_part or __package__  # self.__module__
+    return get_resource_string(mod_part, file_part).decode()
+
+
+def read_atms_limb_correction_coefficients(fn, coeff_text=None):
+    if coeff_text is None:
+        coeff_text = _read_limb_correction_text(fn)
+    coeff_str = coeff_text.split("\n")
     # make it a generator
     coeff_str = (line.strip() for line in coeff_str)
 
@@ -308,23 +320,119 @@ def read_atms_limb_correction_coefficients(fn):
     return all_dmean, all_coeffs, all_amean, all_nchx, all_nchanx
 
 
-def apply_atms_limb_correction(datasets, dmean, coeffs, amean, nchx, nchanx):
-    all_new_ds = []
-    coeff_sum = np.zeros(datasets.shape[1], dtype=datasets[0].dtype)
-    for channel_idx in range(datasets.shape[0]):
-        ds = datasets[channel_idx]
-        new_ds = ds.copy()
-        all_new_ds.append(new_ds)
-        for fov_idx in range(96):
-            coeff_sum[:] = 0
-            for k in range(nchx[channel_idx]):
-                coef = coeffs[channel_idx, fov_idx, nchanx[channel_idx, k]] * (
-                    datasets[nchanx[channel_idx, k], :, fov_idx] -
-                    amean[nchanx[channel_idx, k], fov_idx, channel_idx])
-                coeff_sum += coef
-            new_ds[:, fov_idx] = coeff_sum + dmean[channel_idx]
+def build_atms_limb_correction_tensors(dmean, coeffs, amean, nchx, nchanx):
+    """Convert parsed limb correction coefficients to arrays that correct every channel at once.
+
+    The correction for channel ``c`` at field of view ``f`` is
+    ``dmean[c] + sum_k(coeffs[c, f, j_k] * (bt[j_k, :, f] - amean[j_k, f, c]))`` for each predictor channel ``j_k``.
+    Coefficients for channels that aren't predictors are 0 so the sum can include every channel and the constant
+    part can be computed ahead of time.
+
+    :returns: (weights (channel, fov, predictor channel), offsets (channel, fov), predictors (channel, channel))
+    """
+    num_chans = dmean.shape[0]
+    predictors = np.zeros((num_chans, num_chans), dtype=np.bool_)
+    for chan_idx in range(num_chans):
+        predictors[chan_idx, nchanx[chan_idx, :nchx[chan_idx]]] = True
+    weights = np.where(predictors[:, None, :], coeffs, 0).astype(np.float64)
+    offsets = dmean[:, None] - np.einsum("cfj,jfc->cf", weights, amean)
+    return weights, offsets, predictors
+
+
+# coefficient filename -> correction tensors (see `build_atms_limb_correction_tensors`)
+_LIMB_TENSOR_CACHE = {}
+
+
+def _load_atms_limb_correction_tensors(cache_fn, num_chans=22, num_fovs=96):
+    """Load limb correction tensors saved by `get_atms_limb_correction_tensors`.
+
+    :returns: tensors or None if the file doesn't exist or isn't a valid cache file
+    """
+    if not os.path.isfile(cache_fn):
+        return None
+    LOG.debug("Loading limb correction coefficients from '%s'", cache_fn)
+    try:
+        with np.load(cache_fn, allow_pickle=False) as cache_data:
+            tensors = (cache_data["weights"], cache_data["offsets"], cache_data["predictors"])
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        LOG.warning("Could not load limb correction coefficient cache '%s', will rebuild it", cache_fn)
+        LOG.debug("Limb correction cache exception: ", exc_info=True)
+        return None
+    expected = (((num_chans, num_fovs, num_chans), np.float64), ((num_chans, num_fovs), np.float64),
+                ((num_chans, num_chans), np.bool_))
+    if any(arr.shape != shape or arr.dtype != dtype for arr, (shape, dtype) in zip(tensors, expected)):
+        LOG.warning("Limb correction coefficient cache '%s' has unexpected arrays, will rebuild it", cache_fn)
+        return None
+    return tensors
+
+
+def get_atms_limb_correction_tensors(fn):
+    """Get the limb correction tensors for the coefficient file `fn`.
+
+    Tensors are built from the text file the first time and saved as a binary ``.npz`` file in `LIMB_CACHE_DIR`,
+    named by the contents of the text file so that changed coefficient files are rebuilt. Cache files that can't be
+    loaded are rebuilt.
+    """
+    if fn in _LIMB_TENSOR_CACHE:
+        return _LIMB_TENSOR_CACHE[fn]
+
+    coeff_text = _read_limb_correction_text(fn)
+    cache_fn = os.path.join(LIMB_CACHE_DIR, "%s_%s.npz" % (
+        os.path.splitext(os.path.basename(fn.split(":")[-1]))[0], md5(coeff_text.encode()).hexdigest()))
+    tensors = _load_atms_limb_correction_tensors(cache_fn)
+    if tensors is None:
+        tensors = build_atms_limb_correction_tensors(*read_atms_limb_correction_coefficients(fn, coeff_text))
+        try:
+            if not os.path.isdir(LIMB_CACHE_DIR):
+                os.makedirs(LIMB_CACHE_DIR, 0o700)
+            # write to a temporary name first so other processes never load a partial file
+            tmp_fn = "%s.%d.npz" % (cache_fn[:-4], os.getpid())
+            np.savez(tmp_fn, weights=tensors[0], offsets=tensors[1], predictors=tensors[2])
+            os.rename(tmp_fn, cache_fn)
+            LOG.debug("Saved limb correction coefficients to '%s'", cache_fn)
+        except OSError:
+            LOG.debug("Could not save limb correction coefficients to '%s'", cache_fn, exc_info=True)
+
+    _LIMB_TENSOR_CACHE[fn] = tensors
+    return tensors
+
+
+def apply_atms_limb_correction(datasets, weights, offsets, predictors):
+    """Limb correct every channel of `datasets` (channel, scan, fov) at once.
 
-    return all_new_ds
+    :returns: float32 array with the same shape as `datasets`
+    """
+    invalid = np.isnan(datasets)
+    # (fov, channel, predictor) x (fov, predictor, scan) -> (fov, channel, scan)
+    new_ds = np.matmul(weights.transpose(1, 0, 2), np.where(invalid, 0, datasets).transpose(2, 0, 1))
+    new_ds += offsets.T[:, :, None]
+    new_ds = new_ds.transpose(1, 2, 0).astype(np.float32)
+    # invalid predictors make the corrected value invalid
+    new_ds[np.matmul(predictors.astype(np.float32), invalid.reshape(invalid.shape[0], -1).astype(np.float32)).reshape(
+        new_ds.shape) > 0] = np.nan
+    return new_ds
+
+
+def limb_correct_atms(full_bt_data, surf_type_mask):
+    """Limb correct all ATMS channels using the sea coefficients over water and the land coefficients elsewhere.
+    """
+    is_sea = (surf_type_mask == 0)
+    new_bt_data = apply_atms_limb_correction(full_bt_data, *get_atms_limb_correction_tensors(LIMB_LAND_FILE))
+    new_sea_bt_data = apply_atms_limb_correction(full_bt_data, *get_atms_limb_correction_tensors(LIMB_SEA_FILE))
+    new_bt_data[:, is_sea] = new_sea_bt_data[:, is_sea]
+    return new_bt_data
+
+
+def _write_file_swath_data(filepath, item, file_info, filename, offset, shape, dtype):
+    """Read `item` from one MIRS file in a worker process and write it to its place in `filename`.
+
+    `file_info` is passed because products added at runtime aren't in `FILE_STRUCTURE` of a new process.
+    """
+    FILE_STRUCTURE.setdefault(item, file_info)
+    file_reader = MIRSFileReader(filepath, FILE_STRUCTURE)
+    out = np.memmap(filename, dtype=dtype, mode="r+", offset=offset, shape=shape)
+    out[:] = file_reader.get_swath_data(item)
+    out.flush()
 
 
 class NetCDFFileReader(object):
@@ -504,6 +612,19 @@ class MIRSFileReader(BaseFileReader):
         idx_obj[freq_dim_idx] = idx
         return arr[idx_obj]
 
+    def get_swath_shape(self, item):
+        """Get the shape of the array returned by `get_swath_data` without reading the data."""
+        nc_var = self[item]
+        dims = list(nc_var.dimensions)
+        shape = list(nc_var.shape)
+        freq = FILE_STRUCTURE[item][3]
+        if isinstance(freq, int) or freq:
+            del shape[dims.index(self[FREQ_VAR].dimensions[0])]
+        elif item == BT_ALL_VARS:
+            first_dims = [dims.index("Channel"), dims.index("Scanline")]
+            shape = [shape[idx] for idx in first_dims] + [x for idx, x in enumerate(shape) if idx not in first_dims]
+        return tuple(shape)
+
     def get_swath_data(self, item, dtype=np.float32, fill=np.nan):
         """Get swath data from the file. Usually requires special processing.
         """
@@ -599,6 +720,42 @@ class MIRSMultiReader(BaseMultiFileReader):
     def filepaths(self):
         return [fr.filepath for fr in self.file_readers]
 
+    def write_var_to_flat_binary(self, item, filename, dtype=np.float32, pool=None):
+        """Write `item` from every file to one flat binary file.
+
+        If a `multiprocessing` `pool` is provided each file is read by a worker process that writes its data
+        directly to that file's offset in `filename`.
+        """
+        if pool is None or len(self.file_readers) <= 1:
+            return super(MIRSMultiReader, self).write_var_to_flat_binary(item, filename, dtype=dtype)
+
+        shapes = [fr.get_swath_shape(item) for fr in self.file_readers]
+        if any(shape[1:] != shapes[0][1:] for shape in shapes):
+            LOG.error("Files have different shapes for '%s': %r", item, shapes)
+            raise ValueError("Files have different shapes for '%s': %r" % (item, shapes))
+        total_shape = (sum(shape[0] for shape in shapes),) + shapes[0][1:]
+
+        LOG.debug("Writing binary data for '%s' to file '%s' with a process pool", item, filename)
+        item_size = np.dtype(dtype).itemsize
+        try:
+            with open(filename, "wb") as file_obj:
+                file_obj.truncate(int(np.prod(total_shape)) * item_size)
+            jobs = []
+            offset = 0
+            for fr, shape in zip(self.file_readers, shapes):
+                jobs.append(pool.apply_async(_write_file_swath_data, (fr.filepath, item, FILE_STRUCTURE[item],
+                                                                      filename, offset, shape, dtype)))
+                offset += int(np.prod(shape)) * item_size
+            for job in jobs:
+                job.get()
+        except (IOError, ValueError, TypeError):
+            if os.path.isfile(filename):
+                os.remove(filename)
+            raise
+
+        LOG.debug("File %s has shape %r", filename, total_shape)
+        return total_shape
+
 
 FILE_CLASSES = {
     FT_IMG: MIRSMultiReader,
@@ -628,6 +785,10 @@ class Frontend(roles.FrontendRole):
 
     def __init__(self, **kwargs):
         super(Frontend, self).__init__(**kwargs)
+        # process pool while creating a scene with multiple processes
+        self._pool = None
+        # limb corrected brightness temperatures for all channels of the scene being created
+        self._limb_corrected_bt = None
         self._load_files(self.find_files_with_extensions())
         self.all_bt_channels = []
         self.update_dynamic_products()
@@ -782,7 +943,7 @@ class Frontend(roles.FrontendRole):
 
         # TODO: Get the data type from the data or allow the user to specify
         try:
-            shape = file_reader.write_var_to_flat_binary(product_def.file_key, filename)
+            shape = file_reader.write_var_to_flat_binary(product_def.file_key, filename, pool=self._pool)
         except (OSError, ValueError):
             LOG.error("Could not extract data from file")
             LOG.debug("Extraction exception: ", exc_info=True)
@@ -810,8 +971,25 @@ class Frontend(roles.FrontendRole):
         return one_swath
 
     def create_scene(self, products=None, nprocs=1, all_bt_channels=False, **kwargs):
-        if nprocs != 1:
-            raise NotImplementedError("The MIRS frontend does not support multiple processes yet")
+        """Create a scene of the requested products.
+
+        :param nprocs: Number of processes to read files with
+        """
+        if nprocs <= 1:
+            return self._create_scene(products=products, all_bt_channels=all_bt_channels, **kwargs)
+
+        LOG.debug("Creating scene with %d processes", nprocs)
+        self._pool = multiprocessing.Pool(nprocs)
+        try:
+            return self._create_scene(products=products, all_bt_channels=all_bt_channels, **kwargs)
+        finally:
+            # every job has finished by now (or the scene failed), don't leave any workers behind
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _create_scene(self, products=None, all_bt_channels=False, **kwargs):
+        self._limb_corrected_bt = None
         if products is None:
             if not all_bt_channels:
                 LOG.debug("No products specified to frontend, will try to load logical defaults")
@@ -917,6 +1095,7 @@ class Frontend(roles.FrontendRole):
                 # the user wants this product
                 scene[product_name] = one_swath
 
+        self._limb_corrected_bt = None
         return scene
 
     def limb_correct_atms_bt(self, product_name, swath_definition, products_created, fill=np.nan):
@@ -925,29 +1104,21 @@ class Frontend(roles.FrontendRole):
             LOG.info("Limb Correction will not be applied to non-ATMS BTs")
             return products_created[product_name]
 
-        LOG.info("Starting ATMS Limb Correction...")
-
         product_def = self.PRODUCTS[product_name]
         deps = product_def.dependencies
         if len(deps) != 2:
             LOG.error("Expected 1 dependencies to create corrected BT product, got %d" % (len(deps),))
             raise ValueError("Expected 1 dependencies to create corrected BT product, got %d" % (len(deps),))
 
-        full_bt_product_name = deps[0]
-        full_bt_product = products_created[full_bt_product_name]
-        full_bt_data = full_bt_product.get_data_array("swath_data")
-        surf_type_name = deps[1]
-        surf_type_product = products_created[surf_type_name]
-        surf_type_mask = surf_type_product.get_data_array("swath_data")
+        if self._limb_corrected_bt is None:
+            # every channel is corrected at the same time, the first BT product of the scene does it for all of them
+            LOG.info("Starting ATMS Limb Correction...")
+            full_bt_data = products_created[deps[0]].get_data_array("swath_data")
+            surf_type_mask = products_created[deps[1]].get_data_array("swath_data")
+            self._limb_corrected_bt = limb_correct_atms(full_bt_data, surf_type_mask)
 
         bt_data = bt_product.get_data_array("swath_data", mode="r+")
-        sea_coeff_results = read_atms_limb_correction_coefficients(LIMB_SEA_FILE)
-        new_sea_bt_data = apply_atms_limb_correction(full_bt_data, *sea_coeff_results)
-        land_coeff_results = read_atms_limb_correction_coefficients(LIMB_LAND_FILE)
-        new_land_bt_data = apply_atms_limb_correction(full_bt_data, *land_coeff_results)
-        is_sea = (surf_type_mask == 0)
-        bt_data[is_sea] = new_sea_bt_data[bt_product["channel_index"]][is_sea]
-        bt_data[~is_sea] = new_land_bt_data[bt_product["channel_index"]][~is_sea]
+        bt_data[:] = self._limb_corrected_bt[bt_product["channel_index"]]
 
         # return the same original swath object since we modified the data in place
         return products_created[product_name]
@@ -969,6 +1140,8 @@ def add_frontend_argument_groups(parser):
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("--bt-channels", dest="all_bt_channels", action='store_true',
                        help="Add all BT channels to the list of requested products")
+    group.add_argument("--nprocs", dest="nprocs", type=int, default=1,
+                       help="Number of processes to read files and limb correct BT channels with (default 1)")
     group.add_argument("-p", "--products", dest="products", nargs="*", default=None,
                        help="Specify frontend products to process")
     return ["Frontend Initialization", "Frontend Swath Extraction"]
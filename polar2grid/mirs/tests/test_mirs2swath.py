@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test the MIRS frontend's file reading and ATMS limb correction."""
+__docformat__ = "restructuredtext en"
+
+import multiprocessing
+import os
+
+import numpy
+import pytest
+
+from polar2grid.mirs import mirs2swath
+
+
+def _loop_limb_correction(datasets, dmean, coeffs, amean, nchx, nchanx):
+    """Per-channel, per-FOV limb correction the frontend used before the tensor version."""
+    all_new_ds = []
+    coeff_sum = numpy.zeros(datasets.shape[1], dtype=datasets[0].dtype)
+    for channel_idx in range(datasets.shape[0]):
+        new_ds = datasets[channel_idx].copy()
+        all_new_ds.append(new_ds)
+        for fov_idx in range(96):
+            coeff_sum[:] = 0
+            for k in range(nchx[channel_idx]):
+                coeff_sum += coeffs[channel_idx, fov_idx, nchanx[channel_idx, k]] * (
+                    datasets[nchanx[channel_idx, k], :, fov_idx] -
+                    amean[nchanx[channel_idx, k], fov_idx, channel_idx])
+            new_ds[:, fov_idx] = coeff_sum + dmean[channel_idx]
+    return numpy.array(all_new_ds)
+
+
+@pytest.fixture
+def limb_cache_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(mirs2swath, "LIMB_CACHE_DIR", str(tmpdir.join("limb_cache")))
+    monkeypatch.setattr(mirs2swath, "_LIMB_TENSOR_CACHE", {})
+    return str(tmpdir.join("limb_cache"))
+
+
+@pytest.mark.parametrize("coeff_file", [mirs2swath.LIMB_SEA_FILE, mirs2swath.LIMB_LAND_FILE])
+def test_apply_atms_limb_correction(coeff_file, limb_cache_dir):
+    rs = numpy.random.RandomState(0)
+    bt = rs.uniform(180., 290., (22, 12, 96)).astype(numpy.float32)
+    # invalid predictor values
+    bt[4, 3, 10] = numpy.nan
+    bt[15, 7, 50] = numpy.nan
+    coefficients = mirs2swath.read_atms_limb_correction_coefficients(coeff_file)
+    expected = _loop_limb_correction(bt, *coefficients)
+    result = mirs2swath.apply_atms_limb_correction(bt, *mirs2swath.get_atms_limb_correction_tensors(coeff_file))
+    assert result.dtype == numpy.float32
+    numpy.testing.assert_array_equal(numpy.isnan(result), numpy.isnan(expected))
+    assert numpy.isnan(result[:, 3, 10]).any()
+    numpy.testing.assert_allclose(result, expected, rtol=0, atol=1e-3)
+
+
+def test_limb_correction_tensor_cache(limb_cache_dir):
+    coeff_file = mirs2swath.LIMB_SEA_FILE
+    tensors = mirs2swath.get_atms_limb_correction_tensors(coeff_file)
+    cache_files = os.listdir(limb_cache_dir)
+    assert len(cache_files) == 1
+    cache_fn = os.path.join(limb_cache_dir, cache_files[0])
+
+    # loaded from the cache file
+    mirs2swath._LIMB_TENSOR_CACHE.clear()
+    for cached, built in zip(mirs2swath.get_atms_limb_correction_tensors(coeff_file), tensors):
+        numpy.testing.assert_array_equal(cached, built)
+
+    # corrupt cache files are rebuilt
+    for bad_contents in (b"", b"PK\x03\x04 truncated"):
+        with open(cache_fn, "wb") as cache_file:
+            cache_file.write(bad_contents)
+        mirs2swath._LIMB_TENSOR_CACHE.clear()
+        for rebuilt, built in zip(mirs2swath.get_atms_limb_correction_tensors(coeff_file), tensors):
+            numpy.testing.assert_array_equal(rebuilt, built)
+        assert mirs2swath._load_atms_limb_correction_tensors(cache_fn) is not None
+
+    # cache files with the wrong arrays are rebuilt
+    numpy.savez(cache_fn[:-4], weights=numpy.zeros(3), offsets=numpy.zeros(3), predictors=numpy.zeros(3))
+    assert mirs2swath._load_atms_limb_correction_tensors(cache_fn) is None
+    mirs2swath._LIMB_TENSOR_CACHE.clear()
+    numpy.testing.assert_array_equal(mirs2swath.get_atms_limb_correction_tensors(coeff_file)[0], tensors[0])
+
+
+# filepath -> {variable name: (data, dimensions, attributes)} read by `_FakeDataset`
+_FAKE_FILES = {}
+
+
+class _FakeNCVariable(object):
+    def __init__(self, data, dimensions, attrs):
+        self.data = data
+        self.dimensions = dimensions
+        self.shape = data.shape
+        self.attrs = attrs
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+    def __getattr__(self, item):
+        try:
+            return self.__dict__["attrs"][item]
+        except KeyError:
+            raise AttributeError(item)
+
+    def getncattr(self, name):
+        return getattr(self, name)
+
+    def set_auto_maskandscale(self, value):
+        pass
+
+
+class _FakeDataset(object):
+    """Stand-in for `netCDF4.Dataset` reading MIRS files from `_FAKE_FILES`."""
+    satellite_name = "NPP"
+    instrument_name = "ATMS"
+    time_coverage_start = "2015-01-01T00:00:00Z"
+    time_coverage_end = "2015-01-01T00:10:00Z"
+    missing_value = -999
+
+    def __init__(self, filepath, mode):
+        self.variables = dict((var_name, _FakeNCVariable(*var_info))
+                              for var_name, var_info in _FAKE_FILES[filepath].items())
+
+
+@pytest.fixture
+def mirs_files(tmpdir, monkeypatch):
+    monkeypatch.setattr(mirs2swath, "Dataset", _FakeDataset)
+    rs = numpy.random.RandomState(0)
+    filepaths = []
+    for idx, num_scans in enumerate((5, 7, 3)):
+        filepath = os.path.realpath(str(tmpdir.join("NPR-MIRS-IMG_%d.nc" % (idx,))))
+        rr = rs.randint(0, 500, (num_scans, 96)).astype(numpy.int16)
+        rr[0, idx] = -999
+        lat = rs.uniform(-90., 90., (num_scans, 96)).astype(numpy.float32)
+        lat[1, idx] = -999.8
+        lon = rs.uniform(-180., 180., (num_scans, 96)).astype(numpy.float32)
+        _FAKE_FILES[filepath] = {
+            "RR": (rr, ("Scanline", "Field_of_view"), {"scale": 0.1}),
+            "Latitude": (lat, ("Scanline", "Field_of_view"), {}),
+            "Longitude": (lon, ("Scanline", "Field_of_view"), {}),
+        }
+        filepaths.append(filepath)
+    yield filepaths
+    for filepath in filepaths:
+        del _FAKE_FILES[filepath]
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                    reason="worker processes need the fake netCDF files")
+def test_write_var_to_flat_binary_pool(mirs_files, tmpdir):
+    file_reader = mirs2swath.MIRSMultiReader()
+    file_reader.add_files(mirs_files)
+    pool = multiprocessing.get_context("fork").Pool(2)
+    try:
+        for item in (mirs2swath.RR_VAR, mirs2swath.LAT_VAR, mirs2swath.LON_VAR):
+            serial_fn = str(tmpdir.join("serial_%s.dat" % (item,)))
+            pool_fn = str(tmpdir.join("pool_%s.dat" % (item,)))
+            serial_shape = file_reader.write_var_to_flat_binary(item, serial_fn)
+            pool_shape = file_reader.write_var_to_flat_binary(item, pool_fn, pool=pool)
+            assert pool_shape == serial_shape
+            assert serial_shape == (15, 96)
+            serial_data = numpy.fromfile(serial_fn, dtype=numpy.float32)
+            pool_data = numpy.fromfile(pool_fn, dtype=numpy.float32)
+            numpy.testing.assert_array_equal(pool_data, serial_data)
+            # each file is at its own offset
+            expected = numpy.concatenate([mirs2swath.MIRSFileReader(fp, mirs2swath.FILE_STRUCTURE).get_swath_data(item)
+                                          for fp in mirs_files])
+            numpy.testing.assert_array_equal(pool_data.reshape(pool_shape), expected)
+        # fill values are masked in every file
+        for item, num_nans in ((mirs2swath.RR_VAR, 3), (mirs2swath.LAT_VAR, 3), (mirs2swath.LON_VAR, 0)):
+            data = numpy.fromfile(str(tmpdir.join("pool_%s.dat" % (item,))), dtype=numpy.float32).reshape((15, 96))
+            assert numpy.isnan(data).sum() == num_nans
+        rr = numpy.fromfile(str(tmpdir.join("pool_%s.dat" % (mirs2swath.RR_VAR,))), dtype=numpy.float32)
+        assert numpy.isnan(rr.reshape((15, 96))[[0, 5, 12], [0, 1, 2]]).all()
+        raw_rr = numpy.concatenate([_FAKE_FILES[fp]["RR"][0] for fp in mirs_files]).ravel()
+        numpy.testing.assert_allclose(rr[raw_rr != -999], raw_rr[raw_rr != -999] * 0.1, rtol=1e-6)
+
+        # files that can't be put together
+        _FAKE_FILES[mirs_files[1]]["RR"] = (numpy.zeros((7, 90), dtype=numpy.int16), ("Scanline", "Field_of_view"),
+                                            {"scale": 0.1})
+        file_reader = mirs2swath.MIRSMultiReader()
+        file_reader.add_files(mirs_files)
+        bad_fn = str(tmpdir.join("bad.dat"))
+        with pytest.raises(ValueError):
+            file_reader.write_var_to_flat_binary(mirs2swath.RR_VAR, bad_fn, pool=pool)
+        assert not os.path.exists(bad_fn)
+    finally:
+        pool.terminate()
+        pool.join()
@@ -279,6 +279,10 @@ from collections import namedtuple
 
 LOG = logging.getLogger(__name__)
 
+# number of radiance values converted to brightness temperatures at a time
+CHUNK_SIZE = 256 * 1024
+_BT_COEFFS_CACHE = {}
+
 # exponential notation regex 
 EXPO = r'[+\-]?(?:0|[1-9]\d*)(?:\.\d*)?(?:[eE][+\-]?\d+)?'
 
@@ -361,7 +365,37 @@ def wnum_bt(v, r):
     return zult
 
 
-def bright_shift(platform, rad, band, units="micron"):
+def _bt_coefficients(platform, band, units="micron"):
+    """Get the combined Planck inversion and temperature correction coefficients for a band.
+
+    The brightness temperature for radiance ``rad`` is ``a / log(k / rad + 1) - b``. Coefficients are cached for each
+    (platform, band, units) so they are only computed once.
+
+    :returns: (k, a, b) tuple
+    """
+    key = (platform.split(' ')[0].lower(), band, units)
+    if key in _BT_COEFFS_CACHE:
+        return _BT_COEFFS_CACHE[key]
+
+    offset = (band - 20) if (band <= 25) else (band - 21)
+    assert(offset >=0 and offset <16)
+    C = _coeffs(platform, offset)
+    LOG.debug('Coeffs loaded at offset %d: %s' % (offset, C))
+
+    if units == 'micron': # Watts per square meter per steradian per micron
+        ws = 1.0e-6 * (1.0e+4 / C.cwn)
+        k_planck, a_planck = c1 / (1.0e6 * ws**5), c2 / ws
+    elif units == 'wavenumber': #  milliWatts per square meter per steradian per wavenumber
+        vs = 1.0e+2 * C.cwn
+        k_planck, a_planck = c1 * vs**3 / 1.0e-5, c2 * vs
+    else:
+        raise ValueError("units must be 'wavenumber' or 'micron'")
+
+    _BT_COEFFS_CACHE[key] = (k_planck, a_planck / C.tcs, C.tci / C.tcs)
+    return _BT_COEFFS_CACHE[key]
+
+
+def bright_shift(platform, rad, band, units="micron", out=None):
     """compute brightness temperature for MODIS on Terra and Aqua
 
     :arg platform: "Terra" or "Aqua"
@@ -369,24 +403,38 @@ def bright_shift(platform, rad, band, units="micron"):
     :arg band: band number
     :keyword units: "micron" implying Watts per square meter per steradian per micron for radiance
             or "wavenumber" implying milliWatts per square meter per steradian per wavenumber
-    
+    :keyword out: C-contiguous array to write the brightness temperatures to (may be `rad`), by default a new
+            float64 array is created
+
     .. note::
-    
+
         the return array is in Kelvin and contains numpy.nan values where the inputs
         could not be processed
 
-    """    
-    offset = (band - 20) if (band <= 25) else (band - 21)
-    assert(offset >=0 and offset <16)
-    C = _coeffs(platform, offset)
-    LOG.debug('Coeffs loaded at offset %d: %s' % (offset, C))
+    Radiances are converted CHUNK_SIZE values at a time to avoid creating temporary arrays the size of the input.
 
-    if units == 'micron': # Watts per square meter per steradian per micron
-        return (micron_bt(1.0e+4 / C.cwn, rad) - C.tci) / C.tcs
-    elif units == 'wavenumber': #  milliWatts per square meter per steradian per wavenumber
-        return (wnum_bt(C.cwn, rad) - C.tci) / C.tcs
-    else:
-        raise ValueError("units must be 'wavenumber' or 'micron'")
+    """
+    k_planck, a_planck, b_planck = _bt_coefficients(platform, band, units)
+    rad = np.asarray(rad)
+    if out is None:
+        out = np.empty(rad.shape, dtype=np.float64)
+    elif not out.flags.c_contiguous or out.shape != rad.shape:
+        LOG.error("Brightness temperature output array must be C-contiguous and the same shape as the radiances")
+        raise ValueError("Brightness temperature output array must be C-contiguous and the same shape as the radiances")
+
+    flat_rad = rad.reshape(-1)
+    flat_out = out.reshape(-1)
+    for idx in range(0, flat_rad.size, CHUNK_SIZE):
+        bt = flat_rad[idx:idx + CHUNK_SIZE].astype(np.float64)
+        invalid = bt <= 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(k_planck, bt, out=bt)
+            np.log1p(bt, out=bt)
+            np.divide(a_planck, bt, out=bt)
+        bt -= b_planck
+        bt[invalid] = np.nan
+        flat_out[idx:idx + CHUNK_SIZE] = bt
+    return out
 
 
 def _test1():
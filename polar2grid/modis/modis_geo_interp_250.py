@@ -38,7 +38,8 @@
 """
 
 import numpy as np
-from scipy.ndimage.interpolation import map_coordinates
+
+from polar2grid.core.frontend_utils import linear_interpolation_weights, interpolate_cartesian_geolocation
 
 import logging
 
@@ -46,108 +47,55 @@ LOG = logging.getLogger(__name__)
 
 # MODIS has 10 rows of data in the array for every scan line
 ROWS_PER_SCAN = 10
-EARTH_RADIUS = 6370997.0
 
-# FUTURE: Add this to the pytroll python-geotiepoints package if it can be more generalized
-# Most of the cartesian conversions were taken from the existing python-geotiepoints develop branch
 
-def get_lons_from_cartesian(x__, y__):
-    """Get longitudes from cartesian coordinates.
-    """
-    return np.rad2deg(np.arccos(x__ / np.sqrt(x__ ** 2 + y__ ** 2))) * np.sign(y__)
+def _scan_row_weights(res_factor):
+    """Weights to interpolate the 10 rows of a 1km scan to the rows of a 250m (4) or 500m (2) scan.
 
-def get_lats_from_cartesian(x__, y__, z__, thr=0.8):
-    """Get latitudes from cartesian coordinates.
+    Rows are interpolated bilinearly except for the first and last two 250m rows (or one 500m row) of each scan which
+    are linearly extrapolated from the rows inside the scan.
     """
-    # if we are at low latitudes - small z, then get the
-    # latitudes only from z. If we are at high latitudes (close to the poles)
-    # then derive the latitude using x and y:
-
-    lats = np.where(np.logical_and(np.less(z__, thr * EARTH_RADIUS),
-                                   np.greater(z__, -1. * thr * EARTH_RADIUS)),
-                    90 - np.rad2deg(np.arccos(z__/EARTH_RADIUS)),
-                    np.sign(z__) *
-                    (90 - np.rad2deg(np.arcsin(np.sqrt(x__ ** 2 + y__ ** 2)
-                                         / EARTH_RADIUS))))
-    return lats
-
-
-def interpolate_geolocation_cartesian(lon_array, lat_array, res_factor=4):
+    # 0.375 for 250m, 0.25 for 500m
+    y = np.arange(res_factor * ROWS_PER_SCAN) * (1. / res_factor) - (res_factor * (1. / 16) + (1. / 8))
+    indexes, weights = linear_interpolation_weights(y, ROWS_PER_SCAN)
+    row_weights = np.zeros((y.size, ROWS_PER_SCAN), dtype=np.float64)
+    for idx in range(indexes.shape[1]):
+        np.add.at(row_weights, (np.arange(y.size), indexes[:, idx]), weights[:, idx])
+
+    if res_factor == 4:
+        extrapolations = ((5, 2, (0, 1)), (37, 34, (38, 39)))
+    else:
+        # 500m
+        extrapolations = ((2, 1, (0,)), (18, 17, (19,)))
+    for i1, i0, extrap_rows in extrapolations:
+        slope = (row_weights[i1] - row_weights[i0]) / (y[i1] - y[i0])
+        for row_idx in extrap_rows:
+            row_weights[row_idx] = row_weights[i1] + slope * (y[row_idx] - y[i1])
+    return row_weights
+
+
+def interpolate_geolocation_cartesian(lon_array, lat_array, res_factor=4, num_workers=1):
     """Interpolate MODIS navigation from 1000m resolution to 250m.
 
     Python rewrite of the IDL function ``MODIS_GEO_INTERP_250`` but converts to cartesian (X, Y, Z) coordinates
-    first to avoid problems with the anti-meridian/poles.
+    first to avoid problems with the anti-meridian/poles. The interpolation is the same for every scan so all scans
+    are interpolated with the same row and column weights, a block of scans at a time.
 
     :param lon_array: MODIS 1km longitude array
     :param lat_array: MODIS 1km latitude array
+    :param num_workers: Number of threads to interpolate blocks of scans with
 
-    :returns: MODIS 250m latitude array or 250m longitude array
+    :returns: MODIS 250m longitude array and 250m latitude array (float32)
 
     If we are going from 1000m to 250m we have 4 times the size of the original
-    If we are going from 1000m to 250m we have 2 times the size of the original
+    If we are going from 1000m to 500m we have 2 times the size of the original
     """
-    num_rows,num_cols = lon_array.shape
-    num_scans = int(num_rows / ROWS_PER_SCAN)
-
-    lons_rad = np.radians(lon_array)
-    lats_rad = np.radians(lat_array)
-    x_in = EARTH_RADIUS * np.cos(lats_rad) * np.cos(lons_rad)
-    y_in = EARTH_RADIUS * np.cos(lats_rad) * np.sin(lons_rad)
-    z_in = EARTH_RADIUS * np.sin(lats_rad)
-
-    # Create an array of indexes that we want our result to have
-    x = np.arange(res_factor * num_cols, dtype=np.float32) * (1./res_factor)
-    # 0.375 for 250m, 0.25 for 500m
-    y = np.arange(res_factor * ROWS_PER_SCAN, dtype=np.float32) * (1./res_factor) - (res_factor * (1./16) + (1./8))
-    x,y = np.meshgrid(x,y)
-    coordinates = np.array([y,x]) # Used by map_coordinates, major optimization
-
-    new_x = np.empty((num_rows * res_factor, num_cols * res_factor), dtype=np.float64)
-    new_y = new_x.copy()
-    new_z = new_x.copy()
-    nav_arrays = [(x_in, new_x), (y_in, new_y), (z_in, new_z)]
-
-    # Interpolate each scan, one at a time, otherwise the math doesn't work well
-    for scan_idx in range(num_scans):
-        # Calculate indexes
-        j0 = ROWS_PER_SCAN              * scan_idx
-        j1 = j0 + ROWS_PER_SCAN
-        k0 = ROWS_PER_SCAN * res_factor * scan_idx
-        k1 = k0 + ROWS_PER_SCAN * res_factor
-
-        for nav_array, result_array in nav_arrays:
-            # Use bilinear interpolation for all 250 meter pixels
-            map_coordinates(nav_array[ j0:j1, : ], coordinates, output=result_array[ k0:k1, : ], order=1, mode='nearest')
-
-            if res_factor == 4:
-                # Use linear extrapolation for the first two 250 meter pixels along track
-                m = (result_array[ k0 + 5, : ] - result_array[ k0 + 2, : ]) / (y[5,0] - y[2,0])
-                b = result_array[ k0 + 5, : ] - m * y[5,0]
-                result_array[ k0 + 0, : ] = m * y[0,0] + b
-                result_array[ k0 + 1, : ] = m * y[1,0] + b
-
-                # Use linear extrapolation for the last  two 250 meter pixels along track
-                m = (result_array[ k0 + 37, : ] - result_array[ k0 + 34, : ]) / (y[37,0] - y[34,0])
-                b = result_array[ k0 + 37, : ] - m * y[37,0]
-                result_array[ k0 + 38, : ] = m * y[38,0] + b
-                result_array[ k0 + 39, : ] = m * y[39,0] + b
-            else:
-                # 500m
-                # Use linear extrapolation for the first two 250 meter pixels along track
-                m = (result_array[ k0 + 2, : ] - result_array[ k0 + 1, : ]) / (y[2,0] - y[1,0])
-                b = result_array[ k0 + 2, : ] - m * y[2,0]
-                result_array[ k0 + 0, : ] = m * y[0,0] + b
-
-                # Use linear extrapolation for the last  two 250 meter pixels along track
-                m = (result_array[ k0 + 18, : ] - result_array[ k0 + 17, : ]) / (y[18,0] - y[17,0])
-                b = result_array[ k0 + 18, : ] - m * y[18,0]
-                result_array[ k0 + 19, : ] = m * y[19,0] + b
-
-    # Convert from cartesian to lat/lon space
-    new_lons = get_lons_from_cartesian(new_x, new_y)
-    new_lats = get_lats_from_cartesian(new_x, new_y, new_z)
-
-    return new_lons.astype(lon_array.dtype), new_lats.astype(lat_array.dtype)
+    num_cols = lon_array.shape[1]
+    x = np.arange(res_factor * num_cols) * (1. / res_factor)
+    col_indexes, col_weights = linear_interpolation_weights(x, num_cols)
+    return interpolate_cartesian_geolocation(lon_array, lat_array, _scan_row_weights(res_factor), col_weights,
+                                             col_indexes=col_indexes, chunk_rows=20 * ROWS_PER_SCAN,
+                                             num_workers=num_workers)
 
 
 # def interpolate_geolocation(nav_array):
@@ -39,11 +39,17 @@
 """
 __docformat__ = "restructuredtext en"
 
-from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader
+from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader, DAY_FRACTION_STRIDE
 from polar2grid.modis.modis_geo_interp_250 import interpolate_geolocation_cartesian
 
 import os
+import atexit
 import logging
+import threading
+from collections import OrderedDict
+from hashlib import md5
+from shutil import rmtree
+from tempfile import mkdtemp
 
 from datetime import datetime
 from pyhdf import SD
@@ -361,6 +367,82 @@ class HDFEOSReader(HDFReader):
             raise ValueError("Could not parse HDF-EOS file (see debug log for details)")
 
 
+# Interpolated navigation kept in memory (bytes), older results are spilled to float32 files on disk
+NAV_CACHE_SIZE = int(os.environ.get("P2G_MODIS_NAV_CACHE_MB", 256)) * 1024 * 1024
+# (geo filepath, res_factor) -> (lon, lat), most recently used last
+_NAV_CACHE = OrderedDict()
+# (geo filepath, res_factor) -> (lon filename, lat filename, shape)
+_NAV_SPILLED = {}
+_NAV_SPILL_DIR = None
+_NAV_CACHE_LOCK = threading.Lock()
+
+
+def _remove_nav_spill_dir():
+    if _NAV_SPILL_DIR is not None:
+        rmtree(_NAV_SPILL_DIR, ignore_errors=True)
+
+
+atexit.register(_remove_nav_spill_dir)
+
+
+def clear_nav_cache():
+    """Forget all interpolated navigation and remove any navigation spilled to disk.
+
+    Should be called when a scene is finished so the navigation isn't kept for the rest of the process.
+    """
+    global _NAV_SPILL_DIR
+    with _NAV_CACHE_LOCK:
+        _NAV_CACHE.clear()
+        _NAV_SPILLED.clear()
+        _remove_nav_spill_dir()
+        _NAV_SPILL_DIR = None
+
+
+def _spill_nav(cache_key, nav_data):
+    global _NAV_SPILL_DIR
+    if _NAV_SPILL_DIR is None:
+        _NAV_SPILL_DIR = mkdtemp(prefix="p2g_modis_nav_")
+    # geolocation files in different directories can have the same name
+    base_fn = os.path.join(_NAV_SPILL_DIR, "%s_%s_%d" % (
+        os.path.basename(cache_key[0]), md5(cache_key[0].encode()).hexdigest(), cache_key[1]))
+    filenames = (base_fn + "_lon.dat", base_fn + "_lat.dat")
+    for fn, data in zip(filenames, nav_data):
+        data.astype(numpy.float32, copy=False).tofile(fn)
+    LOG.debug("Spilled interpolated navigation to %s", base_fn)
+    _NAV_SPILLED[cache_key] = filenames + (nav_data[0].shape,)
+
+
+def get_cached_nav(geo_filepath, res_factor):
+    """Get previously interpolated (lon, lat) arrays for a geolocation file or `None` if they don't exist.
+
+    Arrays are read-only and may be memory maps of spilled data.
+    """
+    cache_key = (geo_filepath, res_factor)
+    with _NAV_CACHE_LOCK:
+        if cache_key in _NAV_CACHE:
+            _NAV_CACHE.move_to_end(cache_key)
+            return _NAV_CACHE[cache_key]
+        if cache_key in _NAV_SPILLED:
+            lon_fn, lat_fn, shape = _NAV_SPILLED[cache_key]
+            return (numpy.memmap(lon_fn, dtype=numpy.float32, mode="r", shape=shape),
+                    numpy.memmap(lat_fn, dtype=numpy.float32, mode="r", shape=shape))
+    return None
+
+
+def cache_nav(geo_filepath, res_factor, lon_data, lat_data):
+    """Keep interpolated navigation for other readers of the same geolocation file.
+
+    The least recently used results are spilled to disk when the in-memory results are larger than
+    `NAV_CACHE_SIZE` (the newest result always stays in memory).
+    """
+    lon_data.flags.writeable = False
+    lat_data.flags.writeable = False
+    with _NAV_CACHE_LOCK:
+        _NAV_CACHE[(geo_filepath, res_factor)] = (lon_data, lat_data)
+        while len(_NAV_CACHE) > 1 and sum(lon.nbytes + lat.nbytes for lon, lat in _NAV_CACHE.values()) > NAV_CACHE_SIZE:
+            _spill_nav(*_NAV_CACHE.popitem(last=False))
+
+
 class FileReader(BaseFileReader):
     """Basic file wrapper that uses a `file_type_info` dictionary to map common key names to complex
     variable or attribute names and how to get them.
@@ -380,11 +462,8 @@ class FileReader(BaseFileReader):
         self.satellite = self.file_handle.satellite.lower()
         self.begin_time = self.file_handle.begin_time
         self.end_time = self.file_handle.end_time
-        # special hack for storing the 250m resolution navigation
-        self.nav_interpolation = {
-            "250": [None, None],
-            "500": [None, None],
-        }
+        # Number of threads used to interpolate navigation to a higher resolution
+        self.geo_workers = 1
 
     def __getitem__(self, item):
         known_item = self.file_type_info.get(item, item)
@@ -397,16 +476,85 @@ class FileReader(BaseFileReader):
         LOG.debug("Loading %s from %s", known_item, self.filename)
         return self.file_handle[known_item]
 
-    def get_swath_data(self, item, fill=None):
+    def get_coarse_swath_data(self, item, stride=10):
+        var_info = self.file_type_info[item]
+        return self[var_info.var_name][::stride, ::stride]
+
+    def get_coarse_day_counts(self, sza_item, sza_threshold, stride=DAY_FRACTION_STRIDE):
+        var_info = self.file_type_info[sza_item]
+        sza_data = self.get_coarse_swath_data(sza_item, stride=stride).astype(numpy.float64)
+        valid_min, valid_max = self[var_info.var_name + "." + var_info.range_attr_name]
+        valid_mask = (sza_data >= valid_min) & (sza_data <= valid_max)
+        if var_info.scale_attr_name:
+            sza_data *= float(self[var_info.var_name + "." + var_info.scale_attr_name])
+        return numpy.count_nonzero(valid_mask), numpy.count_nonzero(valid_mask & (sza_data < sza_threshold))
+
+    def _read_variable(self, var_info):
+        """Read the variable for `var_info` from the file, only reading the one band if it has an index.
+        """
+        variable = self[var_info.var_name]
+        if var_info.index is None:
+            return variable.get()
+        dims = variable.info()[2]
+        start = (var_info.index,) + (0,) * (len(dims) - 1)
+        count = (1,) + tuple(dims[1:])
+        return variable.get(start=start, count=count)[0]
+
+    def get_swath_shape(self, item):
+        """Shape of the array `get_swath_data` will return for `item`.
+        """
+        var_info = self.file_type_info.get(item)
+        dims = self[var_info.var_name].info()[2]
+        if isinstance(dims, int):
+            dims = [dims]
+        return tuple(dims[1:]) if var_info.index is not None else tuple(dims)
+
+    def get_swath_data(self, item, fill=None, out=None):
         """Retrieve the item asked for then set it to the specified data type, scale it, and mask it.
+
+        :param out: Optional array (or slice of a larger array) to write the result to, must have the data type of
+                    `item` and can't be used for items that are interpolated to a higher resolution
         """
         if fill is None:
             fill = self.get_fill_value(item)
         var_info = self.file_type_info.get(item)
-        variable = self[var_info.var_name]
-        data = variable.get()
-        if var_info.index is not None:
-            data = data[var_info.index]
+        if var_info.interpolate:
+            if out is not None:
+                LOG.error("Can't use an output array for interpolated item '%s'", item)
+                raise ValueError("Can't use an output array for interpolated item '%s'" % (item,))
+            return self._get_interpolated_nav(item, fill)
+        return self._decode_variable(item, var_info, fill, out=out)
+
+    def _get_interpolated_nav(self, item, fill):
+        """Get 250m or 500m navigation interpolated from this file's 1km navigation.
+
+        Both coordinates are interpolated at the same time and shared with every other reader of this file.
+        """
+        if item in [K_LONGITUDE_250, K_LATITUDE_250]:
+            lon_key, lat_key, res_factor = K_LONGITUDE_250, K_LATITUDE_250, 4
+        elif item in [K_LONGITUDE_500, K_LATITUDE_500]:
+            lon_key, lat_key, res_factor = K_LONGITUDE_500, K_LATITUDE_500, 2
+        else:
+            raise ValueError("Don't know how to interpolate item '%s'" % (item,))
+
+        nav_data = get_cached_nav(self.filepath, res_factor)
+        if nav_data is None:
+            LOG.info("Interpolating to higher resolution: %s" % (self.file_type_info[item].var_name,))
+            lon_data = self._decode_variable(lon_key, self.file_type_info[lon_key], numpy.nan)
+            lat_data = self._decode_variable(lat_key, self.file_type_info[lat_key], numpy.nan)
+            nav_data = interpolate_geolocation_cartesian(lon_data, lat_data, res_factor=res_factor,
+                                                         num_workers=self.geo_workers)
+            cache_nav(self.filepath, res_factor, *nav_data)
+        else:
+            LOG.debug("Using previously interpolated navigation for %s", item)
+
+        data = nav_data[0] if item == lon_key else nav_data[1]
+        if not numpy.isnan(fill):
+            data = numpy.where(numpy.isnan(data), data.dtype.type(fill), data)
+        return data
+
+    def _decode_variable(self, item, var_info, fill, out=None):
+        data = self._read_variable(var_info)
         # before or after scaling/offset?
         if var_info.bit_mask is not None:
             bit_mask = var_info.bit_mask
@@ -417,7 +565,10 @@ class FileReader(BaseFileReader):
             numpy.add(data, offset, data)
 
         # Convert to the correct data type
-        data = data.astype(var_info.data_type)
+        if out is None:
+            out = numpy.empty(data.shape, dtype=var_info.data_type)
+        out[...] = data
+        data = out
 
         # Get the fill value
         if var_info.fill_attr_name and isinstance(var_info.fill_attr_name, str):
@@ -444,7 +595,8 @@ class FileReader(BaseFileReader):
             data[(data == self.CANT_AGGR_VALUE) | (data == self.SATURATION_VALUE)] = valid_max
 
         if mask is not None and valid_max is not None:
-            mask[(data < valid_min) | (data > valid_max)] = True
+            mask |= data < valid_min
+            mask |= data > valid_max
 
         # Get the scaling factors
         scale_value = None
@@ -473,60 +625,37 @@ class FileReader(BaseFileReader):
         if scale_value is not None:
             data *= data.dtype.type(scale_value)
 
-        # Special case: 250m Resolution
-        if var_info.interpolate:
-            if mask is not None:
-                data[mask] = numpy.nan
-
-            if item in [K_LONGITUDE_250, K_LATITUDE_250]:
-                cache_key = "250"
-                lon_key = K_LONGITUDE_250
-                lat_key = K_LATITUDE_250
-                res_factor = 4
-            elif item in [K_LONGITUDE_500, K_LATITUDE_500]:
-                cache_key = "500"
-                lon_key = K_LONGITUDE_500
-                lat_key = K_LATITUDE_500
-                res_factor = 2
-            else:
-                raise ValueError("Don't know how to interpolate item '%s'" % (item,))
-
-            if self.nav_interpolation[cache_key][0] is not None and self.nav_interpolation[cache_key][1] is not None:
-                LOG.debug("Returning previously interpolated %sm resolution geolocation data", cache_key)
-                data = self.nav_interpolation[cache_key][not (item == lon_key)]
-                self.nav_interpolation[cache_key] = [None, None]
-                return data
-
-            self.nav_interpolation[cache_key][not (item == lon_key)] = data
-
-            if self.nav_interpolation[cache_key][0] is None or self.nav_interpolation[cache_key][1] is None:
-                # We don't have the other coordinate data yet
-                self.get_swath_data(lon_key if item == lat_key else lat_key, fill=fill)
-            else:
-                # We already have the other coordinate variable, the user isn't asking for this item so just return
-                LOG.debug("Returning 'None' because this instance of the function shouldn't have been called by the user")
-                return None
-
-            LOG.info("Interpolating to higher resolution: %s" % (var_info.var_name,))
-            lon_data, lat_data = self.nav_interpolation[cache_key]
-
-            new_lon_data, new_lat_data = interpolate_geolocation_cartesian(lon_data, lat_data,
-                                                                           res_factor=res_factor)
-
-            new_lon_data[numpy.isnan(new_lon_data)] = fill
-            new_lat_data[numpy.isnan(new_lat_data)] = fill
-            # Cache the results when the user requests the other coordinate
-            self.nav_interpolation[cache_key] = [new_lon_data, new_lat_data]
-            data = new_lon_data if item == lon_key else new_lat_data
-        elif mask is not None:
-            data[mask] = fill
+        if mask is not None:
+            numpy.putmask(data, mask, fill)
 
         return data
 
 
 class MultiFileReader(BaseMultiFileReader):
-    def __init__(self, file_type_info, single_class=FileReader):
+    def __init__(self, file_type_info, single_class=FileReader, geo_workers=1):
         super(MultiFileReader, self).__init__(file_type_info, single_class)
+        self.geo_workers = geo_workers
+
+    def add_file(self, fn):
+        super(MultiFileReader, self).add_file(fn)
+        self.file_readers[-1].geo_workers = self.geo_workers
+
+    def get_swath_data(self, item, fill=None):
+        """Get the scaled and masked data for `item` from every file as one array.
+
+        Each file is decoded directly in to its rows of the output array.
+        """
+        var_info = self.file_type_info.get(item)
+        if var_info.interpolate:
+            return super(MultiFileReader, self).get_swath_data(item)
+
+        shapes = [fr.get_swath_shape(item) for fr in self.file_readers]
+        out = numpy.empty((sum(shape[0] for shape in shapes),) + shapes[0][1:], dtype=var_info.data_type)
+        start_idx = 0
+        for fr, shape in zip(self.file_readers, shapes):
+            fr.get_swath_data(item, fill=fill, out=out[start_idx:start_idx + shape[0]])
+            start_idx += shape[0]
+        return out
 
 
 class FileInfo(object):
@@ -441,7 +441,9 @@ MASK_PRODUCTS = [
 class Frontend(roles.FrontendRole):
     FILE_EXTENSIONS = [".hdf"]
 
-    def __init__(self, **kwargs):
+    def __init__(self, histogram_workers=1, geo_workers=1, **kwargs):
+        self.histogram_workers = histogram_workers
+        self.geo_workers = geo_workers
         super(Frontend, self).__init__(**kwargs)
         self.file_readers = {}
         self.available_file_types = []
@@ -485,7 +487,7 @@ class Frontend(roles.FrontendRole):
         This method should not be called by the user.
         """
         for file_type, file_type_info in guidebook.FILE_TYPES.items():
-            self.file_readers[file_type] = guidebook.MultiFileReader(file_type_info)
+            self.file_readers[file_type] = guidebook.MultiFileReader(file_type_info, geo_workers=self.geo_workers)
 
         # Don't modify the passed list (we use in place operations)
         file_paths_left = []
@@ -704,7 +706,46 @@ class Frontend(roles.FrontendRole):
         )
         return one_swath
 
-    def create_scene(self, products=None, **kwargs):
+    def subset_files_to_ll_bbox(self, ll_bbox, geo_pair_names):
+        """Only use the granules (files) whose geolocation is inside a longitude/latitude bounding box.
+
+        Only a coarse subsample of each geolocation file is read to decide which granules to keep.
+
+        :param ll_bbox: (lon_min, lat_min, lon_max, lat_max) in degrees
+        :param geo_pair_names: Geolocation pairs to check, a granule is kept if any of them are in the bounding box
+        """
+        keep_times = set()
+        num_granules = 0
+        for geo_pair_name in geo_pair_names:
+            lon_product_def = PRODUCTS[GEO_PAIRS[geo_pair_name].lon_product]
+            lat_product_def = PRODUCTS[GEO_PAIRS[geo_pair_name].lat_product]
+            geo_file_reader = self.file_readers[lon_product_def.get_file_type(self.available_file_types)]
+            keep_times |= geo_file_reader.begin_times_in_ll_bbox(
+                lon_product_def.get_file_key(self.available_file_types),
+                lat_product_def.get_file_key(self.available_file_types), ll_bbox)
+            num_granules = max(num_granules, len(geo_file_reader.file_readers))
+
+        if not keep_times:
+            LOG.error("No data files are within the longitude/latitude bounding box: %r", ll_bbox)
+            raise ValueError("No data files are within the longitude/latitude bounding box: %r" % (ll_bbox,))
+        LOG.info("Using %d out of %d granules within the longitude/latitude bounding box",
+                 len(keep_times), num_granules)
+        for file_reader in self.file_readers.values():
+            file_reader.subset_files_by_begin_time(keep_times)
+
+    def create_scene(self, products=None, ll_bbox=None, **kwargs):
+        """Create a `SwathScene` object with the specified products in it.
+
+        :param products: List of product names to create (default products if not provided)
+        :param ll_bbox: Only extract granules inside this (lon_min, lat_min, lon_max, lat_max) bounding box
+        """
+        try:
+            return self._create_scene(products=products, ll_bbox=ll_bbox, **kwargs)
+        finally:
+            # every product has been written to disk, the interpolated navigation isn't needed anymore
+            guidebook.clear_nav_cache()
+
+    def _create_scene(self, products=None, ll_bbox=None, **kwargs):
         LOG.debug("Loading scene data...")
         # If the user didn't provide the products they want, figure out which ones we can create
         if products is None:
@@ -717,6 +758,8 @@ class Frontend(roles.FrontendRole):
         # Needs to be ordered (least-depended product -> most-depended product)
         products_needed = PRODUCTS.dependency_ordered_products(products)
         geo_pairs_needed = PRODUCTS.geo_pairs_for_products(products_needed, self.available_file_types)
+        if ll_bbox is not None:
+            self.subset_files_to_ll_bbox(ll_bbox, geo_pairs_needed)
         # both lists below include raw products that need extra processing/masking
         raw_products_needed = (p for p in products_needed if PRODUCTS.is_raw(p, geo_is_raw=False))
         secondary_products_needed = [p for p in products_needed if PRODUCTS.needs_processing(p)]
@@ -837,7 +880,6 @@ class Frontend(roles.FrontendRole):
 
         ir_product_name = deps[0]
         ir_product = products_created[ir_product_name]
-        ir_mask = ir_product.get_data_mask()
         filename = product_name + ".dat"
         if os.path.isfile(filename):
             if not self.overwrite_existing:
@@ -868,8 +910,8 @@ class Frontend(roles.FrontendRole):
                 PRODUCT_BT36: 36,
             }[product_name]
             # since the input and output fill value and the invalid calculation value are all NaN we don't have to do
-            # any extra calculations
-            output_data[~ir_mask] = bright_shift(sat.title(), output_data[~ir_mask], band_number)
+            # any extra calculations and can convert the radiances in place (in chunks)
+            bright_shift(sat.title(), output_data, band_number, out=output_data)
 
             one_swath = self.create_secondary_swath_object(product_name, swath_definition, filename,
                                                            ir_product["data_type"], products_created)
@@ -901,7 +943,8 @@ class Frontend(roles.FrontendRole):
 
         try:
             output_data = bt_product.copy_array(filename=filename, read_only=False)
-            histogram.local_histogram_equalization(bt_data, ~bt_mask, do_log_scale=False, out=output_data)
+            histogram.local_histogram_equalization(bt_data, ~bt_mask, do_log_scale=False, out=output_data,
+                                                   num_workers=self.histogram_workers)
 
             one_swath = self.create_secondary_swath_object(product_name, swath_definition, filename,
                                                            bt_product["data_type"], products_created)
@@ -1021,10 +1064,10 @@ class Frontend(roles.FrontendRole):
 
     def _get_day_percentage(self, sza_swath):
         if "day_percentage" not in sza_swath:
-            sza_data = sza_swath.get_data_array()
-            invalid_mask = sza_swath.get_data_mask()
-            valid_day_mask = (sza_data < 90) & ~invalid_mask
-            fraction_day = numpy.count_nonzero(valid_day_mask) / (float(sza_data.size) - numpy.count_nonzero(invalid_mask))
+            # estimate from the files so the SZA data doesn't have to be loaded
+            product_def = PRODUCTS[sza_swath["product_name"]]
+            file_reader = self.file_readers[product_def.get_file_type(self.available_file_types)]
+            fraction_day = file_reader.get_day_fraction(product_def.get_file_key(self.available_file_types), 90)
             sza_swath["day_percentage"] = fraction_day * 100.0
         else:
             LOG.debug("Day percentage found in SZA swath already")
@@ -1060,10 +1103,17 @@ def add_frontend_argument_groups(parser):
     group = parser.add_argument_group(title=group_title, description="swath extraction initialization options")
     group.add_argument("--list-products", dest="list_products", action="store_true",
                        help="List available frontend products and exit")
+    group.add_argument("--histogram-workers", dest="histogram_workers", type=int, default=1,
+                       help="Number of threads to use for adaptive histogram equalization products (default 1)")
+    group.add_argument("--geo-workers", dest="geo_workers", type=int, default=1,
+                       help="Number of threads to use when interpolating 250m and 500m navigation (default 1)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("-p", "--products", dest="products", nargs="+", default=None, action=ExtendAction,
                        help="Specify frontend products to process")
+    group.add_argument("--ll-bbox", dest="ll_bbox", nargs=4, type=float, default=None,
+                       metavar=("lon_min", "lat_min", "lon_max", "lat_max"),
+                       help="Only extract granules with data inside this longitude/latitude bounding box")
     group.add_argument('--ir-products', dest='products', action=ExtendConstAction, const=RAD_PRODUCTS,
                        help="Add IR products to list of products")
     group.add_argument('--bt-products', dest='products', action=ExtendConstAction, const=BT_PRODUCTS,
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test the MODIS file readers and the shared interpolated navigation cache."""
+__docformat__ = "restructuredtext en"
+
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy
+import pytest
+
+from polar2grid.modis import modis_guidebook
+
+
+class _FakeSDS(object):
+    """Minimal stand-in for a pyhdf SDS variable."""
+    def __init__(self, data, **attrs):
+        self.data = data
+        self.attrs = attrs
+
+    def info(self):
+        return "", self.data.ndim, list(self.data.shape), 0, len(self.attrs)
+
+    def attributes(self):
+        return self.attrs
+
+    def get(self, start=None, count=None):
+        if start is None:
+            return self.data.copy()
+        return self.data[tuple(slice(s, s + c) for s, c in zip(start, count))].copy()
+
+
+class _FakeHDFEOS(object):
+    """Minimal stand-in for an `HDFEOSReader` with 'var_name.attr_name' access."""
+    instrument = "modis"
+    satellite = "aqua"
+
+    def __init__(self, filepath, variables, begin_time=datetime(2015, 1, 1)):
+        self.filepath = filepath
+        self.filename = filepath.rsplit("/", 1)[-1]
+        self.variables = variables
+        self.begin_time = self.end_time = begin_time
+
+    def __getitem__(self, item):
+        var_name, attr_name = item.split(".") if "." in item else (item, None)
+        if attr_name:
+            return self.variables[var_name].attrs[attr_name]
+        return self.variables[var_name]
+
+
+def _geo_handle(filepath, num_scans=42):
+    lon, lat = numpy.meshgrid(numpy.linspace(-20., 20., 30), numpy.linspace(40., 60., num_scans * 10))
+    lon = lon.astype(numpy.float32)
+    lat = lat.astype(numpy.float32)
+    lon[5, 5] = -999.
+    attrs = dict(valid_range=(-180., 180.), _FillValue=-999.)
+    return _FakeHDFEOS(filepath, {"Longitude": _FakeSDS(lon, **attrs), "Latitude": _FakeSDS(lat, **attrs)})
+
+
+def _nav(value, shape=(4, 5)):
+    return (numpy.zeros(shape, dtype=numpy.float32) + value,
+            numpy.zeros(shape, dtype=numpy.float32) - value)
+
+
+@pytest.fixture
+def nav_cache(tmpdir, monkeypatch):
+    """Empty navigation cache that holds two (4, 5) lon/lat pairs in memory and spills to `tmpdir`."""
+    monkeypatch.setattr(modis_guidebook, "_NAV_CACHE", OrderedDict())
+    monkeypatch.setattr(modis_guidebook, "_NAV_SPILLED", {})
+    monkeypatch.setattr(modis_guidebook, "_NAV_SPILL_DIR", str(tmpdir.mkdir("nav_spill")))
+    monkeypatch.setattr(modis_guidebook, "NAV_CACHE_SIZE", 2 * 2 * 4 * 5 * 4)
+    return modis_guidebook
+
+
+def _assert_nav(nav_data, value):
+    assert nav_data is not None
+    numpy.testing.assert_array_equal(nav_data[0], value)
+    numpy.testing.assert_array_equal(nav_data[1], -value)
+
+
+def test_cache_nav_lru(nav_cache):
+    assert nav_cache.get_cached_nav("/data/a/geo1.hdf", 2) is None
+    nav_cache.cache_nav("/data/a/geo1.hdf", 2, *_nav(1))
+    nav_cache.cache_nav("/data/a/geo2.hdf", 2, *_nav(2))
+    # use the first file so the second one is the least recently used
+    _assert_nav(nav_cache.get_cached_nav("/data/a/geo1.hdf", 2), 1)
+    nav_cache.cache_nav("/data/a/geo3.hdf", 2, *_nav(3))
+
+    assert list(nav_cache._NAV_CACHE.keys()) == [("/data/a/geo1.hdf", 2), ("/data/a/geo3.hdf", 2)]
+    assert list(nav_cache._NAV_SPILLED.keys()) == [("/data/a/geo2.hdf", 2)]
+    # results are shared between readers so they can't be modified
+    lon, lat = nav_cache.get_cached_nav("/data/a/geo1.hdf", 2)
+    assert not lon.flags.writeable and not lat.flags.writeable
+    # res_factor is part of the key
+    assert nav_cache.get_cached_nav("/data/a/geo1.hdf", 4) is None
+
+
+def test_cache_nav_spill_reload(nav_cache):
+    nav_cache.cache_nav("/data/a/geo1.hdf", 2, *_nav(1.5))
+    nav_cache.cache_nav("/data/a/geo2.hdf", 2, *_nav(2))
+    nav_cache.cache_nav("/data/a/geo3.hdf", 2, *_nav(3))
+    lon, lat = nav_cache.get_cached_nav("/data/a/geo1.hdf", 2)
+    assert isinstance(lon, numpy.memmap)
+    assert lon.dtype == numpy.float32 and lon.shape == (4, 5)
+    assert not lon.flags.writeable and not lat.flags.writeable
+    _assert_nav((lon, lat), 1.5)
+
+
+def test_cache_nav_spill_same_basename(nav_cache):
+    # newest result always stays in memory, even if it is larger than the cache size
+    nav_cache.cache_nav("/data/a/geo.hdf", 2, *_nav(1))
+    nav_cache.cache_nav("/data/b/geo.hdf", 2, *_nav(2))
+    nav_cache.cache_nav("/data/c/other.hdf", 2, *_nav(3, shape=(8, 10)))
+    assert list(nav_cache._NAV_CACHE.keys()) == [("/data/c/other.hdf", 2)]
+    _assert_nav(nav_cache.get_cached_nav("/data/a/geo.hdf", 2), 1)
+    _assert_nav(nav_cache.get_cached_nav("/data/b/geo.hdf", 2), 2)
+    _assert_nav(nav_cache.get_cached_nav("/data/c/other.hdf", 2), 3)
+
+
+def test_clear_nav_cache(nav_cache):
+    spill_dir = nav_cache._NAV_SPILL_DIR
+    for idx in range(3):
+        nav_cache.cache_nav("/data/a/geo%d.hdf" % (idx,), 2, *_nav(idx))
+    assert len(os.listdir(spill_dir)) == 2
+    nav_cache.clear_nav_cache()
+    assert not os.path.exists(spill_dir)
+    assert nav_cache._NAV_SPILL_DIR is None
+    for idx in range(3):
+        assert nav_cache.get_cached_nav("/data/a/geo%d.hdf" % (idx,), 2) is None
+
+    # a new spill directory is made when needed
+    for idx in range(3):
+        nav_cache.cache_nav("/data/a/geo%d.hdf" % (idx,), 2, *_nav(idx))
+    assert nav_cache._NAV_SPILL_DIR is not None
+    _assert_nav(nav_cache.get_cached_nav("/data/a/geo0.hdf", 2), 0)
+    nav_cache.clear_nav_cache()
+
+
+def test_interpolated_nav_geo_workers(nav_cache, monkeypatch):
+    num_workers_used = []
+    interpolate_geolocation_cartesian = modis_guidebook.interpolate_geolocation_cartesian
+
+    def _record_workers(lon_data, lat_data, res_factor=4, num_workers=1):
+        num_workers_used.append(num_workers)
+        return interpolate_geolocation_cartesian(lon_data, lat_data, res_factor=res_factor, num_workers=num_workers)
+    monkeypatch.setattr(modis_guidebook, "interpolate_geolocation_cartesian", _record_workers)
+    monkeypatch.setattr(modis_guidebook, "NAV_CACHE_SIZE", 2 ** 30)
+
+    results = []
+    for geo_workers in (1, 3):
+        file_reader = modis_guidebook.MultiFileReader(modis_guidebook.FILE_TYPES[modis_guidebook.FT_GEO],
+                                                      geo_workers=geo_workers)
+        file_reader.add_file(_geo_handle("/data/%d/geo.hdf" % (geo_workers,)))
+        assert file_reader.file_readers[0].geo_workers == geo_workers
+        results.append([file_reader.file_readers[0].get_swath_data(key, fill=numpy.nan)
+                        for key in (modis_guidebook.K_LONGITUDE_250, modis_guidebook.K_LATITUDE_250)])
+    assert num_workers_used == [1, 3]
+    assert results[0][0].shape == (420 * 4, 30 * 4)
+    for serial, threaded in zip(*results):
+        numpy.testing.assert_array_equal(serial, threaded)
+
+
+def _old_decode(file_reader, item, fill):
+    """Read the whole variable and then decode `item` the way the reader did before reading hyperslabs."""
+    var_info = file_reader.file_type_info[item]
+    data = file_reader[var_info.var_name].get()
+    if var_info.index is not None:
+        data = data[var_info.index]
+    if var_info.bit_mask is not None:
+        numpy.bitwise_and(data, var_info.bit_mask, data)
+        numpy.right_shift(data, var_info.right_shift, data)
+        numpy.add(data, var_info.additional_offset, data)
+    data = data.astype(var_info.data_type)
+    if var_info.fill_attr_name and isinstance(var_info.fill_attr_name, str):
+        mask = data == file_reader[var_info.var_name + "." + var_info.fill_attr_name]
+    elif var_info.fill_attr_name:
+        mask = data >= var_info.fill_attr_name
+    else:
+        mask = data == -999.0
+    valid_min, valid_max = None, None
+    if var_info.range_attr_name:
+        valid_min, valid_max = file_reader[var_info.var_name + "." + var_info.range_attr_name]
+    if var_info.clip_saturated and valid_max is not None:
+        data[(data == file_reader.CANT_AGGR_VALUE) | (data == file_reader.SATURATION_VALUE)] = valid_max
+    if valid_max is not None:
+        mask[(data < valid_min) | (data > valid_max)] = True
+    for attr_name, func in ((var_info.offset_attr_name, numpy.subtract), (var_info.scale_attr_name, numpy.multiply)):
+        try:
+            value = file_reader[var_info.var_name + "." + attr_name]
+        except (KeyError, TypeError):
+            continue
+        if var_info.index is not None:
+            value = value[var_info.index]
+        func(data, data.dtype.type(float(value)), out=data)
+    data[mask] = fill
+    return data
+
+
+def _l1b_handle(filepath, num_rows, seed):
+    rs = numpy.random.RandomState(seed)
+    shape = (num_rows, 12)
+    refsb = rs.randint(0, 40000, (2,) + shape).astype(numpy.uint16)
+    refsb[0, 0, :3] = 65535
+    refsb[1, 1, :3] = (65533, 65528, 65535)
+    emissive = rs.randint(0, 40000, (16,) + shape).astype(numpy.uint16)
+    emissive[0, 2, 2] = 65535
+    band26 = rs.randint(0, 40000, shape).astype(numpy.uint16)
+    attrs = dict(valid_range=(0, 32767), _FillValue=65535)
+    return _FakeHDFEOS(filepath, {
+        "EV_250_Aggr1km_RefSB": _FakeSDS(refsb, reflectance_scales=[5.2e-5, 3.1e-5],
+                                         reflectance_offsets=[0., 316.9], **attrs),
+        "EV_1KM_Emissive": _FakeSDS(emissive, radiance_scales=rs.uniform(1e-4, 1e-2, 16),
+                                    radiance_offsets=rs.uniform(1000., 2000., 16), **attrs),
+        "EV_Band26": _FakeSDS(band26, reflectance_scales=4.4e-5, reflectance_offsets=0., **attrs),
+    })
+
+
+def _mod35_handle(filepath, num_rows, seed):
+    rs = numpy.random.RandomState(seed)
+    cloud_mask = rs.randint(-128, 128, (6, num_rows, 12)).astype(numpy.int8)
+    return _FakeHDFEOS(filepath, {"Cloud_Mask": _FakeSDS(cloud_mask, valid_range=(0, 4), _FillValue=0)})
+
+
+@pytest.mark.parametrize(("file_type", "create_handle", "items"), [
+    (modis_guidebook.FT_1000M, _l1b_handle, (modis_guidebook.K_VIS01, modis_guidebook.K_VIS02,
+                                            modis_guidebook.K_IR20, modis_guidebook.K_IR36,
+                                            modis_guidebook.K_VIS26)),
+    (modis_guidebook.FT_MOD35, _mod35_handle, (modis_guidebook.K_CMASK,)),
+])
+def test_decode_hyperslabs(file_type, create_handle, items):
+    file_reader = modis_guidebook.MultiFileReader(modis_guidebook.FILE_TYPES[file_type])
+    file_reader.add_files([create_handle("/data/granule%d.hdf" % (idx,), num_rows, idx)
+                           for idx, num_rows in enumerate((20, 30, 10))])
+    for item in items:
+        var_info = modis_guidebook.FILE_TYPES[file_type][item]
+        fill = numpy.nan if numpy.issubdtype(var_info.data_type, numpy.floating) else -999
+        expected = numpy.concatenate([_old_decode(fr, item, fill) for fr in file_reader.file_readers])
+        result = file_reader.get_swath_data(item, fill=fill)
+        assert result.dtype == var_info.data_type
+        numpy.testing.assert_array_equal(result, expected)
+
+        # single file decoded in to part of a larger array
+        out = numpy.zeros((40, 12), dtype=var_info.data_type)
+        single_result = file_reader.file_readers[1].get_swath_data(item, fill=fill, out=out[5:35])
+        assert numpy.shares_memory(single_result, out)
+        numpy.testing.assert_array_equal(out[5:35], expected[20:50])
+        assert not out[:5].any() and not out[35:].any()
+    if file_type == modis_guidebook.FT_1000M:
+        vis01 = file_reader.get_swath_data(modis_guidebook.K_VIS01, fill=numpy.nan)
+        vis02 = file_reader.get_swath_data(modis_guidebook.K_VIS02, fill=numpy.nan)
+        # fill values are masked, saturated values are clipped to the valid maximum
+        assert numpy.isnan(vis01[0, :3]).all()
+        numpy.testing.assert_allclose(vis02[1, :2], (32767 - 316.9) * 3.1e-5, rtol=1e-6)
+        assert numpy.isnan(vis02[1, 2])
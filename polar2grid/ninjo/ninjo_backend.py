@@ -270,6 +270,8 @@ def add_backend_argument_groups(parser):
                        help="alternative rescale configuration files")
     group.add_argument('--backend-configs', nargs="*", dest="backend_configs",
                        help="alternative backend configuration files")
+    group.add_argument('--writer-workers', dest="writer_workers", type=int, default=1,
+                       help="number of products to write in parallel (default: 1)")
     group = parser.add_argument_group(title="Backend Output Creation")
     group.add_argument("--output-pattern", default=DEFAULT_OUTPUT_PATTERN,
                        help="output filenaming pattern")
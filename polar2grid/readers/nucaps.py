@@ -276,6 +276,7 @@ __docformat__ = "restructuredtext en"
 import sys
 
 import logging
+import numpy as np
 from polar2grid.readers import ReaderWrapper, main
 
 LOG = logging.getLogger(__name__)
@@ -285,24 +286,43 @@ class Frontend(ReaderWrapper):
     FILE_EXTENSIONS = [".nc"]
     DEFAULT_READER_NAME = "nucaps"
     DEFAULT_DATASETS = []
+    DEFAULT_PRESSURE_DATASETS = ["Temperature", "H2O_MR"]
+    DEFAULT_SURFACE_DATASETS = ["Topography", "Surface_Pressure", "Skin_Temperature"]
 
     def __init__(self, *args, **kwargs):
         super(Frontend, self).__init__(**kwargs)
         reader = self.scene.readers[self.reader]
         self.DEFAULT_DATASETS = []
-        for base_name in ["Temperature", "H2O_MR"]:
+        for base_name in self.DEFAULT_PRESSURE_DATASETS:
             self.DEFAULT_DATASETS.extend(reader.pressure_dataset_names[base_name])
-        self.DEFAULT_DATASETS.extend([
-            "Topography", "Surface_Pressure", "Skin_Temperature"])
+        self.DEFAULT_DATASETS.extend(self.DEFAULT_SURFACE_DATASETS)
 
-    def create_scene(self, products=None, **kwargs):
+    def _pressure_products(self, base_name, levels=None):
+        """Get the pressure separated dataset names for `base_name`.
+
+        :param levels: pressure values (mb) to limit the datasets to, the nearest level is used for each
+        """
+        press_products = self.scene.readers[self.reader].pressure_dataset_names.get(base_name)
+        if not press_products or not levels:
+            return press_products
+        # dataset names end with the rounded pressure value: <base_name>_<pressure>mb
+        name_pressures = np.array([float(name[len(base_name) + 1:-2]) for name in press_products])
+        dexes = np.abs(name_pressures[None, :] - np.asarray(levels, dtype=np.float64)[:, None]).argmin(axis=1)
+        return [press_products[dex] for dex in sorted(set(dexes))]
+
+    def create_scene(self, products=None, levels=None, **kwargs):
+        if levels:
+            # only the datasets of the requested levels are loaded so the pressure range doesn't apply
+            kwargs.pop("pressure_levels", None)
+            if products is None:
+                products = self.DEFAULT_PRESSURE_DATASETS + self.DEFAULT_SURFACE_DATASETS
         # P2G can't handle 3D sets so we know if they have non-pressure separated dataset names
-        # they mean all of them
+        # they mean all of them (or all of the requested levels)
         if products:
             old_products = products
             products = []
             for product in old_products:
-                press_products = self.scene.readers[self.reader].pressure_dataset_names.get(product)
+                press_products = self._pressure_products(product, levels)
                 if press_products:
                     products.extend(press_products)
                 else:
@@ -335,6 +355,9 @@ def add_frontend_argument_groups(parser):
                        help="Specify frontend products to process")
     group.add_argument("--pressure-levels", nargs=2, type=float, default=(110., 987.0),
                        help="Min and max pressure value to make available")
+    group.add_argument("--levels", nargs="+", type=float, default=None,
+                       help="Pressure levels (mb) to load, the nearest level is used for each "
+                            "(overrides --pressure-levels)")
     return ["Frontend Initialization", "Frontend Swath Extraction"]
 
 if __name__ == "__main__":
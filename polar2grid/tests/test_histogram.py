@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test histogram equalization functions.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2018 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import sys
+
+import logging
+import numpy
+import pytest
+
+from polar2grid.core import histogram
+
+LOG = logging.getLogger(__name__)
+
+
+def create_test_data(shape=(300, 400), dtype=numpy.float32):
+    rs = numpy.random.RandomState(0)
+    data = rs.lognormal(0.0, 2.0, shape).astype(dtype)
+    mask = data > 0.01
+    return data, mask
+
+
+def _simple_histogram_equalization(data, mask_to_equalize, number_of_bins=1000, std_mult_cutoff=4.0):
+    """Reference implementation using numpy's histogram and interp functions."""
+    out = data.copy()
+    avg = numpy.mean(data[mask_to_equalize])
+    std = numpy.std(data[mask_to_equalize])
+    conservative_mask = (data < (avg + std * std_mult_cutoff)) & (data > (avg - std * std_mult_cutoff)) & mask_to_equalize
+    cdf, bins = histogram._histogram_equalization_helper(data[conservative_mask], number_of_bins)
+    out[mask_to_equalize] = numpy.interp(data[mask_to_equalize], bins[:-1], cdf) / number_of_bins
+    return out
+
+
+class TestHistogramEqualization(object):
+    def test_fast_matches_reference(self):
+        data, mask = create_test_data()
+        expected = _simple_histogram_equalization(data, mask)
+        result = histogram.histogram_equalization(data, mask)
+        numpy.testing.assert_allclose(result[mask], expected[mask], atol=1e-5)
+        # data outside the mask is untouched
+        numpy.testing.assert_array_equal(result[~mask], data[~mask])
+
+    def test_fast_constant_data(self):
+        data = numpy.ones((10, 10), dtype=numpy.float32)
+        mask = numpy.ones(data.shape, dtype=numpy.bool_)
+        result = histogram.histogram_equalization(data, mask)
+        assert numpy.all((result >= 0) & (result <= 1))
+
+
+def _loop_slope_limited_cdf(temp_histogram, slope_limit):
+    """Reference implementation of the slope limit, one bin at a time."""
+    cumulative_dist_function = temp_histogram.cumsum()
+    pixel_height_limit = int(slope_limit * (temp_histogram.sum() / float(temp_histogram.size)))
+    cumulative_excess_height = 0
+    for pixel_index in range(1, cumulative_dist_function.size):
+        current_pixel_count = cumulative_dist_function[pixel_index]
+        diff_from_acceptable = (current_pixel_count - cumulative_dist_function[pixel_index - 1] -
+                                pixel_height_limit - cumulative_excess_height)
+        cumulative_excess_height += max(diff_from_acceptable, 0)
+        cumulative_dist_function[pixel_index] = current_pixel_count - cumulative_excess_height
+    return (temp_histogram.size - 1) * cumulative_dist_function / float(cumulative_dist_function[-1])
+
+
+class TestLocalHistogramEqualization(object):
+    def test_slope_limit(self):
+        rs = numpy.random.RandomState(0)
+        for _ in range(5):
+            temp_histogram = numpy.histogram(rs.lognormal(0.0, 1.0, 5000), 1000)[0]
+            expected = _loop_slope_limited_cdf(temp_histogram, 3.0)
+            result = histogram._clipped_cdf(temp_histogram, 1000, slope_limit=3.0)
+            numpy.testing.assert_allclose(result, expected)
+            # every tile's histogram is processed at the same time
+            result = histogram._clipped_cdf(numpy.array([temp_histogram, temp_histogram]), 1000, slope_limit=3.0)
+            numpy.testing.assert_allclose(result[1], expected)
+
+    def test_basic(self):
+        data, valid_mask = create_test_data(shape=(250, 320))
+        mask = valid_mask.copy()
+        mask[:, :100] = False
+        result = histogram.local_histogram_equalization(data, mask, valid_data_mask=valid_mask, local_radius_px=30)
+        assert numpy.all((result[mask] >= 0) & (result[mask] <= 1))
+        assert numpy.all(result[~mask] == 0)
+
+    def test_num_workers(self):
+        data, mask = create_test_data(shape=(250, 320))
+        expected = histogram.local_histogram_equalization(data, mask, local_radius_px=30)
+        result = histogram.local_histogram_equalization(data, mask, local_radius_px=30, num_workers=3)
+        numpy.testing.assert_array_equal(result, expected)
+
+    def test_single_tile(self):
+        """Test that one tile with no neighbors is the same as a plain histogram equalization."""
+        data, mask = create_test_data(shape=(61, 61))
+        result = histogram.local_histogram_equalization(data, mask, local_radius_px=30, std_mult_cutoff=None,
+                                                        clip_limit=None, slope_limit=None, do_log_scale=False)
+        expected = histogram.histogram_equalization(data, mask, std_mult_cutoff=numpy.inf)
+        numpy.testing.assert_allclose(result[mask], expected[mask], atol=1e-5)
+
+
+def main():
+    import os
+    return pytest.main([os.path.dirname(os.path.realpath(__file__))])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -122,7 +122,8 @@ class EDRFrontend(SDRFrontend):
     PRODUCTS = PRODUCTS
     GEO_PAIRS = GEO_PAIRS
 
-    def __init__(self, use_terrain_corrected=True, day_fraction=0.10, night_fraction=0.10, sza_threshold=100, **kwargs):
+    def __init__(self, use_terrain_corrected=True, day_fraction=0.10, night_fraction=0.10, sza_threshold=100,
+                 read_workers=1, **kwargs):
         """Initialize the frontend.
 
         For each search path, check if it exists and that it is
@@ -135,6 +136,7 @@ class EDRFrontend(SDRFrontend):
 
         :param search_paths: A list of paths to search for usable files
         :param use_terrain_corrected: Look for terrain-corrected files instead of non-TC files (default True)
+        :param read_workers: Number of threads to use for reading granules ahead of writing them (default 1)
         """
         self.use_terrain_corrected = use_terrain_corrected
         LOG.debug("Day fraction set to %f", day_fraction)
@@ -143,6 +145,8 @@ class EDRFrontend(SDRFrontend):
         self.night_fraction = night_fraction
         LOG.debug("SZA threshold set to %f", sza_threshold)
         self.sza_threshold = sza_threshold
+        self.read_workers = read_workers
+        self.secondary_workers = 1
         # Don't call the SDRFrontend's init, call its parent
         super(SDRFrontend, self).__init__(**kwargs)
 
@@ -344,3 +344,39 @@ FILE_TYPES[FILE_TYPE_GCLDO] = create_geo_file_info("CLD-AGG", "")
 
 DATA_PATHS = dict((v[K_DATA_PATH], k) for k, v in FILE_TYPES.items())
 
+# Filename prefixes of files that contain only one file type
+# Files without one of these prefixes (ex. combined "GMTCO-SVM05_..." files) have to be opened to be identified
+FILE_PREFIXES = {
+    "SVI01": FILE_TYPE_I01,
+    "SVI02": FILE_TYPE_I02,
+    "SVI03": FILE_TYPE_I03,
+    "SVI04": FILE_TYPE_I04,
+    "SVI05": FILE_TYPE_I05,
+    "SVM01": FILE_TYPE_M01,
+    "SVM02": FILE_TYPE_M02,
+    "SVM03": FILE_TYPE_M03,
+    "SVM04": FILE_TYPE_M04,
+    "SVM05": FILE_TYPE_M05,
+    "SVM06": FILE_TYPE_M06,
+    "SVM07": FILE_TYPE_M07,
+    "SVM08": FILE_TYPE_M08,
+    "SVM09": FILE_TYPE_M09,
+    "SVM10": FILE_TYPE_M10,
+    "SVM11": FILE_TYPE_M11,
+    "SVM12": FILE_TYPE_M12,
+    "SVM13": FILE_TYPE_M13,
+    "SVM14": FILE_TYPE_M14,
+    "SVM15": FILE_TYPE_M15,
+    "SVM16": FILE_TYPE_M16,
+    "SVDNB": FILE_TYPE_DNB,
+    "GDNBO": FILE_TYPE_GDNBO,
+    "GITCO": FILE_TYPE_GITCO,
+    "GMTCO": FILE_TYPE_GMTCO,
+    "GIMGO": FILE_TYPE_GIMGO,
+    "GMODO": FILE_TYPE_GMODO,
+    "VAOOO": FILE_TYPE_VAOOO,
+    "VCOTO": FILE_TYPE_VCOTO,
+    "GAERO": FILE_TYPE_GAERO,
+    "GCLDO": FILE_TYPE_GCLDO,
+}
+
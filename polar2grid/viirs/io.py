@@ -40,6 +40,7 @@ Simple objects to assist in reading VIIRS data from hdf5 (.h5) files.
 """
 __docformat__ = "restructuredtext en"
 
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 import h5py
@@ -57,43 +58,80 @@ ORBIT_TRANSITION_THRESHOLD = timedelta(seconds=10)
 
 class HDF5Reader(object):
     """Generic HDF5 reading class.
+
+    Variables and attributes are found when they are first requested instead of walking the entire file when it is
+    opened. Aggregated SDR files can have thousands of objects and we only ever need a handful of them. The most
+    recently used items are kept in a small cache.
     """
+    CACHE_SIZE = 256
+
     def __init__(self, filename):
         self.filename = os.path.basename(filename)
         self.filepath = os.path.realpath(filename)
         self._h5_handle = h5py.File(filename, 'r')
-        self.file_items = {}
-        self._h5_handle.visititems(self._visit_items)
-        # Also add the global attributes
-        for attr_name, attr_val in self._h5_handle.attrs.items():
-            try:    
-                self.file_items["." + attr_name] = attr_val[0][0]
-            except TypeError:
-                self.file_items["." + attr_name] = attr_val[0]        
-
-    def _visit_items(self, name, obj):
-        """Look at each variable in the HDF file and record its attributes.
-
-        We also store the variable name because sometimes h5py gives you an
-        unhelpful/weird KeyError if it doesn't have that key.
-        """
-        self.file_items[name] = obj
-        for attr_name, attr_obj in obj.attrs.items():
-            self.file_items[name + "." + attr_name] = attr_obj
+        self._item_cache = OrderedDict()
 
-    def __contains__(self, key):
+    def _resolve_item(self, key):
+        """Get the HDF5 variable or attribute represented by `key`.
+
+        Keys are variable paths (``"All_Data/var"``), variable attributes (``"All_Data/var.attr_name"``), or global
+        attributes (``".attr_name"``).
+
+        :raises: KeyError if the file has no matching variable or attribute
+        """
+        if key in self._h5_handle:
+            return self._h5_handle[key]
+
+        # variable names could have periods in them so try every split starting from the right
+        idx = key.rfind(".")
+        while idx >= 0:
+            obj_path = key[:idx]
+            attr_name = key[idx + 1:]
+            if not obj_path:
+                if attr_name in self._h5_handle.attrs:
+                    attr_val = self._h5_handle.attrs[attr_name]
+                    try:
+                        return attr_val[0][0]
+                    except TypeError:
+                        return attr_val[0]
+            elif obj_path in self._h5_handle and attr_name in self._h5_handle[obj_path].attrs:
+                return self._h5_handle[obj_path].attrs[attr_name]
+            idx = key.rfind(".", 0, idx)
+        raise KeyError(key)
+
+    def _get_item(self, key):
+        """Get `key` from the cache, resolving and caching it if needed.
+
+        Keys that don't exist are cached too (as `None`) so file type checks don't hit the file more than once.
+        """
         if key.startswith("/"):
             key = key[1:]
 
-        return key in self.file_items
+        try:
+            self._item_cache.move_to_end(key)
+            return self._item_cache[key]
+        except KeyError:
+            pass
+
+        try:
+            value = self._resolve_item(key)
+        except KeyError:
+            value = None
+        self._item_cache[key] = value
+        if len(self._item_cache) > self.CACHE_SIZE:
+            self._item_cache.popitem(last=False)
+        return value
+
+    def __contains__(self, key):
+        return self._get_item(key) is not None
 
     def __getitem__(self, key):
         """Get HDF5 variable, making it easier to access attributes.
         """
-        if key.startswith("/"):
-            key = key[1:]
-
-        return self.file_items[key]
+        value = self._get_item(key)
+        if value is None:
+            raise KeyError(key)
+        return value
 
 
 def file_time_to_datetime(file_time):
@@ -155,36 +193,57 @@ class VIIRSSDRReader(BaseFileReader):
         if '.' in known_item:
             # squeeze attributes
             value = numpy.squeeze(value)
-        if issubclass(value.dtype.type, numpy.string_) and not value.shape:
-            value = numpy.asscalar(value)
+        if issubclass(value.dtype.type, numpy.bytes_) and not value.shape:
+            value = value.item()
             if not isinstance(value, str):
                 # python 3 - was scalar numpy array of bytes
                 # otherwise python 2 - scalar numpy array of 'str'
                 value = value.decode()
         return value
 
-    def scale_swath_data(self, data, scaling_factors):
+    def scale_swath_data(self, data, scaling_factors, out=None, mask=None):
+        """Scale each granule of `data` by its ``m * x + b`` scaling factors.
+
+        :param data: Unscaled (on-disk) data
+        :param scaling_factors: Flat sequence of (m, b) pairs, one pair per granule
+        :param out: Optional output array to write the scaled data to, `data` is scaled in place if not provided
+        :param mask: Optional boolean mask to update with the granules that have invalid scaling factors
+        :returns: Scaled data array and a boolean mask of the granules with invalid scaling factors
+        """
+        if out is None:
+            out = data
+        elif out is not data:
+            out[:] = data
         num_grans = int(len(scaling_factors) / 2)
         gran_size = int(data.shape[0] / num_grans)
-        scaling_mask = numpy.zeros(data.shape)
+        scaling_mask = numpy.zeros(data.shape, dtype=numpy.bool_) if mask is None else mask
         for i in range(num_grans):
             start_idx = i * gran_size
             end_idx = start_idx + gran_size
             m = scaling_factors[i*2]
             b = scaling_factors[i*2 + 1]
             if m <= -999 or b <= -999:
-                scaling_mask[start_idx:end_idx] = 1
+                scaling_mask[start_idx:end_idx] = True
             else:
-                data[start_idx:end_idx] = m * data[start_idx:end_idx] + b
+                gran_data = out[start_idx:end_idx]
+                gran_data *= m
+                gran_data += b
 
-        scaling_mask = scaling_mask.astype(numpy.bool)
-        return data, scaling_mask
+        return out, scaling_mask
 
-    def get_swath_data(self, item, dtype=numpy.float32, fill=numpy.nan):
+    def get_swath_data(self, item, dtype=numpy.float32, fill=numpy.nan, out=None):
         """Retrieve the item asked for then set it to the specified data type, scale it, and mask it.
+
+        Masks are computed from the unscaled on-disk data before it is converted to `dtype`. The converted data is
+        scaled and filled in place so the only full-size temporaries are the raw data and the boolean mask.
+
+        :param out: Optional array (or slice of a larger array) of type `dtype` to write the result to
         """
         var_info = self.file_type_info.get(item)
-        data = self[var_info.var_path].value.astype(dtype)
+        raw_data = self[var_info.var_path][:]
+        if out is None:
+            out = numpy.empty(raw_data.shape, dtype=dtype)
+        out[:] = raw_data
 
         # Get the scaling factors
         scaling_factors = None
@@ -193,7 +252,14 @@ class VIIRSSDRReader(BaseFileReader):
         except KeyError:
             LOG.debug("No scaling factors for %s", item)
 
-        mask = numpy.zeros(data.shape, dtype=numpy.bool)
+        # Get the mask for the data (based on unscaled data)
+        if scaling_factors is not None and var_info.scaling_mask_func is not None:
+            mask = var_info.scaling_mask_func(raw_data)
+        elif scaling_factors is None and var_info.nonscaling_mask_func is not None:
+            mask = var_info.nonscaling_mask_func(raw_data)
+        else:
+            mask = numpy.zeros(raw_data.shape, dtype=numpy.bool_)
+        del raw_data
 
         # Filter with quality flags
         if var_info.qflag1 is not None:
@@ -201,20 +267,13 @@ class VIIRSSDRReader(BaseFileReader):
             if var_info.qflag1_mask is not None:
                 mask |= (qflag_data & var_info.qflag1_mask) != var_info.qflag1_eq
 
-        # Get the mask for the data (based on unscaled data)
-        if scaling_factors is not None and var_info.scaling_mask_func is not None:
-            mask |= var_info.scaling_mask_func(data)
-        elif scaling_factors is None and var_info.nonscaling_mask_func is not None:
-            mask |= var_info.nonscaling_mask_func(data)
-
         # Scale the data
         if scaling_factors is not None:
-            data, scaling_mask = self.scale_swath_data(data, scaling_factors)
-            mask |= scaling_mask
+            self.scale_swath_data(out, scaling_factors, mask=mask)
 
-        data[mask] = fill
+        numpy.putmask(out, mask, fill)
 
-        return data
+        return out
 
 
 class VIIRSSDRMultiReader(BaseMultiFileReader):
@@ -227,32 +286,32 @@ class VIIRSSDRMultiReader(BaseMultiFileReader):
         """
         super(VIIRSSDRMultiReader, self).__init__(file_type_info, VIIRSSDRReader)
 
+    def get_swath_data(self, item, dtype=numpy.float32, fill=numpy.nan):
+        """Get the scaled and masked data for `item` from every file as one array.
+
+        Each file is decoded directly in to its rows of the output array.
+        """
+        var_path = self.file_type_info.get(item).var_path
+        num_rows = [fr[var_path].shape[0] for fr in self.file_readers]
+        out = numpy.empty((sum(num_rows),) + self.file_readers[0][var_path].shape[1:], dtype=dtype)
+        start_idx = 0
+        for fr, rows in zip(self.file_readers, num_rows):
+            fr.get_swath_data(item, dtype=dtype, fill=fill, out=out[start_idx:start_idx + rows])
+            start_idx += rows
+        return out
+
     def get_orbit_rows(self, data_key):
         """List of number of rows for each orbit being processed.
 
-        In the common case the returned list will only have one element. In the future, this shouldn't be needed
-        because multiple orbits should be processed as separate scenes.
+        In the common case the returned list will only have one element. Multiple orbits can be processed as
+        separate scenes by splitting the input files with `orbit_file_groups`.
         """
         if hasattr(self, "_orbit_scans"):
             return self._orbit_scans
 
-        orbit_rows = []
-        begin_times = [fr.begin_time for fr in self.file_readers]
-        end_times = [fr.end_time for fr in self.file_readers]
         num_rows = [fr[data_key].shape[0] for fr in self.file_readers]
-        prev_end = end_times[0]
-        current_num_rows = num_rows[0]
-        for idx in range(1, len(begin_times)):
-            if begin_times[idx] - prev_end > ORBIT_TRANSITION_THRESHOLD:
-                orbit_rows.append(current_num_rows)
-                current_num_rows = 0
-            current_num_rows += num_rows[idx]
-            prev_end = end_times[idx]
-        else:
-            # on the last file
-            orbit_rows.append(current_num_rows)
-
-        return orbit_rows
+        return [sum(num_rows[idx] for idx in group)
+                for group in self.orbit_file_groups(ORBIT_TRANSITION_THRESHOLD)]
 
     def __getitem__(self, item):
         val = super(VIIRSSDRMultiReader, self).__getitem__(item)
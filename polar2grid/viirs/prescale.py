@@ -46,6 +46,7 @@ __docformat__ = "restructuredtext en"
 
 import logging
 import numpy
+from scipy.special import erf
 from polar2grid.core.histogram import local_histogram_equalization, histogram_equalization
 
 # from mpl_toolkits.basemap import maskoceans
@@ -154,7 +155,8 @@ def _calculate_average_moon_illumination (moonIlluminatonFraction,
 
 
 def adaptive_dnb_scale(img, fillValue=-999.0, solarZenithAngle=None, lunarZenithAngle=None,
-                       moonIllumFraction=None, highAngleCutoff=None, lowAngleCutoff=None, waterMask=None, out=None):
+                       moonIllumFraction=None, highAngleCutoff=None, lowAngleCutoff=None, waterMask=None, out=None,
+                       num_workers=1):
     """This scaling method uses histogram equalization to flatten the image
     levels across the day and night regions.
 
@@ -169,6 +171,8 @@ def adaptive_dnb_scale(img, fillValue=-999.0, solarZenithAngle=None, lunarZenith
 
     FIXME: The below shouldn't need to be true
     If `out` is provided it must be a writable copy of the original DNB data.
+
+    `num_workers` is the number of threads used for each adaptive histogram equalization.
     """
     if img is out:
         LOG.error("Out array can not be the same as the input array")
@@ -189,14 +193,16 @@ def adaptive_dnb_scale(img, fillValue=-999.0, solarZenithAngle=None, lunarZenith
     if day_mask is not None and day_mask.any():
         LOG.debug("  scaling DNB in day mask")
         if has_multi_times:
-            local_histogram_equalization(img, day_mask, valid_data_mask=good_mask, local_radius_px=400, out=out)
+            local_histogram_equalization(img, day_mask, valid_data_mask=good_mask, local_radius_px=400, out=out,
+                                         num_workers=num_workers)
         else:
             histogram_equalization(img, day_mask, out=out)
 
     if mixed_mask is not None and len(mixed_mask) > 0:
         LOG.debug("  scaling DNB in twilight mask")
         for mask in mixed_mask:
-            local_histogram_equalization(img, mask, valid_data_mask=good_mask, local_radius_px=100, out=out)
+            local_histogram_equalization(img, mask, valid_data_mask=good_mask, local_radius_px=100, out=out,
+                                         num_workers=num_workers)
 
     if night_mask is not None and night_mask.any():
         LOG.debug("  scaling DNB in night mask")
@@ -278,3 +284,110 @@ def dnb_scale(img, fillValue=-999.0, solarZenithAngle=None,
     
     return out
 
+
+
+def _dynamic_dnb_curves(solarZenithAngle, lunarZenithAngle, moon_factor1):
+    """Calculate the minimum and maximum radiance curves (as float32) used by `dynamic_dnb_scale`.
+    """
+    erf_portion = solarZenithAngle.astype(numpy.float32)
+    erf_portion -= 95.0
+    erf_portion *= 1.0 / (5.0 * numpy.sqrt(2.0))
+    erf(erf_portion, out=erf_portion)
+    erf_portion += 1.0
+    moon_factor2 = lunarZenithAngle.astype(numpy.float32)
+    moon_factor2 *= 0.0022
+
+    # max_val = 10 ** (-1.7 - (2.65 + moon_factor1 + moon_factor2) * erf_portion)
+    max_val = moon_factor2 + (2.65 + moon_factor1)
+    max_val *= erf_portion
+    numpy.subtract(-1.7, max_val, out=max_val)
+    numpy.power(10.0, max_val, out=max_val)
+    # min_val = 10 ** (-4.0 - (2.95 + moon_factor2) * erf_portion)
+    min_val = moon_factor2
+    min_val += 2.95
+    min_val *= erf_portion
+    numpy.subtract(-4.0, min_val, out=min_val)
+    numpy.power(10.0, min_val, out=min_val)
+    return min_val, max_val
+
+
+def _dynamic_dnb_saturation_scale(ratio, total_size, max_saturation=0.005, step=1.1):
+    """Find the factor to increase the maximum radiance curve by so at most `max_saturation` of the pixels are saturated.
+
+    This gives the same answer as multiplying the curve by `step` until the saturated fraction is small enough, but
+    only needs one partial sort of `ratio` (radiance divided by the maximum radiance curve) instead of a full scan of
+    the data for every step.
+    """
+    valid_ratio = ratio[~numpy.isnan(ratio)]
+    max_saturated = int(max_saturation * total_size)
+    if valid_ratio.size <= max_saturated:
+        return 1.0
+    kth = valid_ratio.size - max_saturated - 1
+    threshold = numpy.partition(valid_ratio, kth)[kth]
+    num_steps = 0
+    while step ** num_steps < threshold:
+        num_steps += 1
+    return step ** num_steps
+
+
+def dynamic_dnb_scale(img, solarZenithAngle, lunarZenithAngle, moonIllumFraction, saturation_correction=False,
+                      out=None, chunk_rows=512):
+    """Scale DNB radiances between minimum and maximum radiance curves that
+    depend on the solar zenith angle, lunar zenith angle, and moon
+    illumination (method from Steve Miller and Curtis Seaman).
+
+    If `saturation_correction` is True the maximum radiance curve is
+    increased by 10% steps until less than 0.5% of the pixels are saturated.
+
+    The data is processed `chunk_rows` rows at a time as float32 to limit
+    the size of the temporary arrays.
+    """
+    ### From Steve Miller and Curtis Seaman
+    # maxval = 10.^(-1.7 - (((2.65+moon_factor1+moon_factor2))*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
+    # minval = 10.^(-4. - ((2.95+moon_factor2)*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
+    # scaled_radiance = (radiance - minval) / (maxval - minval)
+    # radiance = sqrt(scaled_radiance)
+
+    ### Update to method from Curtis Seaman
+    # maxval = 10.^(-1.7 - (((2.65+moon_factor1+moon_factor2))*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
+    # minval = 10.^(-4. - ((2.95+moon_factor2)*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
+    # saturated_pixels = where(radiance gt maxval, nsatpx)
+    # saturation_pct = float(nsatpx)/float(n_elements(radiance))
+    # print, 'Saturation (%) = ', saturation_pct
+    #
+    # while saturation_pct gt 0.005 do begin
+    #   maxval = maxval*1.1
+    #   saturated_pixels = where(radiance gt maxval, nsatpx)
+    #   saturation_pct = float(nsatpx)/float(n_elements(radiance))
+    #   print, saturation_pct
+    # endwhile
+    #
+    # scaled_radiance = (radiance - minval) / (maxval - minval)
+    # radiance = sqrt(scaled_radiance)
+    if out is None:
+        out = numpy.empty(img.shape, dtype=numpy.float32)
+    moon_factor1 = 0.7 * (1.0 - moonIllumFraction)
+    row_slices = [slice(start_row, start_row + chunk_rows) for start_row in range(0, img.shape[0], chunk_rows)]
+
+    max_scale = 1.0
+    if saturation_correction:
+        ratio = numpy.empty(img.shape, dtype=numpy.float32)
+        for row_slice in row_slices:
+            _, max_val = _dynamic_dnb_curves(solarZenithAngle[row_slice], lunarZenithAngle[row_slice], moon_factor1)
+            numpy.divide(img[row_slice], max_val, out=ratio[row_slice])
+        max_scale = _dynamic_dnb_saturation_scale(ratio, img.size)
+        del ratio
+        LOG.debug("Dynamic DNB maximum radiance curve increased by a factor of %f for saturation", max_scale)
+
+    for row_slice in row_slices:
+        min_val, max_val = _dynamic_dnb_curves(solarZenithAngle[row_slice], lunarZenithAngle[row_slice], moon_factor1)
+        if max_scale != 1.0:
+            max_val *= max_scale
+        inner_sqrt = img[row_slice] - min_val
+        max_val -= min_val
+        inner_sqrt /= max_val
+        # clip negative values to 0 before the sqrt
+        inner_sqrt[inner_sqrt < 0] = 0
+        numpy.sqrt(inner_sqrt, out=out[row_slice])
+
+    return out
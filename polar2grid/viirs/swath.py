@@ -204,14 +204,18 @@ import sys
 import logging
 import numpy
 import os
-from scipy.special import erf
+from collections import OrderedDict
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from queue import Queue
+from threading import Lock
 
 from polar2grid.core import containers, histogram, roles
 from polar2grid.core.frontend_utils import ProductDict, GeoPairDict
 from . import guidebook
 # FIXME: Actually use the Geo Readers
-from .io import VIIRSSDRMultiReader, HDF5Reader
-from .prescale import adaptive_dnb_scale, dnb_scale
+from .io import VIIRSSDRMultiReader, HDF5Reader, ORBIT_TRANSITION_THRESHOLD
+from .prescale import adaptive_dnb_scale, dnb_scale, dynamic_dnb_scale
 
 LOG = logging.getLogger(__name__)
 
@@ -487,7 +491,7 @@ class Frontend(roles.FrontendRole):
     GEO_PAIRS = GEO_PAIRS
 
     def __init__(self, use_terrain_corrected=True, day_fraction=0.10, night_fraction=0.10, sza_threshold=100,
-                 dnb_saturation_correction=False, **kwargs):
+                 dnb_saturation_correction=False, histogram_workers=1, read_workers=1, secondary_workers=1, **kwargs):
         """Initialize the frontend.
 
         For each search path, check if it exists and that it is
@@ -500,6 +504,9 @@ class Frontend(roles.FrontendRole):
 
         :param search_paths: A list of paths to search for usable files
         :param use_terrain_corrected: Look for terrain-corrected files instead of non-TC files (default True)
+        :param histogram_workers: Number of threads to use for adaptive histogram equalization (default 1)
+        :param read_workers: Number of threads to use for reading granules ahead of writing them (default 1)
+        :param secondary_workers: Number of threads to use for creating independent secondary products (default 1)
         """
         self.use_terrain_corrected = use_terrain_corrected
         LOG.debug("Day fraction set to %f", day_fraction)
@@ -509,6 +516,9 @@ class Frontend(roles.FrontendRole):
         LOG.debug("SZA threshold set to %f", sza_threshold)
         self.sza_threshold = sza_threshold
         self.dnb_saturation_correction = dnb_saturation_correction
+        self.histogram_workers = histogram_workers
+        self.read_workers = read_workers
+        self.secondary_workers = secondary_workers
         super(Frontend, self).__init__(**kwargs)
 
         # Load and sort all files
@@ -536,18 +546,28 @@ class Frontend(roles.FrontendRole):
     def _load_files(self, file_paths):
         """Sort files by 'file type' and create objects to help load the data later.
 
+        Files whose names start with a known prefix (see `guidebook.FILE_PREFIXES`) are identified by name and are not
+        opened until data is needed from that file type. Any other files are opened to find their file type.
+
         This method should not be called by the user.
         """
         self.file_readers = {}
-        for file_type, file_type_info in guidebook.FILE_TYPES.items():
-            cls = file_type_info.get("file_type_class", self.DEFAULT_FILE_READER)
-            self.file_readers[file_type] = cls(file_type_info)
+        self._file_paths = {}
+        self._file_begin_times = None
+        self._file_reader_lock = Lock()
         # Don't modify the passed list (we use in place operations)
         file_paths_left = []
         for fp in file_paths:
+            file_prefix = os.path.basename(fp).split("_", 1)[0]
+            if file_prefix in guidebook.FILE_PREFIXES:
+                self._file_paths.setdefault(guidebook.FILE_PREFIXES[file_prefix], []).append(fp)
+                continue
+
             h = HDF5Reader(fp)
             for data_path, file_type in guidebook.DATA_PATHS.items():
                 if data_path in h:
+                    if file_type not in self.file_readers:
+                        self.file_readers[file_type] = self._create_file_reader(file_type)
                     self.file_readers[file_type].add_file(h)
                     break
             else:
@@ -557,31 +577,109 @@ class Frontend(roles.FrontendRole):
         for fp in file_paths_left:
             LOG.debug("Unrecognized file: %s", fp)
 
-        # Get rid of the readers we aren't using
-        for file_type, file_reader in list(self.file_readers.items()):
-            if not len(file_reader):
-                del self.file_readers[file_type]
-            else:
-                self.file_readers[file_type].finalize_files()
-
-        if not self.file_readers:
+        if not self.available_file_types:
             LOG.error("No useable files loaded")
             raise ValueError("No useable files loaded")
 
-        first_length = len(self.file_readers[next(iter(self.file_readers))])
-        if not all(len(x) == first_length for x in self.file_readers.values()):
+        num_files = dict((ft, len(fr)) for ft, fr in self.file_readers.items())
+        for file_type, fps in self._file_paths.items():
+            num_files[file_type] = num_files.get(file_type, 0) + len(fps)
+        first_length = num_files[next(iter(num_files))]
+        if not all(x == first_length for x in num_files.values()):
             LOG.error("Corrupt directory: Varying number of files for each type")
-            ft_str = "\n\t".join("%s: %d" % (ft, len(fr)) for ft, fr in self.file_readers.items())
+            ft_str = "\n\t".join("%s: %d" % (ft, num) for ft, num in num_files.items())
             LOG.debug("File types and number of files:\n\t%s", ft_str)
             raise RuntimeError("Corrupt directory: Varying number of files for each type")
 
+        # Files that had to be opened are ready to use
+        for file_type in list(self.file_readers.keys()):
+            if file_type not in self._file_paths:
+                self.file_readers[file_type].finalize_files()
+
+    def _create_file_reader(self, file_type):
+        file_type_info = guidebook.FILE_TYPES[file_type]
+        cls = file_type_info.get("file_type_class", self.DEFAULT_FILE_READER)
+        return cls(file_type_info)
+
+    @property
+    def available_file_types(self):
+        return set(self.file_readers.keys()) | set(self._file_paths.keys())
+
+    def get_file_reader(self, file_type):
+        """Get the file reader for `file_type`, opening its files if they haven't been opened yet.
+        """
+        with self._file_reader_lock:
+            if file_type in self._file_paths:
+                LOG.debug("Opening files for file type '%s'", file_type)
+                if file_type in self.file_readers:
+                    file_reader = self.file_readers[file_type]
+                else:
+                    file_reader = self._create_file_reader(file_type)
+                file_reader.add_files(HDF5Reader(fp) for fp in self._file_paths[file_type])
+                file_reader.finalize_files()
+                if self._file_begin_times is not None:
+                    file_reader.subset_files_by_begin_time(self._file_begin_times)
+                self.file_readers[file_type] = file_reader
+                del self._file_paths[file_type]
+            return self.file_readers[file_type]
+
+    def subset_files_to_ll_bbox(self, ll_bbox, geo_pair_names):
+        """Only use the granules (files) whose geolocation is inside a longitude/latitude bounding box.
+
+        Only a coarse subsample of each geolocation file is read to decide which granules to keep. File types that
+        haven't been opened yet are subset when they are opened.
+
+        :param ll_bbox: (lon_min, lat_min, lon_max, lat_max) in degrees
+        :param geo_pair_names: Geolocation pairs to check, a granule is kept if any of them are in the bounding box
+        """
+        index = 0 if self.use_terrain_corrected else 1
+        keep_times = set()
+        num_granules = 0
+        for geo_pair_name in geo_pair_names:
+            lon_product_def = self.PRODUCTS[self.GEO_PAIRS[geo_pair_name].lon_product]
+            lat_product_def = self.PRODUCTS[self.GEO_PAIRS[geo_pair_name].lat_product]
+            geo_file_reader = self.get_file_reader(lon_product_def.get_file_type(index=index))
+            keep_times |= geo_file_reader.begin_times_in_ll_bbox(lon_product_def.get_file_key(index=index),
+                                                                 lat_product_def.get_file_key(index=index), ll_bbox)
+            num_granules = max(num_granules, len(geo_file_reader.file_readers))
+
+        if not keep_times:
+            LOG.error("No data files are within the longitude/latitude bounding box: %r", ll_bbox)
+            raise ValueError("No data files are within the longitude/latitude bounding box: %r" % (ll_bbox,))
+        LOG.info("Using %d out of %d granules within the longitude/latitude bounding box",
+                 len(keep_times), num_granules)
+        with self._file_reader_lock:
+            for file_reader in self.file_readers.values():
+                file_reader.subset_files_by_begin_time(keep_times)
+            self._file_begin_times = keep_times
+
+    def orbit_search_paths(self):
+        """Split the input files in to one list of files for each orbit.
+
+        Files are grouped by the time gaps between granules of the first file type. Every file type has the same
+        number of granules so the same groups are used for all of them.
+        """
+        file_reader = self._first_file_reader()
+        orbit_groups = file_reader.orbit_file_groups(ORBIT_TRANSITION_THRESHOLD)
+        if len(orbit_groups) <= 1:
+            return [self.search_paths]
+
+        LOG.info("Splitting input files in to %d orbits", len(orbit_groups))
+        all_filepaths = [self.get_file_reader(file_type).filepaths for file_type in sorted(self.available_file_types)]
+        return [[filepaths[idx] for filepaths in all_filepaths for idx in group] for group in orbit_groups]
+
+    def _first_file_reader(self):
+        # prefer a file type that has already been opened
+        file_type = next(iter(self.file_readers), None) or next(iter(self._file_paths))
+        return self.get_file_reader(file_type)
+
     @property
     def begin_time(self):
-        return self.file_readers[next(iter(self.file_readers))].begin_time
+        return self._first_file_reader().begin_time
 
     @property
     def end_time(self):
-        return self.file_readers[next(iter(self.file_readers))].end_time
+        return self._first_file_reader().end_time
 
     @property
     def available_product_names(self):
@@ -626,10 +724,10 @@ class Frontend(roles.FrontendRole):
         product_def = self.PRODUCTS[lon_product["product_name"]]
         index = 0 if self.use_terrain_corrected else 1
         file_type = product_def.get_file_type(index=index)
-        lon_file_reader = self.file_readers[file_type]
+        lon_file_reader = self.get_file_reader(file_type)
         product_def = self.PRODUCTS[lat_product["product_name"]]
         file_type = product_def.get_file_type(index=index)
-        lat_file_reader = self.file_readers[file_type]
+        lat_file_reader = self.get_file_reader(file_type)
 
         # sanity check
         for k in ["data_type", "swath_rows", "swath_columns", "rows_per_scan", "fill_value"]:
@@ -667,10 +765,10 @@ class Frontend(roles.FrontendRole):
         index = 0 if self.use_terrain_corrected else 1
         file_type = product_def.get_file_type(index=index)
         file_key = product_def.get_file_key(index=index)
-        if file_type not in self.file_readers:
+        if file_type not in self.available_file_types:
             LOG.error("Could not create product '%s' because some data files are missing" % (product_name,))
             raise RuntimeError("Could not create product '%s' because some data files are missing" % (product_name,))
-        file_reader = self.file_readers[file_type]
+        file_reader = self.get_file_reader(file_type)
         LOG.debug("Using file type '%s' and getting file key '%s' for product '%s'", file_type, file_key, product_name)
 
         LOG.debug("Writing product '%s' data to binary file", product_name)
@@ -684,7 +782,7 @@ class Frontend(roles.FrontendRole):
 
         try:
             # TODO: Do something with data type
-            shape = file_reader.write_var_to_flat_binary(file_key, filename)
+            shape = file_reader.write_var_to_flat_binary(file_key, filename, num_workers=self.read_workers)
             rows_per_scan = self.GEO_PAIRS[product_def.geo_pair_name].rows_per_scan
         except (RuntimeError, ValueError, KeyError, OSError):
             LOG.error("Could not extract data from file. Use '--no-tc' flag if terrain-corrected data is not available")
@@ -732,10 +830,15 @@ class Frontend(roles.FrontendRole):
         if product_def.is_raw:
             # First element is terrain corrected, second element is non-TC
             file_type = product_def.get_file_type(index=0 if self.use_terrain_corrected else 1)
-            return file_type in self.file_readers
+            return file_type in self.available_file_types
         return False
 
-    def create_scene(self, products=None, **kwargs):
+    def create_scene(self, products=None, ll_bbox=None, **kwargs):
+        """Create a `SwathScene` object with the specified products in it.
+
+        :param products: List of product names to create (default products if not provided)
+        :param ll_bbox: Only extract granules inside this (lon_min, lat_min, lon_max, lat_max) bounding box
+        """
         LOG.debug("Loading scene data...")
         # If the user didn't provide the products they want, figure out which ones we can create
         if products is None:
@@ -748,6 +851,8 @@ class Frontend(roles.FrontendRole):
         # Needs to be ordered (least-depended product -> most-depended product)
         products_needed = self.PRODUCTS.dependency_ordered_products(products)
         geo_pairs_needed = self.PRODUCTS.geo_pairs_for_products(products_needed)
+        if ll_bbox is not None:
+            self.subset_files_to_ll_bbox(ll_bbox, geo_pairs_needed)
         # both lists below include raw products that need extra processing/masking
         raw_products_needed = (p for p in products_needed if self.PRODUCTS.is_raw(p, geo_is_raw=False))
         secondary_products_needed = [p for p in products_needed if self.PRODUCTS.needs_processing(p)]
@@ -803,6 +908,11 @@ class Frontend(roles.FrontendRole):
                 scene[product_name] = one_swath
 
         # Dependent products and Special cases (i.e. non-raw products that need further processing)
+        if self.secondary_workers > 1:
+            self._create_secondary_products_parallel(secondary_products_needed, products, scene, products_created,
+                                                     swath_definitions)
+            return scene
+
         for product_name in reversed(secondary_products_needed):
             product_func = self.secondary_product_functions[product_name]
             swath_def = swath_definitions[self.PRODUCTS[product_name].geo_pair_name]
@@ -817,19 +927,82 @@ class Frontend(roles.FrontendRole):
                     raise
                 continue
 
-            if one_swath is None:
-                LOG.debug("Secondary product function did not produce a swath product")
-                if product_name in scene:
-                    LOG.debug("Removing original swath that was created before")
-                    del scene[product_name]
-                continue
-            products_created[product_name] = one_swath
-            if product_name in products:
-                # the user wants this product
-                scene[product_name] = one_swath
+            self._add_secondary_product(product_name, one_swath, products, scene, products_created)
 
         return scene
 
+    def _add_secondary_product(self, product_name, one_swath, products, scene, products_created):
+        if one_swath is None:
+            LOG.debug("Secondary product function did not produce a swath product")
+            if product_name in scene:
+                LOG.debug("Removing original swath that was created before")
+                del scene[product_name]
+            return
+        products_created[product_name] = one_swath
+        if product_name in products:
+            # the user wants this product
+            scene[product_name] = one_swath
+
+    def _create_secondary_products_parallel(self, secondary_products_needed, products, scene, products_created,
+                                            swath_definitions):
+        """Create secondary products in a thread pool of `secondary_workers` threads.
+
+        A secondary product is started once every secondary product it depends on has finished. Results are handled
+        in this thread in the order they finish.
+        """
+        secondary_products = set(secondary_products_needed)
+        waiting = OrderedDict()
+        for product_name in reversed(secondary_products_needed):
+            deps = set(self.PRODUCTS.get_product_dependencies(product_name))
+            waiting[product_name] = (deps & secondary_products) - {product_name}
+
+        finished = Queue()
+        num_running = 0
+        pool = ThreadPool(self.secondary_workers)
+        try:
+            while waiting or num_running:
+                for product_name, deps in list(waiting.items()):
+                    if num_running >= self.secondary_workers:
+                        break
+                    if deps:
+                        continue
+                    del waiting[product_name]
+                    product_func = self.secondary_product_functions[product_name]
+                    swath_def = swath_definitions[self.PRODUCTS[product_name].geo_pair_name]
+                    LOG.info("Creating secondary product '%s'", product_name)
+                    pool.apply_async(product_func, (product_name, swath_def, products_created),
+                                     callback=partial(self._put_result, finished, product_name),
+                                     error_callback=partial(self._put_error, finished, product_name))
+                    num_running += 1
+
+                product_name, one_swath, exc = finished.get()
+                num_running -= 1
+                for deps in waiting.values():
+                    deps.discard(product_name)
+
+                if exc is not None:
+                    if not isinstance(exc, (RuntimeError, ValueError, KeyError, OSError)):
+                        raise exc
+                    LOG.error("Could not create product (unexpected error): '%s'", product_name)
+                    LOG.debug("Could not create product (unexpected error): '%s'", product_name,
+                              exc_info=(type(exc), exc, exc.__traceback__))
+                    if self.exit_on_error:
+                        raise exc
+                    continue
+
+                self._add_secondary_product(product_name, one_swath, products, scene, products_created)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def _put_result(result_queue, product_name, one_swath):
+        result_queue.put((product_name, one_swath, None))
+
+    @staticmethod
+    def _put_error(result_queue, product_name, exc):
+        result_queue.put((product_name, None, exc))
+
     ### Secondary Product Functions
     def create_histogram_dnb(self, product_name, swath_definition, products_created, fill=numpy.nan):
         product_def = self.PRODUCTS[product_name]
@@ -877,7 +1050,7 @@ class Frontend(roles.FrontendRole):
         lon_product_name = self.GEO_PAIRS[product_def.geo_pair_name].lon_product
         index = 0 if self.use_terrain_corrected else 1
         file_type = self.PRODUCTS[lon_product_name].get_file_type(index=index)
-        geo_file_reader = self.file_readers[file_type]
+        geo_file_reader = self.get_file_reader(file_type)
         moon_illum_fraction = sum(geo_file_reader[guidebook.K_MOONILLUM]) / (100.0 * len(geo_file_reader))
         dnb_product = products_created[dnb_product_name]
         dnb_data = dnb_product.get_data_array()
@@ -894,7 +1067,8 @@ class Frontend(roles.FrontendRole):
         try:
             output_data = dnb_product.copy_array(filename=filename, read_only=False)
             adaptive_dnb_scale(dnb_data, solarZenithAngle=sza_data, lunarZenithAngle=lza_data,
-                               moonIllumFraction=moon_illum_fraction, fillValue=fill, out=output_data)
+                               moonIllumFraction=moon_illum_fraction, fillValue=fill, out=output_data,
+                               num_workers=self.histogram_workers)
 
             one_swath = self.create_secondary_swath_object(product_name, swath_definition, filename,
                                                            dnb_product["data_type"], products_created)
@@ -926,7 +1100,8 @@ class Frontend(roles.FrontendRole):
 
         try:
             output_data = bt_product.copy_array(filename=filename, read_only=False)
-            histogram.local_histogram_equalization(bt_data, ~bt_mask, do_log_scale=False, out=output_data)
+            histogram.local_histogram_equalization(bt_data, ~bt_mask, do_log_scale=False, out=output_data,
+                                                   num_workers=self.histogram_workers)
 
             one_swath = self.create_secondary_swath_object(product_name, swath_definition, filename,
                                                            bt_product["data_type"], products_created)
@@ -998,7 +1173,7 @@ class Frontend(roles.FrontendRole):
         lon_product_name = self.GEO_PAIRS[product_def.geo_pair_name].lon_product
         index = 0 if self.use_terrain_corrected else 1
         file_type = self.PRODUCTS[lon_product_name].get_file_type(index=index)
-        geo_file_reader = self.file_readers[file_type]
+        geo_file_reader = self.get_file_reader(file_type)
         # convert to decimal instead of %
         moon_illum_fraction = numpy.mean(geo_file_reader[guidebook.K_MOONILLUM]) * 0.01
         dnb_product = products_created[dnb_product_name]
@@ -1016,48 +1191,8 @@ class Frontend(roles.FrontendRole):
         try:
             output_data = dnb_product.copy_array(filename=filename, read_only=False)
 
-            ### From Steve Miller and Curtis Seaman
-            # maxval = 10.^(-1.7 - (((2.65+moon_factor1+moon_factor2))*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
-            # minval = 10.^(-4. - ((2.95+moon_factor2)*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
-            # scaled_radiance = (radiance - minval) / (maxval - minval)
-            # radiance = sqrt(scaled_radiance)
-
-            ### Update to method from Curtis Seaman
-            # maxval = 10.^(-1.7 - (((2.65+moon_factor1+moon_factor2))*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
-            # minval = 10.^(-4. - ((2.95+moon_factor2)*(1+erf((solar_zenith-95.)/(5.*sqrt(2.0))))))
-            # saturated_pixels = where(radiance gt maxval, nsatpx)
-            # saturation_pct = float(nsatpx)/float(n_elements(radiance))
-            # print, 'Saturation (%) = ', saturation_pct
-            #
-            # while saturation_pct gt 0.005 do begin
-            #   maxval = maxval*1.1
-            #   saturated_pixels = where(radiance gt maxval, nsatpx)
-            #   saturation_pct = float(nsatpx)/float(n_elements(radiance))
-            #   print, saturation_pct
-            # endwhile
-            #
-            # scaled_radiance = (radiance - minval) / (maxval - minval)
-            # radiance = sqrt(scaled_radiance)
-
-            moon_factor1 = 0.7 * (1.0 - moon_illum_fraction)
-            moon_factor2 = 0.0022 * lza_data
-            erf_portion = 1 + erf((sza_data - 95.0) / (5.0 * numpy.sqrt(2.0)))
-            max_val = numpy.power(10, -1.7 - (2.65 + moon_factor1 + moon_factor2) * erf_portion)
-            min_val = numpy.power(10, -4.0 - (2.95 + moon_factor2) * erf_portion)
-
-            # Update from Curtis Seaman, increase max radiance curve until less than 0.5% is saturated
-            if self.dnb_saturation_correction:
-                saturation_pct = float(numpy.count_nonzero(dnb_data > max_val)) / dnb_data.size
-                LOG.debug("Dynamic DNB saturation percentage: %f", saturation_pct)
-                while saturation_pct > 0.005:
-                    max_val *= 1.1
-                    saturation_pct = float(numpy.count_nonzero(dnb_data > max_val)) / dnb_data.size
-                    LOG.debug("Dynamic DNB saturation percentage: %f", saturation_pct)
-
-            inner_sqrt = (dnb_data - min_val) / (max_val - min_val)
-            # clip negative values to 0 before the sqrt
-            inner_sqrt[inner_sqrt < 0] = 0
-            numpy.sqrt(inner_sqrt, out=output_data)
+            dynamic_dnb_scale(dnb_data, sza_data, lza_data, moon_illum_fraction,
+                              saturation_correction=self.dnb_saturation_correction, out=output_data)
 
             one_swath = self.create_secondary_swath_object(product_name, swath_definition, filename,
                                                            dnb_product["data_type"], products_created)
@@ -1081,7 +1216,7 @@ class Frontend(roles.FrontendRole):
             lon_product_name = self.GEO_PAIRS[product_def.geo_pair_name].lon_product
             index = 0 if self.use_terrain_corrected else 1
             file_type = self.PRODUCTS[lon_product_name].get_file_type(index=index)
-            geo_file_reader = self.file_readers[file_type]
+            geo_file_reader = self.get_file_reader(file_type)
             moon_illum_fraction = geo_file_reader[guidebook.K_MOONILLUM]
             dnb_product = products_created[dnb_product_name]
             dnb_data = dnb_product.get_data_array()
@@ -1133,10 +1268,11 @@ class Frontend(roles.FrontendRole):
 
     def _get_day_percentage(self, sza_swath):
         if "day_percentage" not in sza_swath:
-            sza_data = sza_swath.get_data_array()
-            invalid_mask = sza_swath.get_data_mask()
-            valid_day_mask = (sza_data < self.sza_threshold) & ~invalid_mask
-            fraction_day = numpy.count_nonzero(valid_day_mask) / (float(sza_data.size) - numpy.count_nonzero(invalid_mask))
+            # estimate from the files so the SZA data doesn't have to be loaded
+            product_def = self.PRODUCTS[sza_swath["product_name"]]
+            index = 0 if self.use_terrain_corrected else 1
+            file_reader = self.get_file_reader(product_def.get_file_type(index=index))
+            fraction_day = file_reader.get_day_fraction(product_def.get_file_key(index=index), self.sza_threshold)
             sza_swath["day_percentage"] = fraction_day * 100.0
         else:
             LOG.debug("Day percentage found in SZA swath already")
@@ -1182,11 +1318,20 @@ def add_frontend_argument_groups(parser):
                        help="Angle threshold of solar zenith angle used when deciding day or night (default 100)")
     group.add_argument("--dnb-saturation-correction", action="store_true",
                        help="Enable dynamic DNB saturation correction (normally used for aurora scenes)")
+    group.add_argument("--histogram-workers", dest="histogram_workers", type=int, default=1,
+                       help="Number of threads to use for adaptive histogram equalization products (default 1)")
+    group.add_argument("--read-workers", dest="read_workers", type=int, default=1,
+                       help="Number of threads to use for reading granules while writing swath data (default 1)")
+    group.add_argument("--secondary-workers", dest="secondary_workers", type=int, default=1,
+                       help="Number of threads to use for creating independent secondary products (default 1)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     # FIXME: Probably need some proper defaults
     group.add_argument("-p", "--products", dest="products", nargs="+", default=None, action=ExtendAction,
                        help="Specify frontend products to process")
+    group.add_argument("--ll-bbox", dest="ll_bbox", nargs=4, type=float, default=None,
+                       metavar=("lon_min", "lat_min", "lon_max", "lat_max"),
+                       help="Only extract granules with data inside this longitude/latitude bounding box")
     # group.add_argument('--no-pseudo', dest='create_pseudo', default=True, action='store_false',
     #                     help="Don't create pseudo bands")
     # group.add_argument('--adaptive-dnb', dest='products', action="append_const", const=PRODUCT_ADAPTIVE_DNB,
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test the VIIRS HDF5 reading classes.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2018 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import sys
+
+import numpy
+import pytest
+
+h5py = pytest.importorskip("h5py")
+
+
+@pytest.fixture
+def sdr_file(tmpdir):
+    fn = str(tmpdir.join("SVM05_npp_d20180101_t0000000_e0001000_b00001_c20180101000000000000_noaa_ops.h5"))
+    h = h5py.File(fn, "w")
+    h.attrs["Platform_Short_Name"] = numpy.array([[b"NPP"]])
+    ds = h.create_dataset("All_Data/VIIRS-M5-SDR_All/Radiance", data=numpy.arange(6, dtype=numpy.uint16).reshape(2, 3))
+    ds.attrs["units"] = numpy.array([b"W m-2 sr-1 um-1"])
+    refl = numpy.arange(12, dtype=numpy.uint16).reshape(4, 3)
+    refl[0, 0] = 65535
+    h.create_dataset("All_Data/VIIRS-M5-SDR_All/Reflectance", data=refl)
+    h.create_dataset("All_Data/VIIRS-M5-SDR_All/ReflectanceFactors",
+                     data=numpy.array([2.0, 1.0, -999.3, -999.3], dtype=numpy.float32))
+    aggr = h.create_dataset("Data_Products/VIIRS-M5-SDR/VIIRS-M5-SDR_Aggr", data=numpy.zeros(1))
+    for attr_name, attr_val in (("AggregateBeginningDate", b"20180101"), ("AggregateBeginningTime", b"000000.000000Z"),
+                                ("AggregateEndingDate", b"20180101"), ("AggregateEndingTime", b"000100.000000Z")):
+        aggr.attrs[attr_name] = numpy.array([[attr_val]])
+    gran = h.create_dataset("Data_Products/VIIRS-M5-SDR/VIIRS-M5-SDR_Gran_0", data=numpy.zeros(1))
+    gran.attrs["G-Ring_Latitude"] = numpy.array([[1.0], [2.0]])
+    h.close()
+    return fn
+
+
+class TestHDF5Reader(object):
+    def test_variables(self, sdr_file):
+        from polar2grid.viirs.io import HDF5Reader
+        h = HDF5Reader(sdr_file)
+        assert "All_Data/VIIRS-M5-SDR_All/Radiance" in h
+        assert "/All_Data/VIIRS-M5-SDR_All/Radiance" in h
+        assert "All_Data/VIIRS-M5-SDR_All/BrightnessTemperature" not in h
+        numpy.testing.assert_array_equal(h["All_Data/VIIRS-M5-SDR_All/Radiance"][:], numpy.arange(6).reshape(2, 3))
+        with pytest.raises(KeyError):
+            h["All_Data/VIIRS-M5-SDR_All/BrightnessTemperature"]
+
+    def test_attributes(self, sdr_file):
+        from polar2grid.viirs.io import HDF5Reader
+        h = HDF5Reader(sdr_file)
+        assert h[".Platform_Short_Name"] == b"NPP"
+        assert h["All_Data/VIIRS-M5-SDR_All/Radiance.units"][0] == b"W m-2 sr-1 um-1"
+        gring = h["Data_Products/VIIRS-M5-SDR/VIIRS-M5-SDR_Gran_0.G-Ring_Latitude"]
+        numpy.testing.assert_array_equal(gring, [[1.0], [2.0]])
+        assert ".Missing_Attribute" not in h
+        assert "All_Data/VIIRS-M5-SDR_All/Radiance.missing" not in h
+
+    def test_cache_size(self, sdr_file):
+        from polar2grid.viirs.io import HDF5Reader
+        h = HDF5Reader(sdr_file)
+        h.CACHE_SIZE = 2
+        for key in ("All_Data/a", "All_Data/b", "All_Data/c", ".Platform_Short_Name"):
+            assert key not in h or key == ".Platform_Short_Name"
+        assert len(h._item_cache) == 2
+        assert h[".Platform_Short_Name"] == b"NPP"
+
+
+class TestVIIRSSDRReader(object):
+    def test_get_swath_data(self, sdr_file):
+        from polar2grid.viirs import guidebook
+        from polar2grid.viirs.io import HDF5Reader, VIIRSSDRReader, VIIRSSDRMultiReader
+        file_type_info = guidebook.FILE_TYPES[guidebook.FILE_TYPE_M05]
+        reader = VIIRSSDRReader(HDF5Reader(sdr_file), file_type_info)
+        assert reader.satellite == "npp"
+        data = reader.get_swath_data(guidebook.K_REFLECTANCE)
+        assert data.dtype == numpy.float32
+        expected = numpy.arange(12, dtype=numpy.float32).reshape(4, 3) * 2.0 + 1.0
+        expected[0, 0] = numpy.nan
+        # second granule has invalid scaling factors
+        expected[2:] = numpy.nan
+        numpy.testing.assert_array_equal(data, expected)
+
+        out = numpy.zeros((6, 3), dtype=numpy.float32)
+        reader.get_swath_data(guidebook.K_REFLECTANCE, out=out[1:5])
+        numpy.testing.assert_array_equal(out[1:5], expected)
+        assert not numpy.any(out[[0, 5]])
+
+        multi_reader = VIIRSSDRMultiReader(file_type_info)
+        multi_reader.add_files([HDF5Reader(sdr_file), HDF5Reader(sdr_file)])
+        multi_reader.finalize_files()
+        numpy.testing.assert_array_equal(multi_reader.get_swath_data(guidebook.K_REFLECTANCE),
+                                         numpy.concatenate([expected, expected]))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
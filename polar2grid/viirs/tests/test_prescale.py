@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2018 Space Science and Engineering Center (SSEC),
+# University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Test the VIIRS prescaling functions.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2018 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import sys
+
+import numpy
+import pytest
+
+from polar2grid.viirs import prescale
+
+
+def _create_dnb_data(shape=(200, 300)):
+    rs = numpy.random.RandomState(0)
+    sza = rs.uniform(80, 140, shape).astype(numpy.float32)
+    lza = rs.uniform(0, 180, shape).astype(numpy.float32)
+    dnb = (10 ** rs.uniform(-10, -6, shape)).astype(numpy.float32)
+    dnb[rs.rand(*shape) < 0.03] = 1e-3
+    dnb[:2] = numpy.nan
+    return dnb, sza, lza
+
+
+def _simple_dynamic_dnb_scale(dnb, sza, lza, moon_illum_fraction, saturation_correction=False):
+    """Reference implementation using float64 full swath arrays."""
+    from scipy.special import erf
+    moon_factor1 = 0.7 * (1.0 - moon_illum_fraction)
+    moon_factor2 = 0.0022 * lza.astype(numpy.float64)
+    erf_portion = 1 + erf((sza.astype(numpy.float64) - 95.0) / (5.0 * numpy.sqrt(2.0)))
+    max_val = numpy.power(10, -1.7 - (2.65 + moon_factor1 + moon_factor2) * erf_portion)
+    min_val = numpy.power(10, -4.0 - (2.95 + moon_factor2) * erf_portion)
+    if saturation_correction:
+        while float(numpy.count_nonzero(dnb > max_val)) / dnb.size > 0.005:
+            max_val *= 1.1
+    inner_sqrt = (dnb - min_val) / (max_val - min_val)
+    inner_sqrt[inner_sqrt < 0] = 0
+    return numpy.sqrt(inner_sqrt)
+
+
+class TestDynamicDNB(object):
+    @pytest.mark.parametrize("saturation_correction", [False, True])
+    def test_matches_reference(self, saturation_correction):
+        dnb, sza, lza = _create_dnb_data()
+        expected = _simple_dynamic_dnb_scale(dnb, sza, lza, 0.3, saturation_correction=saturation_correction)
+        result = prescale.dynamic_dnb_scale(dnb, sza, lza, 0.3, saturation_correction=saturation_correction,
+                                            chunk_rows=64)
+        assert result.dtype == numpy.float32
+        numpy.testing.assert_array_equal(numpy.isnan(result), numpy.isnan(expected))
+        numpy.testing.assert_allclose(result, expected, rtol=1e-3, atol=1e-4)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -42,8 +42,45 @@ Documentation: http://www.ssec.wisc.edu/software/polar2grid/
 """
 __docformat__ = "restructuredtext en"
 
+
+def test_load_files_by_prefix(tmpdir):
+    """Test that files with known filename prefixes aren't opened until they are needed."""
+    from polar2grid.viirs import guidebook
+    from polar2grid.viirs.swath import Frontend, PRODUCT_M05, PRODUCT_M_LON
+    for prefix in ("SVM05", "GMTCO"):
+        # not valid HDF5 files, opening them would fail
+        tmpdir.join(prefix + "_npp_d20180101_t0000000_e0001000_b00001_c20180101000000000000_noaa_ops.h5").write("")
+    f = Frontend(search_paths=[str(tmpdir)])
+    assert f.available_file_types == {guidebook.FILE_TYPE_M05, guidebook.FILE_TYPE_GMTCO}
+    assert not f.file_readers
+    assert PRODUCT_M05 in f.available_product_names
+    assert PRODUCT_M_LON in f.available_product_names
+
+
+def test_parallel_secondary_products(tmpdir):
+    """Test that secondary products created by the thread pool are the same for any number of threads."""
+    from polar2grid.viirs.swath import Frontend, GEO_PAIRS, PRODUCT_M05, PRODUCT_IFOG, PRODUCT_ADAPTIVE_DNB
+    tmpdir.join("SVM05_npp_d20180101_t0000000_e0001000_b00001_c20180101000000000000_noaa_ops.h5").write("")
+
+    def _fake_product_func(product_name, swath_definition, products_created):
+        if product_name == PRODUCT_M05:
+            # not enough day data
+            return None
+        return product_name + "_swath"
+
+    secondary_products = [PRODUCT_M05, PRODUCT_IFOG, PRODUCT_ADAPTIVE_DNB]
+    scenes = []
+    for num_workers in (1, 3):
+        f = Frontend(search_paths=[str(tmpdir)], secondary_workers=num_workers)
+        f.secondary_product_functions = dict((p, _fake_product_func) for p in secondary_products)
+        scene = {PRODUCT_M05: "m05_raw"}
+        f._create_secondary_products_parallel(secondary_products, secondary_products, scene,
+                                              {PRODUCT_M05: "m05_raw"}, dict((gp, None) for gp in GEO_PAIRS))
+        scenes.append(scene)
+    assert scenes[0] == scenes[1] == {PRODUCT_IFOG: "ifog_swath", PRODUCT_ADAPTIVE_DNB: "adaptive_dnb_swath"}
+
+
 if __name__ == '__main__':
     import sys
     import pytest
     sys.exit(pytest.main())
-